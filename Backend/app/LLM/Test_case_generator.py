@@ -2,6 +2,7 @@ import os
 import json
 import lancedb
 import numpy as np
+import pyarrow.compute as pc
 from dotenv import load_dotenv
 from app.config import Config
 from app.models.postgress_writer import (
@@ -11,7 +12,26 @@ from app.models.postgress_writer import (
 )
 import pandas as pd
 from .impact_analyzer import analyze_test_case_impacts
+from app.datapipeline.test_case_embeddings import (
+    DUPLICATE_SIMILARITY_THRESHOLD,
+    drop_near_duplicates,
+    store_test_case_embeddings
+)
+from app.utils.rate_limiter import get_bucket
+from app.utils.lance_util import lance_literal
+from .prompt_packer import estimate_tokens
+from .json_salvage import salvage_json_array
+from app.utils.metrics import DUPLICATES_DROPPED, TEST_CASES_GENERATED, track_llm, track_stage, wait_for_quota
+from .structured_output import TEST_CASE_BATCH, validate_test_case
+from .batch_planner import BatchPlan, plan_batch_capacity, record_batch_call
+from app.models.generation_checkpoints import (
+    clear_generation_run,
+    resume_generation_run,
+    save_batch_checkpoint,
+    story_input_hash
+)
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Dict, List, Optional
 import re
@@ -24,111 +44,60 @@ LANCE_DB_PATH = Config.LANCE_DB_PATH
 TABLE_NAME = Config.TABLE_NAME_LANCE
 TOP_K = 3
 MAX_MAIN_TEXT_CHARS = 5000
-BATCH_SIZE = 10  # Increased batch size for more efficient generation
 MAX_RETRIES = 3
+# LanceDB columns the generator reads for a story
+STORY_COLUMNS = ["storyID", "project_id", "storyDescription", "doc_content_text"]
+GENERATION_CONCURRENCY = int(os.getenv("GENERATION_CONCURRENCY", "4"))  # Concurrent batch calls per story; 1 = sequential
+STORY_CONCURRENCY = int(os.getenv("STORY_CONCURRENCY", "3"))  # Stories generated at once by generate_test_cases_for_all_stories
+STORY_TIMEOUT_SECONDS = float(os.getenv("STORY_TIMEOUT_SECONDS", "900"))  # 0 disables the per-story timeout
 
 # Load prompt
 with open("Backend/app/LLM/test_case_prompt.txt", "r", encoding="utf-8") as f:
     INSTRUCTIONS = f.read()
 
-class JSONResponseHandler:
-    @staticmethod
-    def extract_json_from_text(text: str) -> str:
-        """Extract JSON from text that might contain other content"""
-        # Remove code block markers
-        text = text.replace("```json", "").replace("```", "").strip()
-        
-        # Find the first { and last }
-        start_idx = text.find("{")
-        end_idx = text.rfind("}") + 1
-        
-        if start_idx == -1 or end_idx == 0:
-            raise ValueError("No JSON object found in response")
-            
-        return text[start_idx:end_idx]
-
-    @staticmethod
-    def clean_malformed_json(json_str: str) -> str:
-        """Clean common JSON formatting issues"""
-        # Fix common formatting issues
-        json_str = re.sub(r',\s*}', '}', json_str)  # Remove trailing commas
-        json_str = re.sub(r',\s*]', ']', json_str)  # Remove trailing commas in arrays
-        
-        # Fix escaped quotes
-        json_str = json_str.replace('\\"', '"')
-        json_str = json_str.replace('""', '"')
-        
-        # Fix newlines in strings
-        json_str = re.sub(r'(?<!\\)\n', ' ', json_str)
-        
-        return json_str
+def story_rng(story_id: str) -> Optional[random.Random]:
+    """Random source of one story, seeded from PIPELINE_SEED when set, so concurrent stories stay reproducible"""
+    if Config.PIPELINE_SEED is None:
+        return None
+    return random.Random(f"{Config.PIPELINE_SEED}:{story_id}")
 
+class JSONResponseHandler:
     @staticmethod
-    def validate_test_case_structure(test_case: Dict) -> Dict:
-        """Validate and fix test case structure"""
-        required_fields = {
-            "id": str,
-            "title": str,
-            "steps": list,
-            "expected_result": str,
-            "priority": str
-        }
-        
-        # Ensure all required fields exist with correct types
-        for field, field_type in required_fields.items():
-            if field not in test_case:
-                if field == "steps":
-                    test_case[field] = ["Step 1: No steps provided"]
-                elif field == "priority":
-                    test_case[field] = "Medium"
-                else:
-                    test_case[field] = f"Missing {field}"
-            elif not isinstance(test_case[field], field_type):
-                if field == "steps" and isinstance(test_case[field], str):
-                    test_case[field] = [test_case[field]]
-                elif field_type == str:
-                    test_case[field] = str(test_case[field])
-
-        # Fix step formatting
-        test_case["steps"] = [
+    def number_steps(steps: List[str]) -> List[str]:
+        """Prefix steps with "Step N: " where the model left it out"""
+        return [
             f"Step {i+1}: {step.split(': ')[-1]}" if not step.startswith(f"Step {i+1}: ") else step
-            for i, step in enumerate(test_case["steps"])
+            for i, step in enumerate(steps)
         ]
-        
-        # Validate priority
-        if test_case["priority"] not in ["High", "Medium", "Low"]:
-            test_case["priority"] = "Medium"
-            
-        return test_case
 
     @staticmethod
-    def parse_and_validate_response(response_text: str, story_id: str, current_count: int) -> Dict:
-        """Parse and validate the complete response"""
-        try:
-            # Extract JSON
-            json_str = JSONResponseHandler.extract_json_from_text(response_text)
-            
-            # Clean JSON
-            json_str = JSONResponseHandler.clean_malformed_json(json_str)
-            
-            # Parse JSON
-            data = json.loads(json_str)
-            
-            # Validate basic structure
-            if not isinstance(data, dict) or "test_cases" not in data:
-                raise ValueError("Invalid response structure")
-                
-            # Validate and fix each test case
-            for i, tc in enumerate(data["test_cases"]):
-                # Ensure correct ID
-                tc["id"] = f"{story_id}-TC{current_count + i + 1}"
-                data["test_cases"][i] = JSONResponseHandler.validate_test_case_structure(tc)
-                
-            return data
-            
-        except json.JSONDecodeError as e:
-            print(f"JSON parsing error: {str(e)}")
-            print("Attempting to fix malformed JSON...")
+    def parse_and_validate_response(response_text: str, story_id: str, current_count: int, strict: bool = False) -> Dict:
+        """
+        Parse and validate the complete response.
+
+        Every complete test case that passes the compiled TEST_CASE_SCHEMA
+        validator is recovered, even from a truncated or partly malformed
+        response; the returned "salvage" entry reports whether the array was
+        complete and valid and how many test cases were salvaged or skipped.
+        With strict=True a response without any usable test case raises
+        instead of yielding a placeholder test case.
+        """
+        salvage = salvage_json_array(response_text, "test_cases")
+        test_cases = []
+        for tc in salvage.items:
+            errors = validate_test_case(tc)
+            if errors:
+                print(f"⚠️ Dropping test case that violates the schema: {'; '.join(errors)}")
+                salvage.skipped += 1
+                salvage.complete = False
+            else:
+                test_cases.append(tc)
+        TEST_CASE_BATCH.record(salvage.complete)
+
+        if not test_cases:
+            if strict:
+                raise ValueError("No complete test case found in response")
+            print("JSON parsing error: no complete test case found in response")
             # Create a minimal valid response
             return {
                 "test_cases": [{
@@ -137,14 +106,28 @@ class JSONResponseHandler:
                     "steps": ["Step 1: Verify basic functionality"],
                     "expected_result": "System functions as expected",
                     "priority": "Medium"
-                }]
+                }],
+                "salvage": salvage.summary()
             }
-        except Exception as e:
-            print(f"Error in response parsing: {str(e)}")
-            raise
+
+        if not salvage.complete:
+            print(f"🩹 Salvaged {len(test_cases)} test cases from an incomplete response ({salvage.skipped} malformed skipped)")
+
+        for i, tc in enumerate(test_cases):
+            # Ensure correct ID
+            tc["id"] = f"{story_id}-TC{current_count + i + 1}"
+            tc["steps"] = JSONResponseHandler.number_steps(tc["steps"])
+
+        summary = salvage.summary()
+        summary["salvaged"] = len(test_cases)
+        return {"test_cases": test_cases, "salvage": summary}
 
 class TestCaseGenerator:
-    def __init__(self):
+    def __init__(self, on_batch=None, project_id=""):
+        # Optional callback(batch_index, batch_total, parts, test_cases) run as each batch is parsed
+        self.on_batch = on_batch
+        # Project label of the metrics recorded for this story
+        self.project_id = project_id
         self.prompt_file = os.path.join(os.path.dirname(__file__), "test_case_prompt.txt")
         with open(self.prompt_file, "r") as f:
             self.base_prompt = f.read()
@@ -201,8 +184,11 @@ class TestCaseGenerator:
         else:
             return "low"
 
-    def get_category_counts(self, complexity: str) -> Dict[str, int]:
-        """Get test case counts based on story complexity"""
+    def get_category_counts(self, complexity: str, rng: Optional[random.Random] = None) -> Dict[str, int]:
+        """
+        Get test case counts based on story complexity. rng (see story_rng)
+        makes the randomization reproducible.
+        """
         base_counts = {
             "low": {
                 "positive": 8,
@@ -230,12 +216,18 @@ class TestCaseGenerator:
         # Add some randomization (±20%)
         counts = base_counts[complexity]
         return {
-            category: max(1, int(count * random.uniform(0.8, 1.2)))
+            category: max(1, int(count * (rng or random).uniform(0.8, 1.2)))
             for category, count in counts.items()
         }
 
-    def generate_test_cases(self, story_id: str, story_description: str) -> Dict:
-        """Generate test cases for a given user story"""
+    def generate_test_cases(self, story_id: str, story_description: str, max_concurrency: Optional[int] = None, checkpoint: bool = True) -> Dict:
+        """
+        Generate test cases for a given user story.
+        With max_concurrency > 1 (default GENERATION_CONCURRENCY) all category
+        batches are dispatched at once; 1 runs them sequentially. With
+        checkpoint=True every finished batch is persisted and a rerun after a
+        crash only generates the batches that are missing.
+        """
         try:
             # Initialize the final result
             final_test_cases = {
@@ -248,7 +240,7 @@ class TestCaseGenerator:
             
             # Get story complexity and determine test case counts
             complexity = self.get_story_complexity(story_description, story_description)
-            category_counts = self.get_category_counts(complexity)
+            category_counts = self.get_category_counts(complexity, story_rng(story_id))
             
             # Define test case categories with dynamic counts
             categories = [
@@ -279,27 +271,53 @@ class TestCaseGenerator:
                 }
             ]
             
-            # Generate test cases in batches for each category
-            for category in categories:
-                remaining = category["count"]
-                while remaining > 0:
-                    batch_count = min(BATCH_SIZE, remaining)
-                    batch = self.generate_test_cases_batch(
-                        story_id,
-                        story_description,
-                        category["type"],
-                        category["focus"],
-                        len(final_test_cases["test_cases"]),
-                        batch_count
-                    )
-                    
-                    if "test_cases" in batch:
-                        final_test_cases["test_cases"].extend(batch["test_cases"])
-                        remaining -= len(batch["test_cases"])
+            plan = plan_batch_capacity()
+            batches = plan.split(categories)
+
+            # Resume an interrupted run: keep its plan and reuse its finished batches
+            completed = {}
+            if checkpoint:
+                batches, completed = resume_generation_run(story_id, story_input_hash(story_description), batches)
+            if completed:
+                print(f"♻️ Resuming {story_id}: {len(completed)}/{len(batches)} batches already checkpointed")
+                for batch_index in sorted(completed):
+                    self._notify_batch(batch_index, len(batches), batches[batch_index], completed[batch_index])
+            else:
+                print(f"🗂️ Planned {len(batches)} calls of up to {plan.capacity} test cases for {story_id} ({plan.reason})")
+
+            if max_concurrency is None:
+                max_concurrency = GENERATION_CONCURRENCY
+
+            if max_concurrency > 1:
+                results = self.generate_batches_concurrently(
+                    story_id,
+                    story_description,
+                    batches,
+                    completed,
+                    plan,
+                    max_concurrency,
+                    checkpoint
+                )
+            else:
+                # Generate the planned batches one after another
+                results = []
+                current_count = 0
+                for batch_index, parts in enumerate(batches):
+                    if batch_index in completed:
+                        batch = {"test_cases": completed[batch_index]}
                     else:
-                        print(f"Warning: No test cases generated for {category['type']} batch")
-                        break
+                        batch = self.generate_checkpointed_batch(
+                            story_id, story_description, batch_index, parts, current_count, plan, checkpoint, len(batches)
+                        )
+                    results.append(batch)
+                    if batch and batch.get("test_cases"):
+                        current_count += len(batch["test_cases"])
+
+            final_test_cases["test_cases"] = self.assemble_batches(story_id, batches, results)
             
+            # Batches are generated independently, so near-identical test cases are removed across them
+            final_test_cases["duplicates_dropped"] = self.drop_duplicates(story_id, final_test_cases["test_cases"])
+
             # Update total count
             final_test_cases["total_test_cases"] = len(final_test_cases["test_cases"])
             
@@ -309,80 +327,222 @@ class TestCaseGenerator:
             print(f"Error generating test cases: {e}")
             raise
 
-    def generate_test_cases_batch(self, story_id: str, story_description: str, test_type: str, focus_areas: List[str], current_count: int, batch_size: int) -> Dict:
-        """Generate a batch of test cases for a given category"""
+    def _notify_batch(self, batch_index: int, batch_total: int, parts: List[Dict], test_cases: List[Dict]):
+        if self.on_batch is None:
+            return
+        try:
+            self.on_batch(batch_index, batch_total, parts, test_cases)
+        except Exception as e:
+            print(f"⚠️ Batch callback failed: {e}")
+
+    def generate_checkpointed_batch(self, story_id: str, story_description: str, batch_index: int, parts: List[Dict], current_count: int, plan: BatchPlan, checkpoint: bool = True, batch_total: int = 1) -> Dict:
+        """Generate one batch and checkpoint it, unless it is only the fallback placeholder"""
+        batch = self.generate_test_cases_batch(story_id, story_description, parts, current_count, plan, batch_index)
+        if checkpoint and batch and batch.get("test_cases") and not batch.get("fallback"):
+            save_batch_checkpoint(story_id, batch_index, parts, batch["test_cases"])
+        if batch and batch.get("test_cases"):
+            self._notify_batch(batch_index, batch_total, parts, batch["test_cases"])
+        return batch
+
+    def generate_batches_concurrently(self, story_id: str, story_description: str, batches: List[List[Dict]], completed: Dict[int, List[Dict]], plan: BatchPlan, max_concurrency: int, checkpoint: bool = True) -> List[Dict]:
+        """
+        Run all planned batches that are not already checkpointed in parallel,
+        at most max_concurrency at a time. Results are returned in plan order.
+        """
+        pending = [i for i in range(len(batches)) if i not in completed]
+        results = {i: {"test_cases": test_cases} for i, test_cases in completed.items()}
+        if pending:
+            print(f"⚡ Dispatching {len(pending)} batches for {story_id} ({min(max_concurrency, len(pending))} at a time)")
+            with ThreadPoolExecutor(max_workers=min(max_concurrency, len(pending))) as executor:
+                futures = {
+                    i: executor.submit(
+                        self.generate_checkpointed_batch,
+                        story_id,
+                        story_description,
+                        i,
+                        batches[i],
+                        0,
+                        plan,
+                        checkpoint,
+                        len(batches)
+                    )
+                    for i in pending
+                }
+                for i, future in futures.items():
+                    results[i] = future.result()
+        return [results[i] for i in range(len(batches))]
+
+    def assemble_batches(self, story_id: str, batches: List[List[Dict]], results: List[Dict]) -> List[Dict]:
+        """
+        Concatenate batch results in plan order and number the test cases
+        TC1..TCn, so ids are contiguous no matter which batch finished first
+        or which run generated it.
+        """
+        test_cases = []
+        for parts, result in zip(batches, results):
+            if result and result.get("test_cases"):
+                test_cases.extend(dict(test_case) for test_case in result["test_cases"])
+            else:
+                print(f"Warning: No test cases generated for {', '.join(part['type'] for part in parts)} batch")
+
+        for i, test_case in enumerate(test_cases):
+            test_case["id"] = f"{story_id}-TC{i + 1}"
+        return test_cases
+
+    def drop_duplicates(self, story_id: str, test_cases: List[Dict]) -> int:
+        """
+        Remove near-duplicate test cases in place (see DUPLICATE_SIMILARITY_THRESHOLD),
+        renumber the rest and return how many were dropped.
+        """
+        if DUPLICATE_SIMILARITY_THRESHOLD <= 0:
+            return 0
+        try:
+            kept = drop_near_duplicates(test_cases, project_id=self.project_id)
+        except Exception as e:
+            print(f"⚠️ Duplicate check failed for {story_id}, keeping all test cases: {e}")
+            return 0
+
+        dropped = len(test_cases) - len(kept)
+        if dropped:
+            print(f"🧹 Dropped {dropped} near-duplicate test cases for {story_id}")
+            DUPLICATES_DROPPED.labels(self.project_id).inc(dropped)
+            test_cases[:] = kept
+            for i, test_case in enumerate(test_cases):
+                test_case["id"] = f"{story_id}-TC{i + 1}"
+        return dropped
+
+    def missing_parts(self, parts: List[Dict], test_cases: List[Dict]) -> List[Dict]:
+        """
+        The share of parts a salvaged response did not deliver. Test cases are
+        attributed by their category field, or in prompt order when the model
+        left it out.
+        """
+        types = {part["type"] for part in parts}
+        if all(tc.get("category") in types for tc in test_cases):
+            delivered = {part_type: sum(1 for tc in test_cases if tc["category"] == part_type) for part_type in types}
+        else:
+            delivered = {}
+            remaining = len(test_cases)
+            for part in parts:
+                delivered[part["type"]] = min(part["count"], remaining)
+                remaining -= delivered[part["type"]]
+        return [
+            {**part, "count": part["count"] - delivered[part["type"]]}
+            for part in parts
+            if part["count"] > delivered[part["type"]]
+        ]
+
+    def generate_test_cases_batch(self, story_id: str, story_description: str, parts: List[Dict], current_count: int, plan: BatchPlan, batch_index: int = 0, allow_top_up: bool = True, covered_titles: Optional[List[str]] = None) -> Dict:
+        """
+        Generate one planned batch. parts lists the categories covered by this
+        call with their type, focus areas and count; every call is recorded so
+        the planner can size later batches. When a response is cut off or
+        partly malformed, the salvaged test cases are kept and one top-up call
+        asks only for the missing ones (covered_titles lists what it must not repeat).
+        """
+        covered = ""
+        if covered_titles:
+            covered = "\nAlready covered, do not repeat:\n" + "\n".join(f"- {title}" for title in covered_titles) + "\n"
+        batch_size = sum(part["count"] for part in parts)
+        test_types = ", ".join(part["type"] for part in parts)
         for attempt in range(MAX_RETRIES):
             try:
-                # Randomize the actual batch size slightly
-                actual_batch_size = random.randint(max(1, batch_size - 2), batch_size + 2)
-                
-                # Create a focused prompt for this specific batch
+                # Create a focused prompt for the categories in this batch
                 batch_prompt = f"""You are a Senior QA Architect with 15+ years of experience in enterprise software testing.
-Your task is to generate exactly {actual_batch_size} {test_type} test cases for this user story.
+Your task is to generate exactly {batch_size} test cases for this user story, split by category as listed below.
 
 Story ID: {story_id}
 Description: {story_description}
 
-Focus Areas for this batch:
-{chr(10).join(f"- {area}" for area in focus_areas)}
+This is batch {batch_index + 1} for this story; other batches cover the same categories, so vary the scenarios.
+{covered}
+Categories for this batch:
+{chr(10).join(f"- {part['count']} {part['type']} test cases, focusing on: {', '.join(part['focus'])}" for part in parts)}
 
 Requirements:
-1. Generate ONLY {test_type} test cases
+1. Generate exactly the number of test cases requested for each category
 2. Each test case must be unique and detailed
-3. Focus on the areas listed above
+3. Focus on the areas listed for its category
 4. Include specific validation points
-5. Consider error scenarios and edge cases
-
-CRITICAL: Your response MUST be a valid JSON object with this exact structure:
-{{
-    "test_cases": [
-        {{
-            "id": "{story_id}-TC{current_count + 1}",
-            "title": "Detailed description of what is being tested",
-            "steps": [
-                "Step 1: Detailed step with specific actions",
-                "Step 2: Detailed step with validation points"
-            ],
-            "expected_result": "Comprehensive description of expected outcomes",
-            "priority": "High" | "Medium" | "Low"
-        }}
-    ]
-}}
+5. Set "category" to the category the test case belongs to
+
+{TEST_CASE_BATCH.instructions()}
+Number the test cases from {story_id}-TC{current_count + 1} and start every step with "Step N: ".
 
 Remember:
 - Be extremely detailed and specific
 - Include all necessary validation points
 - Make steps clear and actionable
-- Include specific test data
-- Return ONLY the JSON object, no other text
-- Do not use markdown code blocks"""
+- Include specific test data"""
+
+                print(f"🧮 {test_types} batch prompt for {story_id}: ~{estimate_tokens(batch_prompt)} tokens")
 
                 # Call LLM
-                response = Config.llm.invoke(batch_prompt)
+                cached = TEST_CASE_BATCH.is_cached(Config.llm, batch_prompt)
+                if not cached:
+                    wait_for_quota(get_bucket("generation"), self.project_id)
+                with track_llm("generation", self.project_id, story_id, attempt) as call:
+                    call["prompt"] = batch_prompt
+                    if cached:
+                        call["outcome"] = "cache_hit"
+                    response = call["response"] = TEST_CASE_BATCH.invoke(Config.llm, batch_prompt)
                 response_text = response.content.strip()
+
+                usage = getattr(response, "usage_metadata", None) or {}
+                output_tokens = usage.get("output_tokens") or estimate_tokens(response_text)
+                finish_reason = str((getattr(response, "response_metadata", None) or {}).get("finish_reason", ""))
+                truncated = "MAX_TOKENS" in finish_reason.upper()
                 
                 # Use the new JSON handler to parse and validate the response
-                batch_test_cases = JSONResponseHandler.parse_and_validate_response(
-                    response_text,
-                    story_id,
-                    current_count
-                )
-                
-                if batch_test_cases and batch_test_cases.get("test_cases"):
-                    print(f"✅ Successfully generated {len(batch_test_cases['test_cases'])} {test_type} test cases")
-                    return batch_test_cases
+                try:
+                    with track_stage("json_parse", self.project_id):
+                        batch_test_cases = JSONResponseHandler.parse_and_validate_response(
+                            response_text,
+                            story_id,
+                            current_count,
+                            strict=True
+                        )
+                except ValueError:
+                    record_batch_call(story_id, parts, plan, 0, output_tokens, truncated, True)
+                    raise
+
+                salvage = batch_test_cases.pop("salvage", {})
+                returned = len(batch_test_cases["test_cases"])
+                record_batch_call(story_id, parts, plan, returned, output_tokens, truncated, not salvage.get("complete", True))
+                print(f"✅ Successfully generated {returned} {test_types} test cases")
+
+                # An incomplete response costs a short request for what is missing, not a full retry
+                missing = self.missing_parts(parts, batch_test_cases["test_cases"]) if not salvage.get("complete", True) else []
+                if missing and allow_top_up:
+                    print(f"➕ Topping up {sum(part['count'] for part in missing)} test cases for {story_id}")
+                    top_up = self.generate_test_cases_batch(
+                        story_id,
+                        story_description,
+                        missing,
+                        current_count + returned,
+                        plan,
+                        batch_index,
+                        allow_top_up=False,
+                        covered_titles=[tc["title"] for tc in batch_test_cases["test_cases"]]
+                    )
+                    if top_up and not top_up.get("fallback"):
+                        batch_test_cases["test_cases"].extend(top_up["test_cases"])
+                return batch_test_cases
                     
             except Exception as e:
                 print(f"Attempt {attempt + 1}/{MAX_RETRIES} failed: {str(e)}")
+                # Do not let the retry replay the response that just failed
+                TEST_CASE_BATCH.evict_cached(Config.llm, batch_prompt)
                 if attempt < MAX_RETRIES - 1:
                     print("Retrying...")
                     continue
                 else:
                     print("All retries failed, returning minimal valid response")
                     return {
+                        "fallback": True,
                         "test_cases": [{
                             "id": f"{story_id}-TC{current_count + 1}",
-                            "title": f"Basic {test_type} test case",
+                            "title": f"Basic {parts[0]['type']} test case",
                             "steps": ["Step 1: Verify basic functionality"],
                             "expected_result": "System functions as expected",
                             "priority": "Medium"
@@ -401,35 +561,45 @@ Remember:
         
         return formatted
 
-def generate_test_case_for_story(story_id, llm_ref=None):
+def get_story_row(story_id):
+    """Read the generation columns of one story from LanceDB, or None if it does not exist"""
+    db = lancedb.connect(Config.LANCE_DB_PATH)
+    table = db.open_table(Config.TABLE_NAME_LANCE)
+    rows = table.to_lance().to_table(
+        columns=STORY_COLUMNS,
+        filter=f"storyID = {lance_literal(story_id)}"
+    ).to_pylist()
+    return rows[0] if rows else None
+
+def generate_test_case_for_story(story_id, llm_ref=None, analyze_impacts=True, row=None, on_batch=None):
     """Synchronous wrapper for async function"""
     if llm_ref is None:
         llm_ref = Config.llm
-    return asyncio.run(_generate_test_case_for_story(story_id, llm_ref))
-
-async def _generate_test_case_for_story(story_id, llm_ref=None):
-    """Async implementation of test case generation"""
+    return asyncio.run(_generate_test_case_for_story(story_id, llm_ref, analyze_impacts=analyze_impacts, row=row, on_batch=on_batch))
+
+async def _generate_test_case_for_story(story_id, llm_ref=None, analyze_impacts=True, row=None, on_batch=None):
+    """
+    Async implementation of test case generation.
+    With analyze_impacts=False the caller is responsible for impact analysis
+    (the job queue runs it as a separate analyze_impact job). row holds the
+    story's STORY_COLUMNS when the caller already read them from LanceDB.
+    on_batch is passed to TestCaseGenerator to report each parsed batch.
+    """
     if llm_ref is None:
         llm_ref = Config.llm
     
     try:
-        # Initialize test case generator
-        generator = TestCaseGenerator()
+        # Get story data from LanceDB unless the caller passed it in
+        if row is None:
+            row = get_story_row(story_id)
         
-        # Get story data from LanceDB
-        db = lancedb.connect(Config.LANCE_DB_PATH)
-        table = db.open_table(Config.TABLE_NAME_LANCE)
-        all_rows = table.to_pandas()
-        row_data = all_rows[all_rows['storyID'] == story_id]
-        
-        if row_data.empty:
+        if row is None:
             print(f"❌ Story ID '{story_id}' not found in LanceDB.")
             return
         
-        row = row_data.iloc[0].to_dict()
         project_id = row.get("project_id", "")
         story_description = row["storyDescription"]
-        main_text = row.get("doc_content_text", "").strip()
+        main_text = (row.get("doc_content_text") or "").strip()
         
         if not main_text:
             print(f"❌ Skipping {story_id} — missing doc_content_text.")
@@ -437,12 +607,15 @@ async def _generate_test_case_for_story(story_id, llm_ref=None):
         
         print(f"🔍 Generating test case for: {story_id} (Project: {project_id})")
         
+        # Initialize test case generator
+        generator = TestCaseGenerator(on_batch=on_batch, project_id=project_id)
+
         # Use the dynamic test case generation
         test_cases = generator.generate_test_cases(story_id, story_description)
         
         if test_cases and test_cases.get("test_cases"):
             # Insert test cases into database
-            insert_test_case(
+            stored = insert_test_case(
                 story_id=story_id,
                 story_description=story_description,
                 test_case_json=test_cases,
@@ -454,12 +627,27 @@ async def _generate_test_case_for_story(story_id, llm_ref=None):
                     "project_id": project_id
                 }
             )
+            if not stored:
+                # Keep the batch checkpoints so the next attempt resumes instead of regenerating
+                print(f"❌ Failed to store test cases for {story_id}; checkpoints kept for resume")
+                return None
             print(f"✅ Inserted test cases for {story_id} into Postgres.\n")
+
+            # The suite is stored, so its batch checkpoints are no longer needed
+            clear_generation_run(story_id)
+            TEST_CASES_GENERATED.labels(project_id).inc(len(test_cases["test_cases"]))
+
+            # Store per-test-case embeddings used to trim impact prompts
+            try:
+                store_test_case_embeddings(story_id, project_id, test_cases["test_cases"])
+            except Exception as e:
+                print(f"⚠️ Failed to store test case embeddings for {story_id}: {e}")
             
-            # Trigger impact analysis after storing test cases
-            print(f"🔄 Triggering impact analysis for {story_id}")
-            analyze_test_case_impacts(story_id, project_id)
-            print(f"✅ Impact analysis completed for {story_id}\n")
+            if analyze_impacts:
+                # Trigger impact analysis after storing test cases
+                print(f"🔄 Triggering impact analysis for {story_id}")
+                analyze_test_case_impacts(story_id, project_id)
+                print(f"✅ Impact analysis completed for {story_id}\n")
             
             return test_cases
         else:
@@ -470,55 +658,154 @@ async def _generate_test_case_for_story(story_id, llm_ref=None):
         return None
 
 # === Run for all unprocessed
-def generate_test_cases_for_all_stories():
+def generate_test_cases_for_all_stories(max_concurrent_stories=None, story_timeout=None):
     """Synchronous wrapper for async function"""
-    return asyncio.run(_generate_test_cases_for_all_stories())
+    return asyncio.run(_generate_test_cases_for_all_stories(max_concurrent_stories, story_timeout))
+
+class GenerationProgress:
+    """Running totals for a batch generation run, printed as stories finish"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.started = datetime.now()
+
+    @property
+    def finished(self) -> int:
+        return self.succeeded + self.failed + self.timed_out
+
+    def record(self, story_id: str, outcome: str):
+        if outcome == "succeeded":
+            self.succeeded += 1
+        elif outcome == "timed_out":
+            self.timed_out += 1
+        else:
+            self.failed += 1
+
+        elapsed = (datetime.now() - self.started).total_seconds()
+        remaining = self.total - self.finished
+        eta = elapsed / self.finished * remaining if self.finished else 0
+        print(
+            f"📈 [{self.finished}/{self.total}] {story_id} {outcome} "
+            f"(✅ {self.succeeded} ❌ {self.failed} ⏱️ {self.timed_out}, "
+            f"elapsed {elapsed:.0f}s, ~{eta:.0f}s left)"
+        )
+
+    def summary(self) -> Dict:
+        return {
+            "total": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "timed_out": self.timed_out,
+            "elapsed_seconds": round((datetime.now() - self.started).total_seconds(), 1)
+        }
+
+async def _generate_stories_in_pool(records, max_concurrent_stories, story_timeout):
+    """
+    Generate the stories of already scanned rows on a dedicated pool of
+    max_concurrent_stories threads. generate_test_case_for_story blocks on LLM
+    calls and cannot be interrupted, so a timed out story is abandoned but
+    keeps its thread until it finishes: at most max_concurrent_stories stories
+    ever run at once. The run returns without waiting for abandoned stories.
+    """
+    workers = max(1, max_concurrent_stories)
+    print(f"👷 Generating with {workers} concurrent stories")
+    progress = GenerationProgress(len(records))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="story")
+    try:
+        await asyncio.gather(*(
+            _generate_story_in_pool(row, executor, progress, story_timeout)
+            for row in records
+        ))
+    finally:
+        executor.shutdown(wait=False)
+    return progress.summary()
+
+async def _generate_story_in_pool(row, executor, progress, story_timeout):
+    """Generate one story on the pool; its timeout counts from when a thread picks it up"""
+    story_id = row["storyID"]
+    loop = asyncio.get_running_loop()
+    started = loop.create_future()
+
+    def run():
+        loop.call_soon_threadsafe(started.set_result, None)
+        return generate_test_case_for_story(story_id, row=row)
+
+    future = loop.run_in_executor(executor, run)
+    try:
+        await started
+        result = await asyncio.wait_for(future, timeout=story_timeout)
+        progress.record(story_id, "succeeded" if result else "failed")
+    except asyncio.TimeoutError:
+        print(f"⏱️ Test case generation for {story_id} exceeded {story_timeout}s")
+        progress.record(story_id, "timed_out")
+    except Exception as e:
+        print(f"❌ Error in test case generation for {story_id}: {e}")
+        progress.record(story_id, "failed")
+
+async def _generate_test_cases_for_all_stories(max_concurrent_stories=None, story_timeout=None):
+    """
+    Async implementation of batch test case generation.
+    Up to max_concurrent_stories (default STORY_CONCURRENCY) stories are
+    generated at once; all of them draw from the shared generation and impact
+    rate limit buckets, so the pool size does not change the LLM call rate.
+    """
+    if max_concurrent_stories is None:
+        max_concurrent_stories = STORY_CONCURRENCY
+    if story_timeout is None:
+        story_timeout = STORY_TIMEOUT_SECONDS or None
 
-async def _generate_test_cases_for_all_stories():
-    """Async implementation of batch test case generation"""
     db = lancedb.connect(Config.LANCE_DB_PATH)
     table = db.open_table(Config.TABLE_NAME_LANCE)
 
     generated_ids = set(get_all_generated_story_ids())
-    all_rows = table.to_pandas()
+
+    # One projected scan per run: only the columns generation needs, plus the
+    # vector lengths for the missing-vector report
+    scan = table.to_lance().to_table(columns=STORY_COLUMNS + ["vector"])
+    vector_lengths = pc.fill_null(pc.list_value_length(scan.column("vector")), 0)
+    all_rows = scan.select(STORY_COLUMNS).to_pylist()
     
     print(f"📊 Total stories in LanceDB: {len(all_rows)}")
     print(f"📊 Already generated stories: {len(generated_ids)}")
     
     # Check for missing vectors
     missing_vector_count = 0
-    for index, row in all_rows.iterrows():
-        vector_value = row.get("vector")
-        if vector_value is None or (hasattr(vector_value, '__len__') and len(vector_value) == 0):
+    for row, vector_length in zip(all_rows, vector_lengths.to_pylist()):
+        if vector_length == 0:
             print(f"Story {row['storyID']} is missing a vector and will not be processed.")
             missing_vector_count += 1
     
     print(f"📊 Stories missing vectors: {missing_vector_count}")
     
-    # Get all story IDs and filter out already generated ones
-    all_story_ids = all_rows['storyID'].tolist()
-    records = [story_id for story_id in all_story_ids if story_id not in generated_ids]
+    # Filter out already generated stories
+    records = [row for row in all_rows if row["storyID"] not in generated_ids]
     
     print(f"🟡 Found {len(records)} entries to process.\n")
     
     if len(records) == 0:
         print("✅ All stories with vectors have been processed!")
-        return
-        
-    for story_id in records:
-        await _generate_test_case_for_story(story_id)
+        return GenerationProgress(0).summary()
+
+    summary = await _generate_stories_in_pool(records, max_concurrent_stories, story_timeout)
+    print(f"🏁 Batch generation finished: {summary}")
+    return summary
 
 def Chat_RAG(user_query, top_k=3):
     db = lancedb.connect(Config.LANCE_DB_PATH)
     table = db.open_table(Config.TABLE_NAME_LANCE)
-    query_vector = Config.EMBEDDING_MODEL.encode(user_query).tolist()
-
-    results = (
-        table.search(query_vector)
-        .metric("cosine")
-        .limit(top_k)
-        .to_list()
-    )
+    with track_stage("embed"):
+        query_vector = Config.EMBEDDING_MODEL.encode(user_query).tolist()
+
+    with track_stage("lance_search"):
+        results = (
+            table.search(query_vector)
+            .metric("cosine")
+            .limit(top_k)
+            .to_list()
+        )
 
     if not results:
         return {"error": "No relevant stories found."}
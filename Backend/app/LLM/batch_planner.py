@@ -0,0 +1,158 @@
+import os
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import psycopg2
+
+from app.config import Config
+from app.utils.metrics import timed_query
+
+# Gemini 2.0 Flash output limit per call
+MAX_OUTPUT_TOKENS = int(os.getenv("GENERATION_MAX_OUTPUT_TOKENS", "8192"))
+# Share of the output limit a planned batch may fill
+OUTPUT_HEADROOM = float(os.getenv("GENERATION_OUTPUT_HEADROOM", "0.7"))
+# Parse failure rate (truncated or malformed JSON) the planner tries to stay under
+TARGET_PARSE_FAILURE_RATE = float(os.getenv("GENERATION_TARGET_PARSE_FAILURE_RATE", "0.05"))
+
+# Capacity used until enough calls have been observed
+COLD_START_BATCH_SIZE = 10
+MIN_BATCH_SIZE = 3
+MAX_BATCH_SIZE = int(os.getenv("GENERATION_MAX_BATCH_SIZE", "40"))
+MIN_SAMPLES = 5
+STATS_WINDOW = 200
+
+
+class BatchPlan:
+    """Number of test cases per call chosen for one story, and why"""
+
+    def __init__(self, capacity: int, tokens_per_case: Optional[float], parse_failure_rate: Optional[float], samples: int, reason: str):
+        self.capacity = capacity
+        self.tokens_per_case = tokens_per_case
+        self.parse_failure_rate = parse_failure_rate
+        self.samples = samples
+        self.reason = reason
+
+    def split(self, categories: List[Dict]) -> List[List[Dict]]:
+        """
+        Pack category counts into calls of at most capacity test cases.
+        Categories are kept in order; a small story fits several categories
+        in one call and a large category is spread over consecutive calls.
+        """
+        batches = []
+        current = []
+        room = self.capacity
+        for category in categories:
+            remaining = category["count"]
+            while remaining > 0:
+                take = min(room, remaining)
+                current.append({"type": category["type"], "focus": category["focus"], "count": take})
+                remaining -= take
+                room -= take
+                if room == 0:
+                    batches.append(current)
+                    current = []
+                    room = self.capacity
+        if current:
+            batches.append(current)
+        return batches
+
+
+def _load_stats() -> Dict:
+    """Aggregate the most recent generation calls"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**Config.postgres_config())
+        with conn.cursor() as cur:
+            cur.execute("""
+                WITH recent AS (
+                    SELECT requested_count, returned_count, output_tokens, parse_failed
+                    FROM generation_batch_log
+                    ORDER BY created_on DESC
+                    LIMIT %s
+                )
+                SELECT
+                    COUNT(*),
+                    SUM(output_tokens) FILTER (WHERE NOT parse_failed)::float
+                        / NULLIF(SUM(returned_count) FILTER (WHERE NOT parse_failed), 0),
+                    AVG(CASE WHEN parse_failed THEN 1.0 ELSE 0.0 END),
+                    MIN(requested_count) FILTER (WHERE parse_failed)
+                FROM recent
+            """, (STATS_WINDOW,))
+            samples, tokens_per_case, failure_rate, smallest_failed = cur.fetchone()
+            return {
+                "samples": samples or 0,
+                "tokens_per_case": tokens_per_case,
+                "parse_failure_rate": float(failure_rate) if failure_rate is not None else None,
+                "smallest_failed": smallest_failed
+            }
+    except Exception as e:
+        print(f"⚠️ Could not load generation stats: {e}")
+        return {"samples": 0, "tokens_per_case": None, "parse_failure_rate": None, "smallest_failed": None}
+    finally:
+        if conn:
+            conn.close()
+
+
+def plan_batch_capacity() -> BatchPlan:
+    """
+    Choose how many test cases to request per call.
+
+    The capacity is what fits in the output limit (minus headroom) at the
+    observed tokens per test case. When the recent parse failure rate is above
+    target, it is also kept below the smallest batch size that failed.
+    """
+    stats = _load_stats()
+    if stats["samples"] < MIN_SAMPLES or not stats["tokens_per_case"]:
+        return BatchPlan(COLD_START_BATCH_SIZE, stats["tokens_per_case"], stats["parse_failure_rate"], stats["samples"], "cold start")
+
+    capacity = int(MAX_OUTPUT_TOKENS * OUTPUT_HEADROOM / stats["tokens_per_case"])
+    reason = f"{stats['tokens_per_case']:.0f} output tokens per test case"
+    if stats["parse_failure_rate"] > TARGET_PARSE_FAILURE_RATE and stats["smallest_failed"]:
+        capacity = min(capacity, int(stats["smallest_failed"] * 0.75))
+        reason += f", parse failures at {stats['parse_failure_rate']:.0%} above target"
+
+    capacity = max(MIN_BATCH_SIZE, min(MAX_BATCH_SIZE, capacity))
+    return BatchPlan(capacity, stats["tokens_per_case"], stats["parse_failure_rate"], stats["samples"], reason)
+
+
+@timed_query("record_batch_call")
+def record_batch_call(
+    story_id: str,
+    parts: List[Dict],
+    plan: BatchPlan,
+    returned_count: int,
+    output_tokens: int,
+    truncated: bool,
+    parse_failed: bool
+) -> None:
+    """Log one generation call and the plan it was made under"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**Config.postgres_config())
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO generation_batch_log (
+                        story_id, categories, requested_count, returned_count, output_tokens,
+                        truncated, parse_failed, planned_capacity, tokens_per_case_estimate,
+                        plan_reason, created_on
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    story_id,
+                    json.dumps({part["type"]: part["count"] for part in parts}),
+                    sum(part["count"] for part in parts),
+                    returned_count,
+                    output_tokens,
+                    truncated,
+                    parse_failed,
+                    plan.capacity,
+                    plan.tokens_per_case,
+                    plan.reason,
+                    datetime.now()
+                ))
+    except Exception as e:
+        print(f"⚠️ Could not record generation call for {story_id}: {e}")
+    finally:
+        if conn:
+            conn.close()
@@ -5,11 +5,18 @@ import lancedb
 import numpy as np
 from ..config import Config
 from ..models.db_service import DatabaseService
-from ..models.postgress_writer import get_test_case_json_by_story_id
+from ..models.postgress_writer import get_run_id_by_story_id, get_test_case_jsons_by_story_ids
+from ..datapipeline.test_case_embeddings import filter_relevant_test_cases, test_case_matrix
+from ..utils.rate_limiter import get_bucket
+from .prompt_packer import estimate_tokens, pack_test_cases, suite_hash, suite_test_cases
+from .structured_output import IMPACT_VERDICT, SchemaViolation
+from ..utils.metrics import IMPACTS_STORED, timed_query, track_llm, track_stage, wait_for_quota
+from ..utils.lance_util import lance_literal, lance_in_list
 import asyncio
 from tenacity import retry, stop_after_attempt, wait_exponential
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Dict, List, Optional
 import psycopg2
 import psycopg2.extras
@@ -41,29 +48,12 @@ MAX_RETRIES = 3
 MAX_CONCURRENT_ANALYSES = 3
 MIN_WAIT_BETWEEN_CALLS = 1  # seconds
 MAX_STORIES_TO_ANALYZE = 5
+MIN_SIMILARITY_SCORE = 0.35  # cosine similarity a candidate story must reach to be analyzed
+CANDIDATE_OVERFETCH = 4  # extra neighbours fetched to survive filtering of ungenerated stories
 API_TIMEOUT = 30  # seconds
 
-class RateLimiter:
-    def __init__(self, calls_per_minute: int = 50):
-        self.calls_per_minute = calls_per_minute
-        self.calls = []
-        
-    def can_make_call(self) -> bool:
-        now = time.time()
-        # Remove calls older than 1 minute
-        self.calls = [call_time for call_time in self.calls if now - call_time < 60]
-        return len(self.calls) < self.calls_per_minute
-        
-    def record_call(self):
-        self.calls.append(time.time())
-        
-    def wait_if_needed(self):
-        while not self.can_make_call():
-            time.sleep(1)
-        self.record_call()
-
-# Global rate limiter instance
-rate_limiter = RateLimiter()
+# Global rate limiter shared with every other process using the impact budget
+rate_limiter = get_bucket("impact")
 
 class ImpactAnalysisError(Exception):
     """Base class for Impact Analysis errors"""
@@ -100,115 +90,209 @@ def get_db_service() -> DatabaseService:
         logger.error(f"Failed to get database service: {str(e)}")
         raise DatabaseError(f"Database service error: {str(e)}")
 
+def get_story_vectors(table, story_ids: List[str]) -> Dict[str, np.ndarray]:
+    """Fetch the embedding vectors of the given stories with a projected scan"""
+    if not story_ids:
+        return {}
+    rows = table.to_lance().to_table(
+        columns=["storyID", "vector"],
+        filter=f"storyID IN ({lance_in_list(story_ids)})"
+    ).to_pylist()
+    return {
+        row["storyID"]: np.asarray(row["vector"], dtype=np.float32)
+        for row in rows
+        if row.get("vector") is not None
+    }
+
+def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Cosine similarity between two vectors, 0.0 if either is empty"""
+    norm = float(np.linalg.norm(a) * np.linalg.norm(b))
+    if norm == 0.0:
+        return 0.0
+    return float(np.dot(a, b) / norm)
+
+def select_candidate_stories(
+    new_story_id: str,
+    project_id: str,
+    eligible_story_ids: set,
+    top_k: int = MAX_STORIES_TO_ANALYZE,
+    min_similarity: float = MIN_SIMILARITY_SCORE
+) -> List[Dict]:
+    """
+    Pick the stories most similar to the new story using the LanceDB vectors.
+
+    Only stories from the same project that appear in eligible_story_ids (i.e.
+    already have test cases) and reach min_similarity are returned, at most
+    top_k of them, ordered by descending similarity. Each candidate carries its
+    similarity score and story description.
+    """
+    db_service = get_db_service()
+    table = db_service.lance_db.open_table(Config.TABLE_NAME_LANCE)
+
+    new_vector = get_story_vectors(table, [new_story_id]).get(new_story_id)
+    if new_vector is None:
+        logger.warning(f"No vector found for {new_story_id}; skipping candidate selection")
+        return []
+
+    with track_stage("lance_search", project_id):
+        results = (
+            table.search(new_vector.tolist())
+            .metric("cosine")
+            .where(f"project_id = {lance_literal(project_id)}", prefilter=True)
+            .select(["storyID", "storyDescription"])
+            .limit(top_k * CANDIDATE_OVERFETCH + 1)
+            .to_list()
+        )
+
+    candidates = []
+    for result in results:
+        story_id = result["storyID"]
+        if story_id == new_story_id or story_id not in eligible_story_ids:
+            continue
+        # LanceDB reports cosine distance; convert back to similarity
+        similarity = 1.0 - float(result["_distance"])
+        if similarity < min_similarity:
+            break
+        candidates.append({
+            "id": story_id,
+            "description": result.get("storyDescription"),
+            "similarity_score": similarity
+        })
+        if len(candidates) >= top_k:
+            break
+
+    logger.info(
+        f"Selected {len(candidates)} candidate stories for {new_story_id} "
+        f"out of {len(eligible_story_ids)} generated stories in project {project_id}"
+    )
+    return candidates
+
 @retry(
     stop=stop_after_attempt(MAX_RETRIES),
     wait=wait_exponential(multiplier=1, min=4, max=10),
     retry_error_cls=LLMError
 )
-def get_llm_analysis(prompt: str, llm_ref) -> Dict:
+def get_llm_analysis(prompt: str, llm_ref, project_id: str = "", story_id: str = None, attempts: Dict = None, run_id: str = None) -> Dict:
     """
-    Get analysis from LLM with retry logic and error handling
+    Get analysis from LLM with retry logic and error handling.
+    attempts (a dict shared across the retries) counts the calls for usage accounting;
+    run_id is the new story's stored run the calls are recorded against.
     """
+    attempt = 0
+    if attempts is not None:
+        attempt = attempts.get("count", 0)
+        attempts["count"] = attempt + 1
     try:
-        rate_limiter.wait_if_needed()
         logger.debug("Making LLM API call")
         
-        # Add explicit JSON formatting instructions
+        # The response format comes from the shared impact verdict schema
         structured_prompt = f"""
 {prompt}
 
-CRITICAL: Your response MUST be a valid JSON object with this exact structure:
-{{
-    "has_impact": boolean,
-    "impact_type": "MODIFY" | "NO_IMPACT",
-    "impacted_test_cases": [
-        {{
-            "original_test_case_id": "string",
-            "modification_reason": "string",
-            "modified_test_case": {{
-                "id": "string",
-                "title": "string",
-                "steps": ["string"],
-                "expected_result": "string",
-                "priority": "High" | "Medium" | "Low"
-            }}
-        }}
-    ]
-}}
-
-Do not include any explanatory text before or after the JSON.
-Do not use markdown code blocks.
-Just return the raw JSON object.
+{IMPACT_VERDICT.instructions()}
 """
         
-        # Get response from LLM
-        response = llm_ref.invoke(structured_prompt)
-        content = response.content.strip()
-        
-        # Clean up the response
-        if "```json" in content:
-            content = content.split("```json")[1].split("```")[0].strip()
-        elif "```" in content:
-            content = content.split("```")[1].strip()
-            
-        # Try to find JSON object if there's any text before it
-        if not content.startswith("{"):
-            start_idx = content.find("{")
-            if start_idx != -1:
-                content = content[start_idx:]
-                
-        # Try to find JSON object if there's any text after it
-        if not content.endswith("}"):
-            end_idx = content.rfind("}") + 1
-            if end_idx != 0:
-                content = content[:end_idx]
+        # Get response from LLM; cached responses do not spend rate limit tokens
+        cached = IMPACT_VERDICT.is_cached(llm_ref, structured_prompt)
+        if not cached:
+            wait_for_quota(rate_limiter, project_id)
+        with track_llm("impact", project_id, story_id, attempt, run_id) as call:
+            call["prompt"] = structured_prompt
+            if cached:
+                call["outcome"] = "cache_hit"
+            response = call["response"] = IMPACT_VERDICT.invoke(llm_ref, structured_prompt)
         
         try:
-            result = json.loads(content)
-            
-            # Validate required fields
-            if not isinstance(result.get("has_impact"), bool):
-                raise ValueError("has_impact must be a boolean")
-                
-            if result.get("impact_type") not in ["MODIFY", "NO_IMPACT"]:
-                raise ValueError("impact_type must be either 'MODIFY' or 'NO_IMPACT'")
-                
-            if not isinstance(result.get("impacted_test_cases", []), list):
-                raise ValueError("impacted_test_cases must be a list")
-                
-            # If we have impacts, validate each test case
-            if result["has_impact"] and result["impact_type"] == "MODIFY":
-                for test_case in result["impacted_test_cases"]:
-                    if not isinstance(test_case.get("original_test_case_id"), str):
-                        raise ValueError("original_test_case_id must be a string")
-                    if not isinstance(test_case.get("modification_reason"), str):
-                        raise ValueError("modification_reason must be a string")
-                    if not isinstance(test_case.get("modified_test_case"), dict):
-                        raise ValueError("modified_test_case must be an object")
-                        
-                    modified = test_case["modified_test_case"]
-                    if not all(isinstance(modified.get(field), str) for field in ["id", "title", "expected_result"]):
-                        raise ValueError("modified_test_case fields must be strings")
-                    if not isinstance(modified.get("steps"), list):
-                        raise ValueError("steps must be a list")
-                    if modified.get("priority") not in ["High", "Medium", "Low"]:
-                        raise ValueError("priority must be High, Medium, or Low")
-            
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Invalid JSON structure: {str(e)}")
-            logger.error(f"Raw content: {content[:500]}")  # Log first 500 chars of content
-            raise LLMError("Invalid JSON response from LLM")
-        except ValueError as e:
+            with track_stage("json_parse", project_id):
+                return IMPACT_VERDICT.parse(response.content)
+        except SchemaViolation as e:
             logger.error(f"Invalid response format: {str(e)}")
-            logger.error(f"Parsed content: {json.dumps(result, indent=2)}")
+            logger.error(f"Raw content: {response.content[:500]}")  # Log first 500 chars of content
+            IMPACT_VERDICT.evict_cached(llm_ref, structured_prompt)
             raise LLMError(f"Invalid response format: {str(e)}")
             
     except Exception as e:
         logger.error(f"LLM processing error: {str(e)}")
         raise LLMError(f"LLM processing error: {str(e)}")
 
+def update_impact_counters(
+    cur,
+    project_id: str,
+    new_story_id: str,
+    existing_story_id: str,
+    severity_counts: Dict[str, int],
+    impact_time: datetime
+) -> None:
+    """
+    Increment story_impact_counters and project_impact_summary for a batch of
+    newly stored impacts in a single statement. Must run on the cursor that
+    inserted the impacts so the counters commit or roll back together with them.
+    The counters only ever grow; after impacts are deactivated or deleted
+    outside this module, run app/scripts/rebuild_impact_counters.py.
+    """
+    impacts_stored = sum(severity_counts.values())
+    if impacts_stored == 0:
+        return
+
+    high = severity_counts.get("high", 0)
+    medium = severity_counts.get("medium", 0)
+    low = severity_counts.get("low", 0)
+
+    # Both story rows go through one upsert in story_id order: two analyses of
+    # the same pair in opposite directions then lock them in the same order
+    # instead of deadlocking
+    cur.execute("""
+        WITH upserted AS (
+            INSERT INTO story_impact_counters (
+                project_id, story_id, impacted_by_count, impacts_caused_count,
+                high_severity_count, medium_severity_count, low_severity_count, last_impact_on
+            )
+            SELECT %(project_id)s, story_id, impacted_by, caused, high, medium, low, %(impact_time)s
+            FROM (VALUES
+                -- The existing story received the impacts
+                (%(existing_story_id)s, %(total)s, 0, %(high)s, %(medium)s, %(low)s),
+                -- The new story caused them
+                (%(new_story_id)s, 0, %(total)s, 0, 0, 0)
+            ) AS counts (story_id, impacted_by, caused, high, medium, low)
+            ORDER BY story_id
+            ON CONFLICT (project_id, story_id) DO UPDATE SET
+                impacted_by_count = story_impact_counters.impacted_by_count + EXCLUDED.impacted_by_count,
+                impacts_caused_count = story_impact_counters.impacts_caused_count + EXCLUDED.impacts_caused_count,
+                high_severity_count = story_impact_counters.high_severity_count + EXCLUDED.high_severity_count,
+                medium_severity_count = story_impact_counters.medium_severity_count + EXCLUDED.medium_severity_count,
+                low_severity_count = story_impact_counters.low_severity_count + EXCLUDED.low_severity_count,
+                last_impact_on = GREATEST(story_impact_counters.last_impact_on, EXCLUDED.last_impact_on)
+            RETURNING (xmax = 0) AS inserted
+        )
+        INSERT INTO project_impact_summary (
+            project_id, total_impacts, stories_with_impacts,
+            high_severity_count, medium_severity_count, low_severity_count, last_impact_on
+        ) VALUES (
+            %(project_id)s,
+            %(total)s,
+            (SELECT COUNT(*) FROM upserted WHERE inserted),
+            %(high)s, %(medium)s, %(low)s,
+            %(impact_time)s
+        )
+        ON CONFLICT (project_id) DO UPDATE SET
+            total_impacts = project_impact_summary.total_impacts + EXCLUDED.total_impacts,
+            stories_with_impacts = project_impact_summary.stories_with_impacts + EXCLUDED.stories_with_impacts,
+            high_severity_count = project_impact_summary.high_severity_count + EXCLUDED.high_severity_count,
+            medium_severity_count = project_impact_summary.medium_severity_count + EXCLUDED.medium_severity_count,
+            low_severity_count = project_impact_summary.low_severity_count + EXCLUDED.low_severity_count,
+            last_impact_on = GREATEST(project_impact_summary.last_impact_on, EXCLUDED.last_impact_on)
+    """, {
+        "project_id": project_id,
+        "existing_story_id": existing_story_id,
+        "new_story_id": new_story_id,
+        "total": impacts_stored,
+        "high": high,
+        "medium": medium,
+        "low": low,
+        "impact_time": impact_time
+    })
+
+@timed_query("store_impact_analysis")
 def store_impact_analysis(
     impact_data: Dict,
     project_id: str,
@@ -217,56 +301,67 @@ def store_impact_analysis(
     similarity_score: float
 ) -> int:
     """
-    Store impact analysis results in the database with enhanced tracking
+    Store impact analysis results in the database with enhanced tracking.
+
+    All impacts of the batch are written with a single multi-row INSERT.
+    Modification numbers come from the numeric maximum of impact_version and
+    the existing "-mod-N" suffix per original test case, so mod-10 correctly
+    follows mod-9. A transaction-scoped advisory lock per original test case
+    keeps concurrent pair analyses from taking the same number.
     """
+    impacts = impact_data.get("impacted_test_cases", [])
+    if not impacts:
+        return 0
+
+    conn = None
     try:
         db_service = get_db_service()
         conn = psycopg2.connect(**db_service.postgres_config)
-        impacts_stored = 0
-        
+        severity_counts = {"high": 0, "medium": 0, "low": 0}
+        original_test_case_ids = sorted({impact["original_test_case_id"] for impact in impacts})
+
         with conn:
             with conn.cursor() as cur:
-                # First get the run_id for the original story
+                # Serialize numbering per original test case until commit; locks
+                # are taken in sorted order so two batches cannot deadlock
+                for original_test_case_id in original_test_case_ids:
+                    cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (original_test_case_id,))
+
+                # Get the run_id for the original story and the latest modification
+                # number of every impacted test case in one round trip
                 cur.execute("""
-                    SELECT run_id FROM test_cases 
-                    WHERE story_id = %s
-                """, (existing_story_id,))
-                result = cur.fetchone()
-                if not result:
+                    SELECT
+                        (SELECT run_id FROM test_cases WHERE story_id = %s) AS run_id,
+                        COALESCE(jsonb_object_agg(original_test_case_id, last_mod)
+                                 FILTER (WHERE original_test_case_id IS NOT NULL), '{}'::jsonb)
+                    FROM (
+                        SELECT
+                            original_test_case_id,
+                            GREATEST(
+                                MAX(impact_version),
+                                MAX(substring(modified_test_case_id FROM '-mod-([0-9]+)$')::int)
+                            ) AS last_mod
+                        FROM test_case_impacts
+                        WHERE original_test_case_id = ANY(%s)
+                        AND impact_status = 'active'
+                        GROUP BY original_test_case_id
+                    ) AS mods
+                """, (existing_story_id, original_test_case_ids))
+                original_run_id, last_mods = cur.fetchone()
+                if not original_run_id:
                     raise DatabaseError(f"Could not find run_id for story {existing_story_id}")
-                original_run_id = result[0]
-                
+                last_mods = dict(last_mods or {})
+
                 # Get the current timestamp
                 current_time = datetime.now()
-                
-                for impact in impact_data.get("impacted_test_cases", []):
-                    # Get the original test case ID
+                rows = []
+
+                for impact in impacts:
+                    # Get the original test case ID and its next modification number
                     original_test_case_id = impact["original_test_case_id"]
-                    
-                    # Find the next modification number for this test case
-                    cur.execute("""
-                        SELECT modified_test_case_id 
-                        FROM test_case_impacts 
-                        WHERE original_test_case_id = %s 
-                        AND impact_status = 'active'
-                        ORDER BY modified_test_case_id DESC
-                        LIMIT 1
-                    """, (original_test_case_id,))
-                    last_mod = cur.fetchone()
-                    
-                    # Determine the next modification number
-                    if last_mod and last_mod[0]:
-                        last_mod_id = last_mod[0]
-                        if "-mod-" in last_mod_id:
-                            try:
-                                mod_num = int(last_mod_id.split("-mod-")[1]) + 1
-                            except:
-                                mod_num = 1
-                        else:
-                            mod_num = 1
-                    else:
-                        mod_num = 1
-                        
+                    mod_num = int(last_mods.get(original_test_case_id) or 0) + 1
+                    last_mods[original_test_case_id] = mod_num
+
                     # Create the modified test case ID
                     modified_test_case_id = f"{original_test_case_id}-mod-{mod_num}"
                     
@@ -283,6 +378,9 @@ def store_impact_analysis(
                         "medium": 3,
                         "low": 1
                     }.get(severity, 3)
+                    if severity not in severity_counts:
+                        severity = "medium"
+                    severity_counts[severity] += 1
                     
                     # Store impact details
                     impact_details = {
@@ -294,31 +392,8 @@ def store_impact_analysis(
                             "expected_result": impact["modified_test_case"]["expected_result"]
                         }
                     }
-                    
-                    # Insert into test_case_impacts
-                    cur.execute("""
-                        INSERT INTO test_case_impacts (
-                            impact_id,
-                            project_id,
-                            new_story_id,
-                            original_story_id,
-                            original_test_case_id,
-                            modified_test_case_id,
-                            original_run_id,
-                            impact_created_on,
-                            source,
-                            similarity_score,
-                            impact_analysis_json,
-                            impact_status,
-                            impact_type,
-                            impact_severity,
-                            impact_priority,
-                            impact_details
-                        ) VALUES (
-                            %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s
-                        )
-                        RETURNING impact_id
-                    """, (
+
+                    rows.append((
                         str(uuid.uuid4()),  # impact_id
                         project_id,
                         new_story_id,
@@ -334,32 +409,62 @@ def store_impact_analysis(
                         'modification',  # Default type for now
                         severity,
                         priority,
-                        json.dumps(impact_details)
+                        json.dumps(impact_details),
+                        mod_num
                     ))
-                    
-                    impacts_stored += 1
-                
-                if impacts_stored > 0:
-                    # Update the test_cases table with project-specific impact information
-                    cur.execute("""
-                        WITH impact_counts AS (
-                            SELECT 
-                                COUNT(DISTINCT original_test_case_id) as impacted_count
-                            FROM test_case_impacts
-                            WHERE original_story_id = %s
-                            AND project_id = %s
-                            AND impact_status = 'active'
-                        )
-                        UPDATE test_cases 
-                        SET 
-                            impacted_test_cases_count = impact_counts.impacted_count,
-                            last_impact_update_time = %s,
-                            has_impacts = (impact_counts.impacted_count > 0)
-                        FROM impact_counts
-                        WHERE story_id = %s
-                    """, (existing_story_id, project_id, current_time, existing_story_id))
-                
-                conn.commit()
+
+                # Insert all impacts into test_case_impacts at once
+                psycopg2.extras.execute_values(cur, """
+                    INSERT INTO test_case_impacts (
+                        impact_id,
+                        project_id,
+                        new_story_id,
+                        original_story_id,
+                        original_test_case_id,
+                        modified_test_case_id,
+                        original_run_id,
+                        impact_created_on,
+                        source,
+                        similarity_score,
+                        impact_analysis_json,
+                        impact_status,
+                        impact_type,
+                        impact_severity,
+                        impact_priority,
+                        impact_details,
+                        impact_version
+                    ) VALUES %s
+                """, rows, page_size=max(len(rows), 1))
+                impacts_stored = len(rows)
+
+                # Update the test_cases table with project-specific impact information
+                cur.execute("""
+                    WITH impact_counts AS (
+                        SELECT 
+                            COUNT(DISTINCT original_test_case_id) as impacted_count
+                        FROM test_case_impacts
+                        WHERE original_story_id = %s
+                        AND project_id = %s
+                        AND impact_status = 'active'
+                    )
+                    UPDATE test_cases 
+                    SET 
+                        impacted_test_cases_count = impact_counts.impacted_count,
+                        last_impact_update_time = %s,
+                        has_impacts = (impact_counts.impacted_count > 0)
+                    FROM impact_counts
+                    WHERE story_id = %s
+                """, (existing_story_id, project_id, current_time, existing_story_id))
+
+                # Keep the pre-aggregated summary counters in the same transaction
+                update_impact_counters(
+                    cur,
+                    project_id=project_id,
+                    new_story_id=new_story_id,
+                    existing_story_id=existing_story_id,
+                    severity_counts=severity_counts,
+                    impact_time=current_time
+                )
                 
         return impacts_stored
                 
@@ -370,7 +475,201 @@ def store_impact_analysis(
         if conn:
             conn.close()
 
-def analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story_id: str = None, similarity_score: float = None, llm_ref=None):
+@timed_query("get_decided_pairs")
+def get_decided_pairs(new_story_id: str, new_suite_hash: str, existing_suite_hashes: Dict[str, str]) -> set:
+    """
+    Return the existing story ids whose pair with the new story has already
+    been decided by the LLM for exactly these suite versions.
+    """
+    if not existing_suite_hashes:
+        return set()
+    conn = None
+    try:
+        conn = psycopg2.connect(**Config.postgres_config())
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT existing_story_id, existing_suite_hash
+                FROM impact_analysis_ledger
+                WHERE new_story_id = %s
+                AND new_suite_hash = %s
+                AND existing_story_id = ANY(%s)
+            """, (new_story_id, new_suite_hash, list(existing_suite_hashes.keys())))
+            return {
+                story_id for story_id, existing_hash in cur.fetchall()
+                if existing_suite_hashes.get(story_id) == existing_hash
+            }
+    except Exception as e:
+        logger.error(f"Error reading impact ledger for {new_story_id}: {str(e)}")
+        return set()
+    finally:
+        if conn:
+            conn.close()
+
+@timed_query("record_pair_verdict")
+def record_pair_verdict(
+    new_story_id: str,
+    new_suite_hash: str,
+    existing_story_id: str,
+    existing_suite_hash: str,
+    verdict: Dict,
+    impacts_stored: int
+) -> None:
+    """Record the LLM verdict for a story pair so unchanged pairs are not re-analyzed"""
+    conn = None
+    try:
+        conn = psycopg2.connect(**Config.postgres_config())
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO impact_analysis_ledger (
+                        new_story_id, new_suite_hash, existing_story_id, existing_suite_hash,
+                        has_impact, impacts_stored, verdict_json, analyzed_on
+                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (new_story_id, new_suite_hash, existing_story_id, existing_suite_hash)
+                    DO UPDATE SET
+                        has_impact = EXCLUDED.has_impact,
+                        impacts_stored = EXCLUDED.impacts_stored,
+                        verdict_json = EXCLUDED.verdict_json,
+                        analyzed_on = EXCLUDED.analyzed_on
+                """, (
+                    new_story_id, new_suite_hash, existing_story_id, existing_suite_hash,
+                    bool(verdict.get("has_impact")), impacts_stored, json.dumps(verdict), datetime.now()
+                ))
+    except Exception as e:
+        logger.error(f"Error recording impact verdict for {new_story_id} vs {existing_story_id}: {str(e)}")
+    finally:
+        if conn:
+            conn.close()
+
+class ImpactAnalysisContext:
+    """
+    Per-run state shared by every pair analyzed for one new story.
+
+    Loads the new story's and all candidates' test cases in a single query,
+    embeds the new suite once and serializes the prompt prefix (instructions,
+    new story and new test cases) once for reuse across pairs. Test cases are
+    packed compactly to fit Config.PROMPT_TOKEN_BUDGET_IMPACT: half of what the
+    fixed text leaves goes to the new suite, the rest to each existing suite.
+    """
+
+    def __init__(self, new_story_id: str, new_story: Dict, project_id: str, candidate_story_ids: List[str], token_budget: int = None):
+        self.new_story_id = new_story_id
+        self.project_id = project_id
+        self.token_budget = token_budget or Config.PROMPT_TOKEN_BUDGET_IMPACT
+
+        test_case_jsons = get_test_case_jsons_by_story_ids([new_story_id] + list(candidate_story_ids))
+        self.new_test_cases = test_case_jsons.pop(new_story_id, None)
+        self.existing_test_cases = test_case_jsons
+        # The new suite is already stored, so its impact calls are recorded against its run
+        self.new_run_id = get_run_id_by_story_id(new_story_id)
+
+        # Suite content hashes key the processed-pairs ledger
+        self.new_suite_hash = suite_hash(self.new_test_cases) if self.new_test_cases else None
+        self.existing_suite_hashes = {
+            story_id: suite_hash(test_case_json)
+            for story_id, test_case_json in self.existing_test_cases.items()
+        }
+
+        self.new_matrix = None
+        self.prompt_prefix = None
+        if self.new_test_cases:
+            new_cases = suite_test_cases(self.new_test_cases)
+            self.new_matrix = test_case_matrix(new_story_id, new_cases, project_id)
+
+            header = f"""{IMPACT_INSTRUCTIONS}
+
+NEW STORY ({new_story_id} - Project: {project_id}):
+{new_story.get('description', 'No description available')}
+
+NEW TEST CASES:
+"""
+            new_block, kept = pack_test_cases(new_cases, (self.token_budget - estimate_tokens(header)) // 2)
+            if kept < len(new_cases):
+                logger.info(f"Packed {kept}/{len(new_cases)} new test cases of {new_story_id} into the token budget")
+            self.prompt_prefix = f"{header}{new_block}\n"
+
+    def build_prompt(self, existing_story: Dict, existing_test_cases: Dict) -> str:
+        """Append one existing story, packed into the remaining budget, to the shared prefix"""
+        header = f"""
+ORIGINAL STORY ({existing_story['id']} - Project: {self.project_id}):
+{existing_story.get('description', 'No description available')}
+
+ORIGINAL TEST CASES:
+"""
+        remaining = self.token_budget - estimate_tokens(self.prompt_prefix) - estimate_tokens(header)
+        existing_block, _ = pack_test_cases(suite_test_cases(existing_test_cases), remaining)
+        return f"{self.prompt_prefix}{header}{existing_block}\n"
+
+def _analyze_story_pair(context: ImpactAnalysisContext, existing_story: Dict, llm_ref) -> int:
+    """
+    Analyze a single (new story, existing story) pair and store any impacts.
+    Failures are logged and isolated to the pair; returns the number of impacts stored.
+    """
+    new_story_id = context.new_story_id
+    project_id = context.project_id
+    try:
+        existing_test_cases = context.existing_test_cases.get(existing_story["id"])
+
+        if not context.new_test_cases or not existing_test_cases:
+            logger.warning(f"Missing test cases for comparison between {new_story_id} and {existing_story['id']}")
+            return 0
+
+        # Drop existing test cases with no close counterpart in the new suite
+        total_existing = len(existing_test_cases.get("test_cases", []))
+        existing_test_cases = filter_relevant_test_cases(
+            existing_story["id"], existing_test_cases, context.new_matrix, project_id=project_id
+        )
+        if existing_test_cases is None:
+            logger.info(f"No test cases of {existing_story['id']} are close to {new_story_id}; skipping LLM call")
+            return 0
+        logger.info(
+            f"Prompt for {new_story_id} vs {existing_story['id']} keeps "
+            f"{len(existing_test_cases.get('test_cases', []))}/{total_existing} original test cases"
+        )
+
+        # Prepare the prompt for impact analysis
+        prompt = context.build_prompt(existing_story, existing_test_cases)
+
+        logger.info(
+            f"Impact prompt for {new_story_id} vs {existing_story['id']}: "
+            f"~{estimate_tokens(prompt)} tokens ({len(prompt)} chars)"
+        )
+
+        # Get impact analysis from LLM
+        impact_analysis = get_llm_analysis(prompt, llm_ref, project_id, new_story_id, {"count": 0}, context.new_run_id)
+
+        impacts_stored = 0
+        if impact_analysis["has_impact"]:
+            # Store the impact analysis
+            impacts_stored = store_impact_analysis(
+                impact_data=impact_analysis,
+                project_id=project_id,
+                new_story_id=new_story_id,
+                existing_story_id=existing_story["id"],
+                similarity_score=existing_story.get("similarity_score") or 0.0
+            )
+            logger.info(f"Stored {impacts_stored} impacts for {existing_story['id']}")
+
+        # Only a verdict that was fully stored is recorded, so failures get retried
+        record_pair_verdict(
+            new_story_id, context.new_suite_hash,
+            existing_story["id"], context.existing_suite_hashes[existing_story["id"]],
+            impact_analysis, impacts_stored
+        )
+        return impacts_stored
+
+    except Exception as e:
+        logger.error(f"Error analyzing impacts between {new_story_id} and {existing_story['id']}: {str(e)}")
+        return 0
+
+def analyze_test_case_impacts(new_story_id: str, project_id: str, **kwargs) -> int:
+    """Run _analyze_test_case_impacts (same arguments), recorded as the impact_analysis stage"""
+    with track_stage("impact_analysis", project_id):
+        impacts_stored = _analyze_test_case_impacts(new_story_id, project_id, **kwargs)
+    IMPACTS_STORED.labels(project_id).inc(impacts_stored or 0)
+    return impacts_stored
+
+def _analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story_id: str = None, similarity_score: float = None, llm_ref=None, max_concurrency: int = MAX_CONCURRENT_ANALYSES, force: bool = False):
     """
     Analyze how a new story impacts existing test cases
     Args:
@@ -379,6 +678,10 @@ def analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story
         existing_story_id: Optional ID of specific story to analyze against
         similarity_score: Optional similarity score between the stories
         llm_ref: Optional LLM reference
+        max_concurrency: Maximum number of story pairs analyzed in parallel (1 runs serially)
+        force: Re-analyze pairs even if the ledger already holds a verdict for their current suites
+    Returns:
+        Total number of impacts stored
     """
     if llm_ref is None:
         llm_ref = Config.llm
@@ -401,13 +704,13 @@ def analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story
         # Check if new story has test cases
         if new_story_id not in generated_stories:
             logger.warning(f"New story {new_story_id} does not have test cases generated yet")
-            return
+            return 0
             
         # If analyzing specific story, check if it has test cases
         if existing_story_id:
             if existing_story_id not in generated_stories:
                 logger.warning(f"Existing story {existing_story_id} does not have test cases generated yet")
-                return
+                return 0
         
         # Get the new story's details
         new_story = db_service.get_story(new_story_id)
@@ -419,62 +722,62 @@ def analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story
             existing_story = db_service.get_story(existing_story_id)
             if not existing_story:
                 raise StoryNotFoundError(f"Existing story {existing_story_id} not found")
+            if similarity_score is None:
+                table = db_service.lance_db.open_table(Config.TABLE_NAME_LANCE)
+                vectors = get_story_vectors(table, [new_story_id, existing_story_id])
+                if new_story_id in vectors and existing_story_id in vectors:
+                    similarity_score = cosine_similarity(vectors[new_story_id], vectors[existing_story_id])
+            existing_story["similarity_score"] = similarity_score
             stories_to_analyze = [existing_story]
         else:
-            # Get all stories with test cases from the same project (excluding the new story)
-            stories_to_analyze = [
-                {"id": story_id} 
-                for story_id in generated_stories.keys() 
-                if story_id != new_story_id
-            ]
+            # Only analyze the most similar stories with test cases from the same project
+            stories_to_analyze = select_candidate_stories(
+                new_story_id,
+                project_id,
+                set(generated_stories.keys())
+            )
             
         logger.info(f"Analyzing impacts for {new_story_id} against {len(stories_to_analyze)} stories from project {project_id}")
-        
-        for existing_story in stories_to_analyze:
-            try:
-                # Get test cases for both stories
-                new_test_cases = get_test_case_json_by_story_id(new_story_id)
-                existing_test_cases = get_test_case_json_by_story_id(existing_story["id"])
-                
-                if not new_test_cases or not existing_test_cases:
-                    logger.warning(f"Missing test cases for comparison between {new_story_id} and {existing_story['id']}")
-                    continue
-                    
-                # Prepare the prompt for impact analysis
-                prompt = f"""
-                {IMPACT_INSTRUCTIONS}
-                
-                ORIGINAL STORY ({existing_story['id']} - Project: {project_id}):
-                {existing_story.get('description', 'No description available')}
-                
-                ORIGINAL TEST CASES:
-                {json.dumps(existing_test_cases, indent=2)}
-                
-                NEW STORY ({new_story_id} - Project: {project_id}):
-                {new_story.get('description', 'No description available')}
-                
-                NEW TEST CASES:
-                {json.dumps(new_test_cases, indent=2)}
-                """
-                    
-                # Get impact analysis from LLM
-                impact_analysis = get_llm_analysis(prompt, llm_ref)
-                    
-                if impact_analysis["has_impact"]:
-                    # Store the impact analysis
-                    impacts_stored = store_impact_analysis(
-                        impact_data=impact_analysis,
-                        project_id=project_id,
-                        new_story_id=new_story_id,
-                        existing_story_id=existing_story["id"],
-                        similarity_score=similarity_score if similarity_score is not None else 0.0
-                    )
-                    
-                    logger.info(f"Stored {impacts_stored} impacts for {existing_story['id']}")
-                    
-            except Exception as e:
-                logger.error(f"Error analyzing impacts between {new_story_id} and {existing_story['id']}: {str(e)}")
-                continue
+
+        if not stories_to_analyze:
+            return 0
+
+        # Bulk-load both sides once and embed the new suite before any worker starts
+        context = ImpactAnalysisContext(
+            new_story_id,
+            new_story,
+            project_id,
+            [story["id"] for story in stories_to_analyze]
+        )
+
+        # Skip pairs the LLM already decided for the current content of both suites
+        if not force and context.new_suite_hash:
+            decided = get_decided_pairs(new_story_id, context.new_suite_hash, context.existing_suite_hashes)
+            if decided:
+                logger.info(f"Skipping {len(decided)} already analyzed pairs for {new_story_id}")
+                stories_to_analyze = [story for story in stories_to_analyze if story["id"] not in decided]
+            if not stories_to_analyze:
+                return 0
+
+        max_concurrency = max(1, min(max_concurrency or 1, len(stories_to_analyze)))
+        total_impacts = 0
+
+        if max_concurrency == 1:
+            for existing_story in stories_to_analyze:
+                total_impacts += _analyze_story_pair(context, existing_story, llm_ref)
+            return total_impacts
+
+        # Run up to max_concurrency pair analyses in flight; every worker goes
+        # through the shared rate_limiter inside get_llm_analysis
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="impact") as executor:
+            futures = [
+                executor.submit(_analyze_story_pair, context, existing_story, llm_ref)
+                for existing_story in stories_to_analyze
+            ]
+            for future in as_completed(futures):
+                total_impacts += future.result()
+
+        return total_impacts
                 
     except Exception as e:
         logger.error(f"Error in impact analysis for {new_story_id}: {str(e)}")
@@ -483,4 +786,8 @@ def analyze_test_case_impacts(new_story_id: str, project_id: str, existing_story
         if 'conn' in locals():
             conn.close()
 
+async def analyze_test_case_impacts_async(new_story_id: str, project_id: str, **kwargs) -> int:
+    """Async wrapper that runs analyze_test_case_impacts off the event loop"""
+    return await asyncio.to_thread(analyze_test_case_impacts, new_story_id, project_id, **kwargs)
+
 # ... rest of the file ... 
\ No newline at end of file
@@ -0,0 +1,124 @@
+import re
+import json
+from typing import Any, List, Optional
+
+
+class SalvageResult:
+    """Objects recovered from an LLM response and whether the array was complete"""
+
+    def __init__(self, items: List[Any], complete: bool, skipped: int):
+        self.items = items
+        self.complete = complete
+        self.skipped = skipped
+
+    def summary(self) -> dict:
+        return {"complete": self.complete, "salvaged": len(self.items), "skipped": self.skipped}
+
+
+# A fence opening (```json, ```) at the very start or closing at the very end of a response
+_LEADING_FENCE = re.compile(r"^```[\w-]*[ \t]*")
+_TRAILING_FENCE = re.compile(r"```$")
+
+
+def strip_code_fences(text: str) -> str:
+    """
+    Drop the markdown code fence wrapping a JSON payload. Only a fence at
+    the start or end of the response is removed, so ``` inside string
+    values (e.g. a step quoting markdown) is left intact.
+    """
+    text = _LEADING_FENCE.sub("", (text or "").strip(), count=1)
+    return _TRAILING_FENCE.sub("", text.rstrip(), count=1).strip()
+
+
+def _object_end(text: str, start: int) -> Optional[int]:
+    """
+    Index just past the object opening at text[start] ('{'), or None when the
+    text ends first (a truncated response). String contents and escapes are
+    respected, so braces inside values do not count.
+    """
+    depth = 0
+    in_string = False
+    escaped = False
+    for i in range(start, len(text)):
+        char = text[i]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return None
+
+
+def salvage_json_array(text: str, key: str) -> SalvageResult:
+    """
+    Recover every complete object of the array stored under key in a JSON
+    response, e.g. {"test_cases": [...]}.
+
+    A well-formed response is parsed as is. Otherwise the array is walked one
+    object at a time: objects that fail to parse are skipped, and a response
+    cut off mid-object keeps everything before the cut. complete is True only
+    when the array was closed and every element parsed.
+    """
+    text = strip_code_fences(text)
+    decoder = json.JSONDecoder()
+
+    start = text.find("{")
+    if start != -1:
+        try:
+            data, _ = decoder.raw_decode(text, start)
+            if isinstance(data, dict) and isinstance(data.get(key), list):
+                items = [item for item in data[key] if isinstance(item, dict)]
+                skipped = len(data[key]) - len(items)
+                return SalvageResult(items, skipped == 0, skipped)
+        except ValueError:
+            pass
+
+    match = re.search(r'"%s"\s*:\s*\[' % re.escape(key), text)
+    if match:
+        pos = match.end()
+    else:
+        bracket = text.find("[")
+        if bracket == -1:
+            return SalvageResult([], False, 0)
+        pos = bracket + 1
+
+    items = []
+    skipped = 0
+    closed = False
+    while pos < len(text):
+        char = text[pos]
+        if char in " \t\r\n,":
+            pos += 1
+            continue
+        if char == "]":
+            closed = True
+            break
+        if char != "{":
+            # Stray text between elements: resume at the next object
+            next_object = text.find("{", pos)
+            if next_object == -1:
+                break
+            skipped += 1
+            pos = next_object
+            continue
+
+        end = _object_end(text, pos)
+        if end is None:
+            break
+        try:
+            items.append(json.loads(text[pos:end]))
+        except ValueError:
+            skipped += 1
+        pos = end
+
+    return SalvageResult(items, closed and skipped == 0, skipped)
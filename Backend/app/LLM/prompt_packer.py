@@ -0,0 +1,68 @@
+import json
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+# Fields of a test case that carry information for the LLM; suite-level
+# metadata (storyID, generated_on, total_test_cases, ...) is dropped
+TEST_CASE_FIELDS = ("id", "title", "steps", "expected_result", "priority")
+
+# Rough characters-per-token ratio for Gemini on English/JSON text
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate used for budgeting prompts"""
+    if not text:
+        return 0
+    return max(1, (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN)
+
+
+def compact_test_case(test_case: Dict, keep_id: bool = True) -> Dict:
+    """Keep only the fields of a test case the LLM needs"""
+    fields = TEST_CASE_FIELDS if keep_id else TEST_CASE_FIELDS[1:]
+    return {field: test_case[field] for field in fields if test_case.get(field) not in (None, "", [])}
+
+
+def serialize_compact(value) -> str:
+    """JSON without indentation or padding whitespace"""
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def pack_test_cases(test_cases: List[Dict], token_budget: Optional[int] = None, keep_id: bool = True) -> Tuple[str, int]:
+    """
+    Serialize test cases as a compact JSON array that fits token_budget.
+
+    test_cases must already be ordered by relevance (most relevant first);
+    the least relevant tail is dropped once the budget is reached. Returns
+    the serialized array and the number of test cases kept.
+    """
+    pieces = []
+    used = 2  # the surrounding brackets
+    for test_case in test_cases:
+        piece = serialize_compact(compact_test_case(test_case, keep_id=keep_id))
+        cost = estimate_tokens(piece) + 1
+        if token_budget is not None and pieces and used + cost > token_budget:
+            break
+        pieces.append(piece)
+        used += cost
+    return "[" + ",".join(pieces) + "]", len(pieces)
+
+
+def suite_test_cases(test_case_json) -> List[Dict]:
+    """Return the test case list of a stored suite (dict or JSON string)"""
+    if isinstance(test_case_json, str):
+        try:
+            test_case_json = json.loads(test_case_json)
+        except ValueError:
+            return []
+    if isinstance(test_case_json, dict):
+        return test_case_json.get("test_cases", []) or []
+    if isinstance(test_case_json, list):
+        return test_case_json
+    return []
+
+
+def suite_hash(test_case_json) -> str:
+    """Content hash of a suite's test cases, insensitive to suite metadata and formatting"""
+    cases = [compact_test_case(tc) for tc in suite_test_cases(test_case_json)]
+    return hashlib.sha256(serialize_compact(cases).encode("utf-8")).hexdigest()
@@ -0,0 +1,229 @@
+import json
+import threading
+from typing import Any, Callable, Dict, List
+
+from app.utils.llm_cache import evict_cached, is_cached
+
+from .json_salvage import strip_code_fences
+
+# Validator returned by compile_schema: value -> list of error messages (empty when valid)
+Validator = Callable[[Any], List[str]]
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "integer": int,
+    "number": (int, float)
+}
+
+
+class SchemaViolation(ValueError):
+    """A model response that does not conform to its schema"""
+
+    def __init__(self, name: str, errors: List[str]):
+        super().__init__(f"{name} response violates schema: {'; '.join(errors[:5])}")
+        self.errors = errors
+
+
+def compile_schema(schema: Dict[str, Any], path: str = "$") -> Validator:
+    """
+    Compile the JSON Schema subset used by our prompts (type, enum, required,
+    properties, items, minItems) into a validator. The schema is walked once
+    here instead of on every response.
+    """
+    checks = []
+
+    if "type" in schema:
+        expected = _TYPES[schema["type"]]
+        type_name = schema["type"]
+
+        def check_type(value):
+            # bool is an int subclass; keep true/false out of numeric fields
+            if isinstance(value, bool) and type_name != "boolean":
+                return [f"{path} must be {type_name}"]
+            return [] if isinstance(value, expected) else [f"{path} must be {type_name}"]
+        checks.append(check_type)
+
+    if "enum" in schema:
+        allowed = list(schema["enum"])
+        checks.append(lambda value: [] if value in allowed else [f"{path} must be one of {allowed}"])
+
+    if "required" in schema:
+        required = list(schema["required"])
+        checks.append(lambda value: [
+            f"{path}.{field} is required" for field in required
+            if isinstance(value, dict) and field not in value
+        ])
+
+    if "properties" in schema:
+        properties = {
+            field: compile_schema(sub_schema, f"{path}.{field}")
+            for field, sub_schema in schema["properties"].items()
+        }
+
+        def check_properties(value):
+            if not isinstance(value, dict):
+                return []
+            errors = []
+            for field, validate in properties.items():
+                if field in value:
+                    errors.extend(validate(value[field]))
+            return errors
+        checks.append(check_properties)
+
+    if "minItems" in schema:
+        min_items = schema["minItems"]
+        checks.append(lambda value: [] if not isinstance(value, list) or len(value) >= min_items
+                      else [f"{path} needs at least {min_items} items"])
+
+    if "items" in schema:
+        validate_item = compile_schema(schema["items"], f"{path}[]")
+        checks.append(lambda value: [
+            error for item in (value if isinstance(value, list) else []) for error in validate_item(item)
+        ])
+
+    def validate(value):
+        errors = []
+        for check in checks:
+            errors.extend(check(value))
+            # Nested checks assume the type check passed
+            if errors and check is checks[0] and "type" in schema:
+                return errors
+        return errors
+    return validate
+
+
+class StructuredOutput:
+    """
+    One response format shared by the prompt, the client and the parser.
+
+    The schema is rendered into the prompt, passed to clients that accept a
+    response schema natively (supports_response_schema), and checked by a
+    single compiled validator. Every parsed attempt is counted, so stats()
+    gives the share of responses that forced a retry.
+    """
+
+    def __init__(self, name: str, schema: Dict[str, Any]):
+        self.name = name
+        self.schema = schema
+        self.validate = compile_schema(schema)
+        self._lock = threading.Lock()
+        self._attempts = 0
+        self._invalid = 0
+
+    def instructions(self) -> str:
+        return (
+            "CRITICAL: Your response MUST be a single JSON object that conforms to this JSON Schema:\n"
+            f"{json.dumps(self.schema, indent=2)}\n\n"
+            "Do not include any explanatory text before or after the JSON.\n"
+            "Do not use markdown code blocks.\n"
+            "Just return the raw JSON object."
+        )
+
+    def invoke_kwargs(self, llm) -> Dict[str, Any]:
+        """Keyword arguments invoke passes to llm: the schema, when the client supports it"""
+        if getattr(llm, "supports_response_schema", False):
+            return {"response_schema": self.schema}
+        return {}
+
+    def invoke(self, llm, prompt: str):
+        """Call llm with prompt, handing it the schema when the client supports it"""
+        return llm.invoke(prompt, **self.invoke_kwargs(llm))
+
+    def is_cached(self, llm, prompt: str) -> bool:
+        """True when invoke(llm, prompt) will be answered by the response cache"""
+        return is_cached(llm, prompt, **self.invoke_kwargs(llm))
+
+    def evict_cached(self, llm, prompt: str) -> None:
+        """Forget the cached response to invoke(llm, prompt)"""
+        evict_cached(llm, prompt, **self.invoke_kwargs(llm))
+
+    def parse(self, text: str) -> Dict[str, Any]:
+        """Decode the first JSON object in text and validate it; raises SchemaViolation"""
+        text = strip_code_fences(text)
+        start = text.find("{")
+        if start == -1:
+            self.record(False)
+            raise SchemaViolation(self.name, ["no JSON object in response"])
+        try:
+            value, _ = json.JSONDecoder().raw_decode(text, start)
+        except ValueError as e:
+            self.record(False)
+            raise SchemaViolation(self.name, [f"invalid JSON: {e}"])
+        errors = self.validate(value)
+        self.record(not errors)
+        if errors:
+            raise SchemaViolation(self.name, errors)
+        return value
+
+    def record(self, valid: bool) -> None:
+        with self._lock:
+            self._attempts += 1
+            if not valid:
+                self._invalid += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            attempts, invalid = self._attempts, self._invalid
+        return {
+            "attempts": attempts,
+            "invalid": invalid,
+            "retry_rate": round(invalid / attempts, 4) if attempts else 0.0
+        }
+
+
+TEST_CASE_SCHEMA = {
+    "type": "object",
+    "required": ["title", "steps", "expected_result", "priority"],
+    "properties": {
+        "id": {"type": "string"},
+        "category": {"type": "string"},
+        "title": {"type": "string"},
+        "steps": {"type": "array", "minItems": 1, "items": {"type": "string"}},
+        "expected_result": {"type": "string"},
+        "priority": {"type": "string", "enum": ["High", "Medium", "Low"]}
+    }
+}
+
+TEST_CASE_BATCH = StructuredOutput("test_case_batch", {
+    "type": "object",
+    "required": ["test_cases"],
+    "properties": {
+        "test_cases": {"type": "array", "items": TEST_CASE_SCHEMA}
+    }
+})
+
+# Test cases are salvaged one by one from batch responses, so they are also checked on their own
+validate_test_case = compile_schema(TEST_CASE_SCHEMA)
+
+IMPACT_VERDICT = StructuredOutput("impact_verdict", {
+    "type": "object",
+    "required": ["has_impact", "impact_type", "impacted_test_cases"],
+    "properties": {
+        "has_impact": {"type": "boolean"},
+        "impact_type": {"type": "string", "enum": ["MODIFY", "NO_IMPACT"]},
+        "impacted_test_cases": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": [
+                    "original_test_case_id", "modification_reason", "impact_severity", "severity_reason", "modified_test_case"
+                ],
+                "properties": {
+                    "original_test_case_id": {"type": "string"},
+                    "modification_reason": {"type": "string"},
+                    "impact_severity": {"type": "string", "enum": ["high", "medium", "low"]},
+                    "severity_reason": {"type": "string"},
+                    "modified_test_case": {**TEST_CASE_SCHEMA, "required": ["id"] + TEST_CASE_SCHEMA["required"]}
+                }
+            }
+        }
+    }
+})
+
+
+def structured_output_stats() -> Dict[str, Dict[str, Any]]:
+    """Attempt and retry counts of every response format in this process"""
+    return {output.name: output.stats() for output in (TEST_CASE_BATCH, IMPACT_VERDICT)}
@@ -35,4 +35,17 @@ def create_app():
     from app.routes.stories import stories_bp
     app.register_blueprint(stories_bp, url_prefix='/api/stories')
 
+    from app.routes.jobs import jobs_bp
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+
+    from app.routes.usage import usage_bp
+    app.register_blueprint(usage_bp, url_prefix='/api/usage')
+
+    # Prometheus scrape endpoint for the stage, LLM and query metrics
+    from app.utils.metrics import metrics_response
+
+    @app.route('/metrics')
+    def metrics():
+        return metrics_response()
+
     return app 
\ No newline at end of file
@@ -1,18 +1,51 @@
 import os
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from langchain_google_genai import ChatGoogleGenerativeAI
 import psycopg2
+from app.utils.llm_cache import CachedLLM
+from app.utils.fake_models import FakeChatModel, FakeEmbeddingModel
 
 load_dotenv()
 
-EMBEDDING_MODEL = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+# gemini calls Google; fake answers locally (see app.utils.fake_models) for benchmarks and offline runs
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+# sentence-transformers or fake (hashed bag-of-words vectors, needs no model download)
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "sentence-transformers").lower()
+# Seeds every randomized choice (category counts, fake model output); unset keeps runs random
+PIPELINE_SEED = int(os.environ["PIPELINE_SEED"]) if os.getenv("PIPELINE_SEED") else None
 
-llm = ChatGoogleGenerativeAI(
-    model="models/gemini-2.0-flash",
-    temperature=0.3,
-    google_api_key=os.environ["GOOGLE_API_KEY"]
-)
+if EMBEDDING_BACKEND == "fake":
+    EMBEDDING_MODEL = FakeEmbeddingModel()
+else:
+    from sentence_transformers import SentenceTransformer
+    EMBEDDING_MODEL = SentenceTransformer("sentence-transformers/all-mpnet-base-v2")
+
+LLM_MODEL = "models/gemini-2.0-flash" if LLM_BACKEND != "fake" else "fake"
+LLM_TEMPERATURE = 0.3
+
+
+def build_llm(api_key_env: str = "GOOGLE_API_KEY"):
+    """Chat model for the configured LLM_BACKEND, wrapped in the response cache (see LLM_CACHE_MODE)"""
+    if LLM_BACKEND == "fake":
+        client = FakeChatModel(
+            seed=PIPELINE_SEED,
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+            latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5")),
+            failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+            malformed_rate=float(os.getenv("FAKE_LLM_MALFORMED_RATE", "0"))
+        )
+    elif LLM_BACKEND == "gemini":
+        from langchain_google_genai import ChatGoogleGenerativeAI
+        client = ChatGoogleGenerativeAI(
+            model=LLM_MODEL,
+            temperature=LLM_TEMPERATURE,
+            google_api_key=os.environ.get(api_key_env) or os.environ["GOOGLE_API_KEY"]
+        )
+    else:
+        raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
+    return CachedLLM(client, model=LLM_MODEL, temperature=LLM_TEMPERATURE)
+
+
+llm = build_llm()
 
 class Config:
     # Database configurations
@@ -24,17 +57,15 @@ class Config:
     
     LANCE_DB_PATH = os.getenv('LANCE_DB_PATH', './data/lance_db')
     TABLE_NAME_LANCE = os.getenv('TABLE_NAME_LANCE', 'user_stories')
+    TABLE_NAME_LANCE_TEST_CASES = os.getenv('TABLE_NAME_LANCE_TEST_CASES', f"{TABLE_NAME_LANCE}_test_cases")
     EMBEDDING_MODEL = EMBEDDING_MODEL
+    PIPELINE_SEED = PIPELINE_SEED
 
     # Original LLM instance
     llm = llm
 
     # Additional LLM for impact analysis
-    llm_impact = ChatGoogleGenerativeAI(
-        model="models/gemini-2.0-flash",
-        temperature=0.3,
-        google_api_key=os.environ.get("GOOGLE_API_KEY_IMPACT", os.environ["GOOGLE_API_KEY"])
-    )
+    llm_impact = build_llm("GOOGLE_API_KEY_IMPACT")
 
     # Test case generation configuration
     TEST_CASE_COUNTS = {
@@ -45,6 +76,13 @@ class Config:
         "performance": int(os.getenv('TEST_CASE_COUNT_PERFORMANCE', '10'))  # Performance tests
     }
     
+    # Prompt token budgets used when packing test case context
+    PROMPT_TOKEN_BUDGET_IMPACT = int(os.getenv('PROMPT_TOKEN_BUDGET_IMPACT', '12000'))
+    PROMPT_TOKEN_BUDGET_RAG = int(os.getenv('PROMPT_TOKEN_BUDGET_RAG', '6000'))
+
+    # Hand pipeline work to the Postgres job queue (drained by worker.py) instead of running it inline
+    USE_JOB_QUEUE = os.getenv('USE_JOB_QUEUE', 'false').lower() == 'true'
+    
     @classmethod
     def get_postgres_connection(cls):
         return psycopg2.connect(
@@ -3,6 +3,10 @@ import os
 import shutil
 from app.datapipeline.text_extractor import extract_text
 from app.models.create_dbs import create_LanceDB
+from app.utils.rate_limiter import get_bucket
+from app.utils.llm_cache import is_cached
+from app.utils.lance_util import lance_literal
+from app.utils.metrics import track_llm, track_stage, wait_for_quota
 import lancedb
 from datetime import datetime
 
@@ -17,29 +21,53 @@ except Exception as e:
     print(f"❌ Error opening table: {e}")
     table=create_LanceDB()
 
-def summarize_in_chunks(text, chunk_size=4000):
+def summarize_in_chunks(text, chunk_size=4000, project_id="", story_id=None):
     try:
-        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-        summaries = []
-        for chunk in chunks[:3]:  # Limit to 3 chunks for efficiency
-            prompt = (
-                "Summarize the following document section in 1 sentence:\n\n" + chunk
-            )
-            try:
-                response = llm.invoke(prompt)
-                summaries.append(response.content.strip())
-            except Exception as e:
-                summaries.append("[Summary failed for a chunk]")
-                print(f"❌ LLM failed on a chunk: {e}")
-        return " ".join(summaries)
+        with track_stage("summarize", project_id):
+            chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+            summaries = []
+            for chunk in chunks[:3]:  # Limit to 3 chunks for efficiency
+                prompt = (
+                    "Summarize the following document section in 1 sentence:\n\n" + chunk
+                )
+                try:
+                    cached = is_cached(llm, prompt)
+                    if not cached:
+                        wait_for_quota(get_bucket("summary"), project_id)
+                    with track_llm("summary", project_id, story_id) as call:
+                        call["prompt"] = prompt
+                        if cached:
+                            call["outcome"] = "cache_hit"
+                        response = call["response"] = llm.invoke(prompt)
+                    summaries.append(response.content.strip())
+                except Exception as e:
+                    summaries.append("[Summary failed for a chunk]")
+                    print(f"❌ LLM failed on a chunk: {e}")
+            return " ".join(summaries)
     except Exception as e:
         print(f"❌ LLM summary failed: {e}")
         return "Summary could not be generated."
     
+def add_story_to_lance(project_id, story_id, story_description, text, embedding, filename, original_path, source):
+    """Append one embedded story row to the LanceDB stories table"""
+    with track_stage("lance_add", project_id):
+        table.add([{
+            "project_id": project_id,
+            "vector": embedding,
+            "storyID": story_id,
+            "storyDescription": story_description,
+            "test_case_content": "",
+            "filename": filename,
+            "original_path": original_path,
+            "doc_content_text": text,
+            "embedding_timestamp": datetime.now(),
+            "source": source
+        }])
+
 def story_id_exists(table, story_id):
+    """Whether a storyID is stored, scanning only the storyID column"""
     try:
-        result = table.to_pandas().query(f"storyID == '{story_id}'")
-        return not result.empty
+        return table.to_lance().count_rows(filter=f"storyID = {lance_literal(story_id)}") > 0
     except Exception:
         return False
 
@@ -78,7 +106,8 @@ def process_project_folder(project_folder_path, project_name):
         
         print(f"📄 Processing {file} in project {project_name}...")
 
-        text = extract_text(file_path)
+        with track_stage("extract", project_name):
+            text = extract_text(file_path)
 
         if not text:
             print(f"❌ Skipping {file} — couldn't extract text.")
@@ -95,10 +124,11 @@ def process_project_folder(project_folder_path, project_name):
                 files_failed += 1
                 continue
 
-            story_description = summarize_in_chunks(text)
+            story_description = summarize_in_chunks(text, project_id=project_name, story_id=story_id)
 
             try:
-                embedding = EMBEDDING_MODEL.encode(text).tolist()
+                with track_stage("embed", project_name):
+                    embedding = EMBEDDING_MODEL.encode(text).tolist()
             except Exception as e:
                 print(f"❌ Embedding generation failed for {file}: {e}")
                 shutil.move(file_path, os.path.join(project_failure_folder, file))
@@ -107,18 +137,7 @@ def process_project_folder(project_folder_path, project_name):
 
             print(f"🔢 Vector length: {len(embedding)} for {file}")
 
-            table.add([{
-                "project_id": project_name,
-                "vector": embedding,
-                "storyID": story_id,
-                "storyDescription": story_description,
-                "test_case_content": "",
-                "filename": file,
-                "original_path": file_path,
-                "doc_content_text": text,
-                "embedding_timestamp": datetime.now(),
-                "source": "file"
-            }])
+            add_story_to_lance(project_name, story_id, story_description, text, embedding, file, file_path, "file")
 
             shutil.move(file_path, os.path.join(project_success_folder, file))
             print(f"✅ Stored {file} in LanceDB and moved to {project_name}/success.")
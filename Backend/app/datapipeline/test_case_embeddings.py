@@ -0,0 +1,149 @@
+import os
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import lancedb
+import numpy as np
+
+from app.config import Config, EMBEDDING_MODEL
+from app.utils.lance_util import lance_literal
+from app.utils.metrics import track_stage
+
+# Minimum nearest-neighbour cosine similarity for a test case to be kept in an impact prompt
+TEST_CASE_SIMILARITY_THRESHOLD = 0.5
+# Cosine similarity above which two generated test cases of a story count as duplicates; 0 disables dedup
+DUPLICATE_SIMILARITY_THRESHOLD = float(os.getenv("DUPLICATE_SIMILARITY_THRESHOLD", "0.92"))
+
+
+def test_case_text(test_case: Dict) -> str:
+    """Flatten a test case into the text that gets embedded"""
+    steps = test_case.get("steps", [])
+    if isinstance(steps, list):
+        steps = " ".join(str(step) for step in steps)
+    return f"{test_case.get('title', '')}\n{steps}\n{test_case.get('expected_result', '')}"
+
+
+def _open_table():
+    db = lancedb.connect(Config.LANCE_DB_PATH)
+    try:
+        return db.open_table(Config.TABLE_NAME_LANCE_TEST_CASES)
+    except Exception:
+        from app.models.create_dbs import create_test_case_LanceDB
+        return create_test_case_LanceDB()
+
+
+def _encode(test_cases: List[Dict], project_id: str = "") -> np.ndarray:
+    texts = [test_case_text(tc) for tc in test_cases]
+    with track_stage("embed", project_id):
+        return np.asarray(
+            EMBEDDING_MODEL.encode(texts, normalize_embeddings=True),
+            dtype=np.float32
+        )
+
+
+def store_test_case_embeddings(story_id: str, project_id: str, test_cases: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Embed every test case of a story and replace its rows in the test case table.
+    Returns the vectors keyed by test case id.
+    """
+    test_cases = [tc for tc in test_cases if tc.get("id")]
+    if not test_cases:
+        return {}
+
+    vectors = _encode(test_cases, project_id)
+    table = _open_table()
+    table.delete(f"storyID = {lance_literal(story_id)}")
+
+    now = datetime.now()
+    with track_stage("lance_add", project_id):
+        table.add([
+            {
+                "project_id": project_id,
+                "storyID": story_id,
+                "test_case_id": tc["id"],
+                "vector": vector.tolist(),
+                "test_case_text": test_case_text(tc),
+                "embedding_timestamp": now
+            }
+            for tc, vector in zip(test_cases, vectors)
+        ])
+    return {tc["id"]: vector for tc, vector in zip(test_cases, vectors)}
+
+
+def get_test_case_vectors(story_id: str, test_cases: List[Dict], project_id: str = "") -> Dict[str, np.ndarray]:
+    """
+    Load the stored test case vectors of a story. Stories generated before the
+    test case table existed, or whose suite changed, are embedded on the fly;
+    a regenerated suite reuses the ids TC1..TCn, so the stored text of every
+    test case is compared, not just its id.
+    """
+    table = _open_table()
+    rows = table.to_lance().to_table(
+        columns=["test_case_id", "test_case_text", "vector"],
+        filter=f"storyID = {lance_literal(story_id)}"
+    ).to_pylist()
+    stored_texts = {row["test_case_id"]: row["test_case_text"] for row in rows}
+
+    if any(stored_texts.get(tc.get("id")) != test_case_text(tc) for tc in test_cases):
+        return store_test_case_embeddings(story_id, project_id, test_cases)
+    return {row["test_case_id"]: np.asarray(row["vector"], dtype=np.float32) for row in rows}
+
+
+def test_case_matrix(story_id: str, test_cases: List[Dict], project_id: str = "") -> np.ndarray:
+    """Stack the vectors of a story's test cases in suite order"""
+    test_cases = [tc for tc in test_cases if tc.get("id")]
+    if not test_cases:
+        return np.empty((0, 0), dtype=np.float32)
+    vectors = get_test_case_vectors(story_id, test_cases, project_id)
+    return np.vstack([vectors[tc["id"]] for tc in test_cases])
+
+
+def filter_relevant_test_cases(
+    existing_story_id: str,
+    existing_test_case_json: Dict,
+    new_matrix: np.ndarray,
+    project_id: str = "",
+    threshold: float = TEST_CASE_SIMILARITY_THRESHOLD
+) -> Optional[Dict]:
+    """
+    Keep only the existing test cases whose nearest neighbour among the new
+    story's test cases (new_matrix, see test_case_matrix) reaches the
+    similarity threshold.
+
+    Returns a copy of existing_test_case_json whose test_cases list holds the
+    kept test cases ordered by descending similarity, or None when no existing
+    test case is close enough to be impacted.
+    """
+    existing_cases = [tc for tc in existing_test_case_json.get("test_cases", []) if tc.get("id")]
+    if not existing_cases or new_matrix.size == 0:
+        return existing_test_case_json
+
+    # Vectors are stored normalized, so the dot product is the cosine similarity
+    similarity = test_case_matrix(existing_story_id, existing_cases, project_id) @ new_matrix.T
+    nearest = similarity.max(axis=1)
+    order = [i for i in np.argsort(-nearest) if nearest[i] >= threshold]
+    if not order:
+        return None
+
+    existing_json = dict(existing_test_case_json)
+    existing_json["test_cases"] = [existing_cases[i] for i in order]
+    return existing_json
+
+
+def drop_near_duplicates(test_cases: List[Dict], threshold: float = DUPLICATE_SIMILARITY_THRESHOLD, project_id: str = "") -> List[Dict]:
+    """
+    Drop test cases whose cosine similarity to an earlier kept test case
+    exceeds threshold. Order is preserved, so the first of a group of near
+    duplicates survives.
+    """
+    if len(test_cases) < 2:
+        return list(test_cases)
+
+    # Vectors are normalized, so one matrix product holds every pairwise cosine similarity
+    vectors = _encode(test_cases, project_id)
+    similarity = vectors @ vectors.T
+    kept = []
+    for i in range(len(test_cases)):
+        if not kept or similarity[i, kept].max() <= threshold:
+            kept.append(i)
+    return [test_cases[i] for i in kept]
@@ -26,11 +26,73 @@ schema = pa.schema([
     ("source", pa.string())
 ])
 
+TEST_CASE_TABLE_NAME = Config.TABLE_NAME_LANCE_TEST_CASES
+test_case_schema = pa.schema([
+    ("project_id", pa.string()),
+    ("storyID", pa.string()),
+    ("test_case_id", pa.string()),
+    ("vector", pa.list_(pa.float32(), 768)),
+    ("test_case_text", pa.string()),
+    ("embedding_timestamp", pa.timestamp("us"))
+])
+
 def create_LanceDB():
     table = db.create_table(TABLE_NAME, schema=schema, exist_ok=True)
     print(f"✅ Table '{TABLE_NAME}' is ready.")
     return table
 
+def create_test_case_LanceDB():
+    table = db.create_table(TEST_CASE_TABLE_NAME, schema=test_case_schema, exist_ok=True)
+    print(f"✅ Table '{TEST_CASE_TABLE_NAME}' is ready.")
+    return table
+
+def rebuild_impact_counters(cursor):
+    """Recompute the impact counter tables from the active rows in test_case_impacts"""
+    cursor.execute("""
+        TRUNCATE story_impact_counters, project_impact_summary;
+
+        INSERT INTO story_impact_counters (
+            project_id, story_id, impacted_by_count, impacts_caused_count,
+            high_severity_count, medium_severity_count, low_severity_count, last_impact_on
+        )
+        SELECT
+            project_id,
+            story_id,
+            SUM(received),
+            SUM(caused),
+            SUM(CASE WHEN received = 1 AND impact_severity = 'high' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN received = 1 AND impact_severity = 'medium' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN received = 1 AND impact_severity = 'low' THEN 1 ELSE 0 END),
+            MAX(impact_created_on)
+        FROM (
+            SELECT project_id, original_story_id AS story_id, 1 AS received, 0 AS caused,
+                   impact_severity, impact_created_on
+            FROM test_case_impacts
+            WHERE impact_status = 'active'
+            UNION ALL
+            SELECT project_id, new_story_id AS story_id, 0, 1,
+                   impact_severity, impact_created_on
+            FROM test_case_impacts
+            WHERE impact_status = 'active'
+        ) AS impact_rows
+        GROUP BY project_id, story_id;
+
+        INSERT INTO project_impact_summary (
+            project_id, total_impacts, stories_with_impacts,
+            high_severity_count, medium_severity_count, low_severity_count, last_impact_on
+        )
+        SELECT
+            project_id,
+            SUM(impacted_by_count),
+            COUNT(*),
+            SUM(high_severity_count),
+            SUM(medium_severity_count),
+            SUM(low_severity_count),
+            MAX(last_impact_on)
+        FROM story_impact_counters
+        GROUP BY project_id;
+    """)
+
 def create_postgres_db():
     try:
         # First try to connect to default postgres database to create our database if it doesn't exist
@@ -84,8 +146,12 @@ def create_postgres_db():
                 inputs JSONB,
                 has_impacts BOOLEAN DEFAULT FALSE,
                 latest_impact_id UUID,
+                duplicates_dropped INTEGER DEFAULT 0,
                 CONSTRAINT unique_story_id UNIQUE(story_id)  -- Make story_id unique
             );
+
+            -- Tables created before near-duplicate removal lack the counter
+            ALTER TABLE test_cases ADD COLUMN IF NOT EXISTS duplicates_dropped INTEGER DEFAULT 0;
             
             -- Add index on story_id for faster joins
             CREATE INDEX IF NOT EXISTS idx_test_cases_story_id 
@@ -152,6 +218,9 @@ def create_postgres_db():
 
             CREATE INDEX IF NOT EXISTS idx_test_case_impacts_status
             ON test_case_impacts(impact_status);
+
+            CREATE INDEX IF NOT EXISTS idx_test_case_impacts_original_test_case
+            ON test_case_impacts(original_test_case_id);
         """)
         print("✅ Table 'test_case_impacts' is ready.")
 
@@ -273,7 +342,152 @@ def create_postgres_db():
         ORDER BY cc.total_impacts DESC;
         """)
         print("✅ View 'test_case_impact_summary' is ready.")
-            
+
+        # Create pre-aggregated impact counters, maintained by store_impact_analysis
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS story_impact_counters (
+                project_id TEXT NOT NULL,
+                story_id TEXT NOT NULL,
+                impacted_by_count INTEGER DEFAULT 0,
+                impacts_caused_count INTEGER DEFAULT 0,
+                high_severity_count INTEGER DEFAULT 0,
+                medium_severity_count INTEGER DEFAULT 0,
+                low_severity_count INTEGER DEFAULT 0,
+                last_impact_on TIMESTAMP WITHOUT TIME ZONE,
+                PRIMARY KEY (project_id, story_id)
+            );
+
+            CREATE TABLE IF NOT EXISTS project_impact_summary (
+                project_id TEXT PRIMARY KEY,
+                total_impacts INTEGER DEFAULT 0,
+                stories_with_impacts INTEGER DEFAULT 0,
+                high_severity_count INTEGER DEFAULT 0,
+                medium_severity_count INTEGER DEFAULT 0,
+                low_severity_count INTEGER DEFAULT 0,
+                last_impact_on TIMESTAMP WITHOUT TIME ZONE
+            );
+        """)
+        print("✅ Tables 'story_impact_counters' and 'project_impact_summary' are ready.")
+
+        # Create ledger of LLM verdicts per story pair and suite version
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS impact_analysis_ledger (
+                new_story_id TEXT NOT NULL,
+                new_suite_hash TEXT NOT NULL,
+                existing_story_id TEXT NOT NULL,
+                existing_suite_hash TEXT NOT NULL,
+                has_impact BOOLEAN NOT NULL,
+                impacts_stored INTEGER DEFAULT 0,
+                verdict_json JSONB,
+                analyzed_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (new_story_id, new_suite_hash, existing_story_id, existing_suite_hash)
+            );
+        """)
+        print("✅ Table 'impact_analysis_ledger' is ready.")
+
+        # Create log of test case generation calls used by the batch planner
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS generation_batch_log (
+                batch_id SERIAL PRIMARY KEY,
+                story_id TEXT NOT NULL,
+                categories JSONB NOT NULL,
+                requested_count INTEGER NOT NULL,
+                returned_count INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER,
+                truncated BOOLEAN NOT NULL DEFAULT FALSE,
+                parse_failed BOOLEAN NOT NULL DEFAULT FALSE,
+                planned_capacity INTEGER NOT NULL,
+                tokens_per_case_estimate REAL,
+                plan_reason TEXT,
+                created_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_generation_batch_log_created_on
+                ON generation_batch_log(created_on DESC);
+        """)
+        print("✅ Table 'generation_batch_log' is ready.")
+
+        # Create checkpoints of partially generated test case suites
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS generation_runs (
+                story_id TEXT PRIMARY KEY,
+                input_hash TEXT NOT NULL,
+                batches JSONB NOT NULL,
+                created_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                updated_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE TABLE IF NOT EXISTS generation_checkpoints (
+                story_id TEXT NOT NULL REFERENCES generation_runs(story_id) ON DELETE CASCADE,
+                batch_index INTEGER NOT NULL,
+                categories JSONB NOT NULL,
+                test_cases JSONB NOT NULL,
+                completed_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (story_id, batch_index)
+            );
+        """)
+        print("✅ Tables 'generation_runs' and 'generation_checkpoints' are ready.")
+
+        # Create durable job queue for the generation pipeline
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
+                job_type TEXT NOT NULL CHECK (job_type IN ('summarize', 'embed', 'generate', 'analyze_impact', 'upload')),
+                status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed', 'dead')),
+                project_id TEXT,
+                story_id TEXT,
+                payload JSONB NOT NULL DEFAULT '{}'::jsonb,
+                progress JSONB,
+                result JSONB,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_after TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_by TEXT,
+                locked_until TIMESTAMP WITHOUT TIME ZONE,
+                last_error TEXT,
+                created_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                started_on TIMESTAMP WITHOUT TIME ZONE,
+                finished_on TIMESTAMP WITHOUT TIME ZONE,
+                updated_on TIMESTAMP WITHOUT TIME ZONE DEFAULT CURRENT_TIMESTAMP
+            );
+
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_pending_story
+                ON jobs(job_type, story_id) WHERE status IN ('queued', 'running');
+            CREATE INDEX IF NOT EXISTS idx_jobs_runnable
+                ON jobs(status, run_after);
+        """)
+        print("✅ Table 'jobs' is ready.")
+
+        # Create per-call LLM token and latency accounting
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                usage_id BIGSERIAL PRIMARY KEY,
+                called_on TIMESTAMP WITHOUT TIME ZONE NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                purpose TEXT NOT NULL,
+                model TEXT,
+                project_id TEXT,
+                story_id TEXT,
+                run_id UUID,
+                prompt_hash TEXT,
+                input_tokens INTEGER NOT NULL DEFAULT 0,
+                output_tokens INTEGER NOT NULL DEFAULT 0,
+                tokens_estimated BOOLEAN NOT NULL DEFAULT FALSE,
+                latency_ms REAL NOT NULL DEFAULT 0,
+                attempt INTEGER NOT NULL DEFAULT 0,
+                cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+                outcome TEXT NOT NULL DEFAULT 'success'
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_llm_usage_project_called_on
+                ON llm_usage(project_id, called_on);
+            CREATE INDEX IF NOT EXISTS idx_llm_usage_story
+                ON llm_usage(story_id);
+        """)
+        print("✅ Table 'llm_usage' is ready.")
+
+        rebuild_impact_counters(cursor)
+        print("✅ Impact counters rebuilt from 'test_case_impacts'.")
+
         conn.commit()
         print("\n✅ All database structures have been created/updated successfully!")
         
@@ -294,6 +508,7 @@ if __name__ == "__main__":
     print("\n🚀 Setting up database structures...")
     print("\n1️⃣ Creating LanceDB table...")
     create_LanceDB()
+    create_test_case_LanceDB()
 
     print("\n2️⃣ Setting up PostgreSQL structures...")
     create_postgres_db()
@@ -5,6 +5,7 @@ from typing import Dict, Any, List, Optional
 import pandas as pd
 import numpy as np
 from app.config import Config
+from app.utils.metrics import track_stage
 import psycopg2.extras
 
 class DatabaseService:
@@ -205,15 +206,17 @@ class DatabaseService:
             lance_data = stories_table.to_pandas()
             
             # Encode the query using the embedding model
-            query_vector = Config.EMBEDDING_MODEL.encode(query).tolist()
+            with track_stage("embed"):
+                query_vector = Config.EMBEDDING_MODEL.encode(query).tolist()
 
             # Use LanceDB vector search
-            results = (
-                stories_table.search(query_vector)
-                .metric("cosine")
-                .limit(limit)
-                .to_list()
-            )
+            with track_stage("lance_search"):
+                results = (
+                    stories_table.search(query_vector)
+                    .metric("cosine")
+                    .limit(limit)
+                    .to_list()
+                )
 
             if not results:
                 return {'stories': [], 'message': 'No matching stories found'}
@@ -8,7 +8,7 @@ sys.path.insert(0, backend_dir)
 
 import lancedb
 from app.config import Config
-from app.models.create_dbs import create_LanceDB
+from app.models.create_dbs import create_LanceDB, create_test_case_LanceDB
 
 def truncate_lance_db():
     """
@@ -20,15 +20,17 @@ def truncate_lance_db():
         # Connect to LanceDB
         db = lancedb.connect(Config.LANCE_DB_PATH)
         
-        # Drop the existing table
-        try:
-            db.drop_table(Config.TABLE_NAME_LANCE)
-            print(f"✅ Successfully dropped table: {Config.TABLE_NAME_LANCE}")
-        except Exception as e:
-            print(f"⚠️ Table drop failed (might not exist): {e}")
+        # Drop the existing tables
+        for table_name in (Config.TABLE_NAME_LANCE, Config.TABLE_NAME_LANCE_TEST_CASES):
+            try:
+                db.drop_table(table_name)
+                print(f"✅ Successfully dropped table: {table_name}")
+            except Exception as e:
+                print(f"⚠️ Table drop failed (might not exist): {e}")
         
-        # Create new table with updated schema
+        # Create new tables with updated schema
         create_LanceDB()
+        create_test_case_LanceDB()
         print("✅ Successfully recreated table with updated schema")
         
     except Exception as e:
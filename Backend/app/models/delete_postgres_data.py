@@ -27,7 +27,9 @@ def delete_all_postgres_data():
             
             # Truncate all tables
             cur.execute("""
-                TRUNCATE TABLE test_cases, test_case_impacts, impact_history
+                TRUNCATE TABLE test_cases, test_case_impacts, impact_history,
+                    story_impact_counters, project_impact_summary, impact_analysis_ledger, jobs,
+                    generation_batch_log, generation_runs, generation_checkpoints, llm_usage
                 RESTART IDENTITY CASCADE;
             """)
             
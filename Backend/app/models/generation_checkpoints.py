@@ -0,0 +1,112 @@
+import json
+import hashlib
+import datetime
+
+import psycopg2.extras
+
+from app.config import Config
+from app.utils.metrics import timed_query
+
+
+def story_input_hash(story_description):
+    """Hash of the generator input; a checkpointed run is only resumed for the same input."""
+    return hashlib.sha256((story_description or "").encode("utf-8")).hexdigest()
+
+
+@timed_query("resume_generation_run")
+def resume_generation_run(story_id, input_hash, batches):
+    """
+    Start or resume the checkpointed generation run of a story.
+
+    If an unfinished run exists for the same input, its stored batch plan and
+    the test cases of its completed batches are returned as
+    (batches, {batch_index: test_cases}). Otherwise the given plan is stored,
+    replacing any stale run, and (batches, {}) is returned.
+    """
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+                cur.execute("""
+                    SELECT input_hash, batches FROM generation_runs
+                    WHERE story_id = %s
+                    FOR UPDATE
+                """, (story_id,))
+                run = cur.fetchone()
+
+                if run and run["input_hash"] == input_hash:
+                    cur.execute("""
+                        SELECT batch_index, test_cases FROM generation_checkpoints
+                        WHERE story_id = %s
+                    """, (story_id,))
+                    completed = {row["batch_index"]: row["test_cases"] for row in cur.fetchall()}
+                    return run["batches"], completed
+
+                if run:
+                    cur.execute("DELETE FROM generation_checkpoints WHERE story_id = %s", (story_id,))
+
+                now = datetime.datetime.now()
+                cur.execute("""
+                    INSERT INTO generation_runs (story_id, input_hash, batches, created_on, updated_on)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (story_id)
+                    DO UPDATE SET
+                        input_hash = EXCLUDED.input_hash,
+                        batches = EXCLUDED.batches,
+                        created_on = EXCLUDED.created_on,
+                        updated_on = EXCLUDED.updated_on
+                """, (story_id, input_hash, json.dumps(batches), now, now))
+                return batches, {}
+    except Exception as e:
+        print(f"⚠️ Could not load generation checkpoints for {story_id}: {e}")
+        return batches, {}
+    finally:
+        if conn:
+            conn.close()
+
+
+@timed_query("save_batch_checkpoint")
+def save_batch_checkpoint(story_id, batch_index, parts, test_cases):
+    """Persist the test cases of one finished batch."""
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO generation_checkpoints (story_id, batch_index, categories, test_cases, completed_on)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (story_id, batch_index)
+                    DO UPDATE SET
+                        categories = EXCLUDED.categories,
+                        test_cases = EXCLUDED.test_cases,
+                        completed_on = EXCLUDED.completed_on
+                """, (
+                    story_id,
+                    batch_index,
+                    json.dumps({part["type"]: part["count"] for part in parts}),
+                    json.dumps(test_cases),
+                    datetime.datetime.now()
+                ))
+                cur.execute("UPDATE generation_runs SET updated_on = %s WHERE story_id = %s", (datetime.datetime.now(), story_id))
+    except Exception as e:
+        print(f"⚠️ Could not checkpoint batch {batch_index} of {story_id}: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def clear_generation_run(story_id):
+    """Drop a story's run and checkpoints once its assembled suite is stored."""
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM generation_runs WHERE story_id = %s", (story_id,))
+    except Exception as e:
+        print(f"⚠️ Could not clear generation checkpoints for {story_id}: {e}")
+    finally:
+        if conn:
+            conn.close()
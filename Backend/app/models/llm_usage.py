@@ -0,0 +1,168 @@
+import hashlib
+import datetime
+
+import psycopg2.extras
+
+from app.config import Config
+
+# Columns /api/usage/stories and /api/usage/prompts may be ordered by
+USAGE_ORDER_COLUMNS = {
+    "tokens": "total_tokens",
+    "latency": "latency_seconds",
+    "calls": "calls"
+}
+
+
+def prompt_hash(prompt):
+    """Short stable id of a prompt text, used to group repeated prompts"""
+    return hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()[:16]
+
+
+def record_llm_usage(purpose, model, project_id=None, story_id=None, prompt=None,
+                     input_tokens=0, output_tokens=0, tokens_estimated=False,
+                     latency_ms=0.0, attempt=0, cache_hit=False, outcome="success",
+                     run_id=None):
+    """
+    Store one LLM call. Without an explicit run_id it is taken from the story's
+    stored suite; for a story still being generated it is filled in by
+    link_llm_usage once the suite is inserted.
+    Failures are logged and never affect the call being recorded.
+    """
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO llm_usage (
+                        called_on, purpose, model, project_id, story_id, run_id,
+                        prompt_hash, input_tokens, output_tokens, tokens_estimated,
+                        latency_ms, attempt, cache_hit, outcome
+                    ) VALUES (
+                        %s, %s, %s, %s, %s,
+                        COALESCE(%s::uuid, (SELECT run_id FROM test_cases WHERE story_id = %s)),
+                        %s, %s, %s, %s, %s, %s, %s, %s
+                    )
+                """, (
+                    datetime.datetime.now(), purpose, model, project_id or None, story_id,
+                    run_id, story_id,
+                    prompt_hash(prompt) if prompt is not None else None,
+                    input_tokens, output_tokens, tokens_estimated,
+                    latency_ms, attempt, cache_hit, outcome
+                ))
+    except Exception as e:
+        print(f"⚠️ Could not record LLM usage for {purpose} call: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def link_llm_usage(run_id, story_id):
+    """
+    Attach the calls made while a story's suite was being generated to its run.
+    Runs in its own transaction so a failure never affects the stored suite.
+    """
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE llm_usage SET run_id = %s WHERE story_id = %s AND run_id IS NULL",
+                    (run_id, story_id)
+                )
+    except Exception as e:
+        print(f"⚠️ Could not link LLM usage of {story_id} to run {run_id}: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def _filters(from_date=None, to_date=None, project_id=None):
+    """WHERE clause and parameters shared by the usage aggregations"""
+    clauses, params = [], []
+    if from_date:
+        clauses.append("called_on >= %s")
+        params.append(from_date)
+    if to_date:
+        clauses.append("called_on < %s")
+        params.append(to_date)
+    if project_id:
+        clauses.append("project_id = %s")
+        params.append(project_id)
+    return ("WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+_TOTALS = """
+    COUNT(*) AS calls,
+    COUNT(*) FILTER (WHERE cache_hit) AS cache_hits,
+    COUNT(*) FILTER (WHERE attempt > 0) AS retries,
+    COUNT(*) FILTER (WHERE outcome = 'error') AS errors,
+    COALESCE(SUM(input_tokens), 0) AS input_tokens,
+    COALESCE(SUM(output_tokens), 0) AS output_tokens,
+    COALESCE(SUM(input_tokens + output_tokens), 0) AS total_tokens,
+    ROUND(CAST(COALESCE(SUM(latency_ms), 0) / 1000 AS numeric), 2) AS latency_seconds,
+    ROUND(CAST(percentile_cont(0.95) WITHIN GROUP (ORDER BY latency_ms) AS numeric), 1) AS p95_latency_ms
+"""
+
+
+def _fetch(query, params):
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(query, params)
+            return [dict(row) for row in cur.fetchall()]
+    finally:
+        if conn:
+            conn.close()
+
+
+def get_daily_usage(from_date=None, to_date=None, project_id=None):
+    """Calls, tokens and latency per project, day and purpose"""
+    where, params = _filters(from_date, to_date, project_id)
+    return _fetch(f"""
+        SELECT
+            project_id,
+            CAST(called_on AS DATE) AS day,
+            purpose,
+            {_TOTALS}
+        FROM llm_usage
+        {where}
+        GROUP BY project_id, CAST(called_on AS DATE), purpose
+        ORDER BY day DESC, project_id, purpose
+    """, params)
+
+
+def get_top_stories(from_date=None, to_date=None, project_id=None, order_by="tokens", limit=20):
+    """Stories whose generation and impact analysis consumed the most"""
+    where, params = _filters(from_date, to_date, project_id)
+    return _fetch(f"""
+        SELECT
+            story_id,
+            project_id,
+            MAX(CAST(run_id AS TEXT)) AS run_id,
+            {_TOTALS}
+        FROM llm_usage
+        {where}
+        GROUP BY story_id, project_id
+        ORDER BY {USAGE_ORDER_COLUMNS[order_by]} DESC
+        LIMIT %s
+    """, params + [limit])
+
+
+def get_top_prompts(from_date=None, to_date=None, project_id=None, order_by="tokens", limit=20):
+    """Prompts (by purpose and prompt hash) that consumed the most, e.g. ones that keep being retried"""
+    where, params = _filters(from_date, to_date, project_id)
+    return _fetch(f"""
+        SELECT
+            purpose,
+            prompt_hash,
+            COUNT(DISTINCT story_id) AS stories,
+            {_TOTALS}
+        FROM llm_usage
+        {where}
+        GROUP BY purpose, prompt_hash
+        ORDER BY {USAGE_ORDER_COLUMNS[order_by]} DESC
+        LIMIT %s
+    """, params + [limit])
@@ -6,10 +6,13 @@ import uuid
 import datetime
 import json
 from app.config import Config
+from app.models.llm_usage import link_llm_usage
+from app.utils.metrics import LLM_USAGE_TRACKING, timed_query
 
 load_dotenv()
 
 
+@timed_query("get_test_case_json")
 def get_test_case_json_by_story_id(story_id):
     """Get test_case_json for a single story_id (used for context)."""
     try:
@@ -32,6 +35,47 @@ def get_test_case_json_by_story_id(story_id):
         if conn:
             conn.close()
 
+@timed_query("get_run_id")
+def get_run_id_by_story_id(story_id):
+    """Get the run_id of a story's stored suite, or None when it has none."""
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn.cursor() as cur:
+            cur.execute("SELECT run_id FROM test_cases WHERE story_id = %s", (story_id,))
+            result = cur.fetchone()
+            return str(result[0]) if result else None
+    except Exception as e:
+        print(f"❌ Error fetching run_id for {story_id}: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
+
+@timed_query("get_test_case_jsons")
+def get_test_case_jsons_by_story_ids(story_ids):
+    """Get test_case_json for many story_ids in a single query, keyed by story_id."""
+    if not story_ids:
+        return {}
+    conn = None
+    try:
+        conn = Config.get_postgres_connection()
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""
+                SELECT story_id, test_case_json
+                FROM test_cases
+                WHERE story_id = ANY(%s)
+                AND test_case_json IS NOT NULL
+            """, (list(story_ids),))
+            return {row["story_id"]: row["test_case_json"] for row in cur.fetchall()}
+    except Exception as e:
+        print(f"❌ Error fetching test cases for {len(story_ids)} stories: {e}")
+        return {}
+    finally:
+        if conn:
+            conn.close()
+
+@timed_query("get_generated_story_ids")
 def get_all_generated_story_ids():
     """Fetch list of story_ids that already have test cases generated."""
     try:
@@ -49,8 +93,9 @@ def get_all_generated_story_ids():
         if conn:
             conn.close()
 
+@timed_query("insert_test_case")
 def insert_test_case(story_id, story_description, test_case_json, project_id=None, source='backend', inputs=None):
-    """Insert or update generated test case JSON into PostgreSQL."""
+    """Insert or update generated test case JSON into PostgreSQL. Returns True when stored."""
     try:
         conn = Config.get_postgres_connection()
         with conn.cursor() as cur:
@@ -71,10 +116,11 @@ def insert_test_case(story_id, story_description, test_case_json, project_id=Non
                     created_on,
                     test_case_json,
                     total_test_cases,
+                    duplicates_dropped,
                     test_case_generated,
                     source,
                     inputs
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, TRUE, %s, %s)
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, TRUE, %s, %s)
                 ON CONFLICT (run_id)
                 DO UPDATE SET
                     project_id = EXCLUDED.project_id,
@@ -82,6 +128,7 @@ def insert_test_case(story_id, story_description, test_case_json, project_id=Non
                     created_on = EXCLUDED.created_on,
                     test_case_json = EXCLUDED.test_case_json,
                     total_test_cases = EXCLUDED.total_test_cases,
+                    duplicates_dropped = EXCLUDED.duplicates_dropped,
                     test_case_generated = TRUE,
                     source = EXCLUDED.source,
                     inputs = EXCLUDED.inputs
@@ -95,12 +142,18 @@ def insert_test_case(story_id, story_description, test_case_json, project_id=Non
                 created_on,
                 json.dumps(test_case_json),
                 total_test_cases,
+                test_case_json.get("duplicates_dropped", 0),
                 source,
                 json.dumps(inputs) if inputs else None
             ))
             conn.commit()
+        if LLM_USAGE_TRACKING:
+            # LLM calls made while the suite was being generated belong to this run
+            link_llm_usage(run_id, story_id)
+        return True
     except Exception as e:
         print(f"❌ Failed to insert test case for {story_id}: {e}")
+        return False
     finally:
         if conn:
             conn.close()
\ No newline at end of file
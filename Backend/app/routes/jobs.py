@@ -0,0 +1,61 @@
+# Standard library imports
+from datetime import datetime
+import uuid
+
+# Third-party imports
+from flask import Blueprint, jsonify
+
+# Local application imports
+from app.services.job_queue import get_job_chain
+
+jobs_bp = Blueprint('jobs', __name__)
+
+TERMINAL_STATUSES = ('succeeded', 'failed', 'dead')
+
+def serialize_job(job):
+    """JSON-friendly view of a job row"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else str(value) if isinstance(value, uuid.UUID) else value
+        for key, value in job.items()
+        if key != 'payload'
+    }
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Status, progress and result of a job. For queued pipelines the jobs it
+    enqueued (summarize -> embed -> generate -> analyze_impact) are followed,
+    and status reflects the furthest stage reached.
+    """
+    try:
+        uuid.UUID(job_id)
+    except ValueError:
+        return jsonify({'error': 'Invalid job id'}), 404
+
+    try:
+        chain = get_job_chain(job_id)
+        if not chain:
+            return jsonify({'error': f'Job {job_id} not found'}), 404
+
+        job = chain[0]
+        current = chain[-1]
+        done = current['status'] in TERMINAL_STATUSES and not (current.get('result') or {}).get('next_job_id')
+        stalled = (
+            current['status'] == 'running'
+            and current.get('locked_until') is not None
+            and current['locked_until'] < datetime.now()
+        )
+
+        return jsonify({
+            **serialize_job(job),
+            'stage': current['job_type'],
+            'pipeline_status': current['status'] if done or current['status'] != 'succeeded' else 'running',
+            'done': done,
+            'stalled': stalled,
+            'progress': current.get('progress'),
+            'result': current.get('result'),
+            'pipeline': [serialize_job(step) for step in chain]
+        }), 200
+    except Exception as e:
+        print(f"❌ Error fetching job {job_id}: {e}")
+        return jsonify({'error': str(e)}), 500
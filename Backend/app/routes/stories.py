@@ -3,9 +3,14 @@ from datetime import datetime
 import json
 import uuid
 import math
+import os
+import queue
+import threading
 
 # Third-party imports
-from flask import Blueprint, jsonify, request, send_file, Response
+from flask import Blueprint, jsonify, request, send_file, Response, stream_with_context
+import psycopg2
+import psycopg2.errors
 import psycopg2.extras
 import lancedb
 from dateutil import parser
@@ -13,11 +18,25 @@ from dateutil import parser
 # Local application imports
 from app.config import Config
 from app.models.db_service import get_db_service
-from app.LLM.impact_analyzer import analyze_test_case_impacts
+from app.LLM.impact_analyzer import analyze_test_case_impacts, analyze_test_case_impacts_async
 from app.utils.excel_util import generate_excel
+from app.utils.rate_limiter import get_bucket
+from app.utils.llm_cache import is_cached
+from app.utils.metrics import track_llm, track_stage, wait_for_quota
 from app.LLM.Test_case_generator import Chat_RAG
+from app.LLM.prompt_packer import estimate_tokens, pack_test_cases, suite_test_cases
+from app.services.story_upload import (
+    ALLOWED_EXTENSIONS,
+    UploadError,
+    discard_staged_upload,
+    process_story_upload,
+    staged_upload_path
+)
 stories_bp = Blueprint('stories', __name__)
 
+# Seconds between keep-alive comments on an idle event stream
+SSE_HEARTBEAT_SECONDS = 15
+
 def serialize_datetime(obj):
     """Helper function to serialize datetime objects"""
     if isinstance(obj, datetime):
@@ -215,7 +234,7 @@ def download_test_cases(story_id):
         with psycopg2.connect(**db_service.postgres_config) as conn:
             with conn.cursor() as cursor:
                 cursor.execute("""
-                    SELECT test_case_json, story_description 
+                    SELECT test_case_json, story_description, project_id
                     FROM test_cases 
                     WHERE story_id = %s
                 """, (story_id,))
@@ -247,7 +266,8 @@ def download_test_cases(story_id):
 
                 # Generate Excel file
                 try:
-                    excel_file = generate_excel(test_case_json)
+                    with track_stage("excel_build", result[2]):
+                        excel_file = generate_excel(test_case_json)
                     return send_file(
                         excel_file,
                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
@@ -354,6 +374,11 @@ def get_next_reload():
 def trigger_reload():
     """Trigger the scheduler to run immediately"""
     try:
+        if Config.USE_JOB_QUEUE:
+            from app.services.pipeline_jobs import enqueue_pending_work
+            queued = enqueue_pending_work()
+            return jsonify({'message': 'Pending work queued successfully', 'queued': queued}), 202
+
         from scheduler import scheduled_job
         scheduled_job()
         return jsonify({'message': 'Scheduler triggered successfully'}), 200
@@ -369,30 +394,39 @@ def rag_chat():
         if not data or 'query' not in data:
             return jsonify({'error': 'Query is required'}), 400
         user_query = data['query']
-        # 1. Retrieve similar stories and their test cases
+        # 1. Retrieve similar stories and their test cases (most similar story first)
         rag_results = Chat_RAG(user_query, top_k=3)
         context_cases = []
-        for res in rag_results:
-            tc_json = res.get('test_case_json')
-            if tc_json and isinstance(tc_json, dict) and 'test_cases' in tc_json:
-                context_cases.extend(tc_json['test_cases'])
+        if isinstance(rag_results, list):
+            for res in rag_results:
+                context_cases.extend(suite_test_cases(res.get('test_case_json')))
         if not context_cases:
             return jsonify({'error': 'No relevant test cases found.'}), 404
 
-        # 2. Build prompt for Gemini
-        context_str = '\n'.join([
-            f"Test Case {i+1}: {tc.get('title', '')}\nDescription: {tc.get('description', '')}\nSteps: {tc.get('steps', [])}\nExpected Result: {tc.get('expected_result', '')}\n" for i, tc in enumerate(context_cases)
-        ])
-        prompt = f"""
-You are an experienced QA analyst. Here are test cases from similar stories:
-{context_str}
+        # 2. Build prompt for Gemini, packing context test cases into the token budget
+        prompt_header = """
+You are an experienced QA analyst. Here are test cases from similar stories (JSON):
+"""
+        prompt_footer = f"""
 
 Now, based on the following user story, generate new, comprehensive test cases in JSON format (fields: id, title, steps, expected_result, priority):
 {user_query}
 """
+        context_budget = Config.PROMPT_TOKEN_BUDGET_RAG - estimate_tokens(prompt_header) - estimate_tokens(prompt_footer)
+        context_str, context_used = pack_test_cases(context_cases, context_budget, keep_id=False)
+        prompt = f"{prompt_header}{context_str}{prompt_footer}"
+        prompt_tokens = estimate_tokens(prompt)
+        print(f"RAG prompt: ~{prompt_tokens} tokens, {context_used}/{len(context_cases)} context test cases")
 
         # 3. Call Gemini LLM using the configured object
-        response = Config.llm.invoke(prompt)
+        cached = is_cached(Config.llm, prompt)
+        if not cached:
+            wait_for_quota(get_bucket("generation"))
+        with track_llm("rag") as call:
+            call["prompt"] = prompt
+            if cached:
+                call["outcome"] = "cache_hit"
+            response = call["response"] = Config.llm.invoke(prompt)
         text = response.content.strip()
         print("LLM raw output:", repr(text))
         # Clean triple backticks and ```json
@@ -409,15 +443,15 @@ Now, based on the following user story, generate new, comprehensive test cases i
             parsed = json.loads(cleaned)
             # If it's a list of test cases, return as JSON
             if isinstance(parsed, list):
-                return jsonify({'testCases': parsed})
+                return jsonify({'testCases': parsed, 'prompt_tokens': prompt_tokens})
             # If it's a dict with 'test_cases', return that
             if isinstance(parsed, dict) and 'test_cases' in parsed:
-                return jsonify({'testCases': parsed['test_cases']})
+                return jsonify({'testCases': parsed['test_cases'], 'prompt_tokens': prompt_tokens})
             # Otherwise, return the parsed object
-            return jsonify({'testCases': parsed})
+            return jsonify({'testCases': parsed, 'prompt_tokens': prompt_tokens})
         except Exception as e:
             print("Failed to parse LLM output as JSON:", e)
-            return jsonify({'raw': cleaned, 'error': 'Failed to parse LLM output as JSON'}), 200
+            return jsonify({'raw': cleaned, 'error': 'Failed to parse LLM output as JSON', 'prompt_tokens': prompt_tokens}), 200
     except Exception as e:
         print(f"Error in rag_chat: {str(e)}")
         return jsonify({'error': str(e)}), 500
@@ -442,186 +476,175 @@ def get_projects():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@stories_bp.route('/upload', methods=['POST'])
-def upload_story():
-    """Upload a new user story with project ID, story ID, content, and optional file. Description will be AI-generated."""
-    try:
-        # Get form data
-        project_id = request.form.get('project_id')
-        story_id = request.form.get('story_id')
-        content = request.form.get('content')  # Changed from description to content
-        file = request.files.get('file')
-        source = request.form.get('source', 'backend')  # Default to 'backend' if not provided
-
-        # Validate required fields
-        if not project_id or not story_id or (not content and not file):
-            return jsonify({
-                'error': 'Project ID, Story ID, and either Content or File are required'
-            }), 400
-
-        # Check if story already exists
-        db_service = get_db_service()
-        existing_story = db_service.get_story(story_id)
-        if existing_story:
-            return jsonify({
-                'error': f'Story with ID "{story_id}" already exists'
-            }), 409
-
-        # Create project folder if it doesn't exist
-        import os
-        upload_dir = os.getenv("UPLOAD_FOLDER", "./data/uploaded_docs")
-        project_dir = os.path.join(upload_dir, project_id)
-        os.makedirs(project_dir, exist_ok=True)
-
-        # Handle file upload if provided
-        file_path = None
-        file_content = None
-        
-        if file and file.filename:
-            # Validate file type
-            allowed_extensions = {'.pdf', '.docx', '.txt'}
-            file_ext = os.path.splitext(file.filename)[1].lower()
-            if file_ext not in allowed_extensions:
-                return jsonify({
-                    'error': f'File type {file_ext} not supported. Allowed: {", ".join(allowed_extensions)}'
-                }), 400
-
-            # Save file to project folder
-            filename = f"{story_id}{file_ext}"
-            file_path = os.path.join(project_dir, filename)
-            file.save(file_path)
-            
-            # Extract text from file
-            try:
-                from app.datapipeline.text_extractor import extract_text
-                file_content = extract_text(file_path)
-                if not file_content:
-                    return jsonify({
-                        'error': 'Could not extract text from the uploaded file'
-                    }), 400
-            except Exception as e:
-                return jsonify({
-                    'error': f'Error extracting text from file: {str(e)}'
-                }), 500
-
-        # Create story content (use file content if available, otherwise use typed content)
-        story_content = file_content if file_content else content
-
-        # Generate AI description from content using chunking method
+def _save_upload_request():
+    """
+    Validate an upload form and save its file under a path of its own in the
+    staging folder, outside the folder the scheduler scans.
+    Returns (upload, None) with the parsed fields, or (None, error_response).
+    """
+    # Get form data
+    project_id = request.form.get('project_id')
+    story_id = request.form.get('story_id')
+    content = request.form.get('content')  # Changed from description to content
+    file = request.files.get('file')
+    source = request.form.get('source', 'backend')  # Default to 'backend' if not provided
+
+    # Validate required fields
+    if not project_id or not story_id or (not content and not file):
+        return None, (jsonify({
+            'error': 'Project ID, Story ID, and either Content or File are required'
+        }), 400)
+
+    # Check if story already exists
+    db_service = get_db_service()
+    existing_story = db_service.get_story(story_id)
+    if existing_story:
+        return None, (jsonify({
+            'error': f'Story with ID "{story_id}" already exists'
+        }), 409)
+
+    # Reject a duplicate before touching any file of the upload still in flight
+    from app.services.job_queue import get_pending_story_job
+    from app.services.pipeline_jobs import UPLOAD_JOB_TYPES
+    if get_pending_story_job(story_id, UPLOAD_JOB_TYPES):
+        return None, (jsonify({
+            'error': f'Story with ID "{story_id}" is already being processed'
+        }), 409)
+
+    # Handle file upload if provided
+    file_path = None
+    if file and file.filename:
+        # Validate file type
+        file_ext = os.path.splitext(file.filename)[1].lower()
+        if file_ext not in ALLOWED_EXTENSIONS:
+            return None, (jsonify({
+                'error': f'File type {file_ext} not supported. Allowed: {", ".join(ALLOWED_EXTENSIONS)}'
+            }), 400)
+
+        # Save file to its own staging path
+        file_path = staged_upload_path(project_id, story_id, file_ext)
+        file.save(file_path)
+
+    return {
+        'project_id': project_id,
+        'story_id': story_id,
+        'content': None if file_path else content,
+        'file_path': file_path,
+        'source': source
+    }, None
+
+def _sse(event, data):
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=serialize_datetime)}\n\n"
+
+@stories_bp.route('/upload/stream', methods=['POST'])
+def upload_story_stream():
+    """
+    Upload a story like /upload, but stream progress as server-sent events:
+    saved, extracted, summarized, embedded, one batch event per parsed batch of
+    test cases, generated, impacts and finally done (or error). Batch test case
+    ids are provisional; the stored suite is renumbered TC1..TCn.
+    """
+    upload, error = _save_upload_request()
+    if error:
+        return error
+
+    events = queue.Queue()
+
+    def run_pipeline():
         try:
-            def summarize_in_chunks(text, chunk_size=4000):
-                try:
-                    chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
-                    summaries = []
-                    for chunk in chunks[:3]:  # Limit to 3 chunks for efficiency
-                        prompt = (
-                            "Summarize the following document section in 1 sentence:\n\n" + chunk
-                        )
-                        try:
-                            response = Config.llm.invoke(prompt)
-                            summaries.append(response.content.strip())
-                        except Exception as e:
-                            summaries.append("[Summary failed for a chunk]")
-                            print(f"❌ LLM failed on a chunk: {e}")
-                    return " ".join(summaries)
-                except Exception as e:
-                    print(f"❌ LLM summary failed: {e}")
-                    return "Summary could not be generated."
-
-            # Generate description using the chunking method
-            description = summarize_in_chunks(story_content)
-                
+            result = process_story_upload(
+                upload['project_id'],
+                upload['story_id'],
+                file_path=upload['file_path'],
+                content=upload['content'],
+                source=upload['source'],
+                emit=lambda event, data: events.put((event, data))
+            )
+            events.put(('done', result))
+        except UploadError as e:
+            events.put(('error', {'error': str(e), 'status': e.status_code}))
         except Exception as e:
-            print(f"Error generating AI description: {str(e)}")
-            # Fallback to a simple truncation of content
-            description = story_content[:147] + "..." if len(story_content) > 150 else story_content
+            print(f"Error in upload_story_stream: {str(e)}")
+            events.put(('error', {'error': f'Internal server error: {str(e)}', 'status': 500}))
 
-        # Add to LanceDB
-        try:
-            from app.config import EMBEDDING_MODEL
-            from datetime import datetime
-            import lancedb
-            
-            db = lancedb.connect(Config.LANCE_DB_PATH)
-            table = db.open_table(Config.TABLE_NAME_LANCE)
-            
-            # Generate embedding
-            embedding = EMBEDDING_MODEL.encode(story_content).tolist()
-            
-            # Add to LanceDB
-            table.add([{
-                "project_id": project_id,
-                "vector": embedding,
-                "storyID": story_id,
-                "storyDescription": description,  # AI-generated description
-                "test_case_content": "",
-                "filename": filename if file else f"{story_id}.txt",
-                "original_path": file_path if file else None,
-                "doc_content_text": story_content,
-                "embedding_timestamp": datetime.now(),
-                "source": source  # Add source field
-            }])
-            
-        except Exception as e:
-            return jsonify({
-                'error': f'Error adding story to database: {str(e)}'
-            }), 500
+    threading.Thread(target=run_pipeline, daemon=True).start()
+
+    def stream():
+        yield _sse('saved', {'story_id': upload['story_id'], 'project_id': upload['project_id']})
+        while True:
+            try:
+                event, data = events.get(timeout=SSE_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Comment line keeps proxies and the browser from closing an idle stream
+                yield ": heartbeat\n\n"
+                continue
+            yield _sse(event, data)
+            if event in ('done', 'error'):
+                break
+
+    return Response(
+        stream_with_context(stream()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-        # Generate test cases
+@stories_bp.route('/upload', methods=['POST'])
+def upload_story():
+    """
+    Upload a new user story with project ID, story ID, content, and optional file. Description will be AI-generated.
+    The input is saved and 202 is returned with a job_id right away; poll GET /api/jobs/<job_id> for progress.
+    """
+    try:
+        upload, error = _save_upload_request()
+        if error:
+            return error
+        project_id = upload['project_id']
+        story_id = upload['story_id']
+        content = upload['content']
+        file_path = upload['file_path']
+        source = upload['source']
+
+        # Hand the pipeline to the job queue workers, or to this process's upload executor
+        already_processing = jsonify({
+            'error': f'Story with ID "{story_id}" is already being processed'
+        }), 409
         try:
-            from app.LLM.Test_case_generator import generate_test_case_for_story
-            generate_test_case_for_story(story_id)
-            
-            # Check if test cases were generated successfully
-            from app.models.postgress_writer import get_test_case_json_by_story_id
-            test_cases_result = get_test_case_json_by_story_id(story_id)
-            
-            if test_cases_result:
-                # Move file to success folder
-                if file_path and os.path.exists(file_path):
-                    success_dir = os.path.join(os.getenv("SUCCESS_FOLDER", "./data/success"), project_id)
-                    os.makedirs(success_dir, exist_ok=True)
-                    import shutil
-                    shutil.move(file_path, os.path.join(success_dir, filename))
-                
-                return jsonify({
-                    'message': 'Story uploaded and test cases generated successfully',
-                    'story_id': story_id,
-                    'project_id': project_id,
-                    'description': description,  # Return the AI-generated description
-                    'test_cases_generated': True,
-                    'file_processed': file is not None,
-                    'source': source
-                }), 200
+            if Config.USE_JOB_QUEUE:
+                from app.services.job_queue import get_job
+                from app.services.pipeline_jobs import enqueue_story_upload
+                job_id = enqueue_story_upload(
+                    project_id,
+                    story_id,
+                    file_path=file_path,
+                    content=content,
+                    source=source
+                )
+                # A concurrent upload of the story got its job in first
+                pending = get_job(job_id)['payload'] if job_id else {}
+                if (pending.get('file_path'), pending.get('content')) != (file_path, content):
+                    discard_staged_upload(file_path)
+                    return already_processing
             else:
-                # Move file to failure folder if test case generation failed
-                if file_path and os.path.exists(file_path):
-                    failure_dir = os.path.join(os.getenv("FAILURE_FOLDER", "./data/failure"), project_id)
-                    os.makedirs(failure_dir, exist_ok=True)
-                    import shutil
-                    shutil.move(file_path, os.path.join(failure_dir, filename))
-                
-                return jsonify({
-                    'message': 'Story uploaded but test case generation failed',
-                    'story_id': story_id,
-                    'project_id': project_id,
-                    'description': description,  # Return the AI-generated description
-                    'test_cases_generated': False,
-                    'file_processed': file is not None,
-                    'source': source
-                }), 200
-                
-        except Exception as e:
-            # Move file to failure folder
-            if file_path and os.path.exists(file_path):
-                failure_dir = os.path.join(os.getenv("FAILURE_FOLDER", "./data/failure"), project_id)
-                os.makedirs(failure_dir, exist_ok=True)
-                import shutil
-                shutil.move(file_path, os.path.join(failure_dir, filename))
-            
-            return jsonify({
-                'error': f'Error generating test cases: {str(e)}'
-            }), 500
+                from app.services.upload_executor import submit_story_upload
+                job_id = submit_story_upload(upload)
+        except psycopg2.errors.UniqueViolation:
+            # Only the pending-job index of the story; other integrity errors are real failures
+            discard_staged_upload(file_path)
+            return already_processing
+        except Exception:
+            discard_staged_upload(file_path)
+            raise
+
+        return jsonify({
+            'message': 'Story uploaded and queued for test case generation',
+            'story_id': story_id,
+            'project_id': project_id,
+            'job_id': job_id,
+            'status_url': f'/api/jobs/{job_id}',
+            'file_processed': file_path is not None,
+            'source': source
+        }), 202
 
     except Exception as e:
         print(f"Error in upload_story: {str(e)}")
@@ -744,25 +767,49 @@ def get_impact_details(impact_id):
 
 @stories_bp.route('/impacts/summary/<project_id>', methods=['GET'])
 def get_project_impact_summary(project_id):
-    """Get summary of impacts in a project"""
+    """Get summary of impacts in a project from the pre-aggregated counter tables"""
     try:
-        db_service = get_db_service()
-        cursor = db_service.conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-        
-        # Get summary from our view
-        cursor.execute("""
-            SELECT * FROM test_case_impact_summary
-            WHERE project_id = %s
-            ORDER BY total_impacts DESC
-        """, (project_id,))
-        
-        summaries = cursor.fetchall()
-        cursor.close()
-        
+        with Config.get_postgres_connection() as conn:
+            with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cursor:
+                cursor.execute("""
+                    SELECT total_impacts, stories_with_impacts,
+                           high_severity_count, medium_severity_count, low_severity_count,
+                           last_impact_on
+                    FROM project_impact_summary
+                    WHERE project_id = %s
+                """, (project_id,))
+                project_summary = cursor.fetchone()
+
+                cursor.execute("""
+                    SELECT
+                        sic.project_id,
+                        sic.story_id,
+                        tc.story_description,
+                        tc.created_on as test_case_generated_on,
+                        sic.impacted_by_count + sic.impacts_caused_count as total_impacts,
+                        sic.impacts_caused_count > 0 as has_caused_impacts,
+                        sic.impacted_by_count > 0 as has_received_impacts,
+                        sic.last_impact_on
+                    FROM story_impact_counters sic
+                    JOIN test_cases tc ON tc.story_id = sic.story_id
+                    WHERE sic.project_id = %s
+                    ORDER BY total_impacts DESC
+                """, (project_id,))
+                summaries = cursor.fetchall()
+
+        project_summary = dict(project_summary) if project_summary else {}
+
         return jsonify({
             'project_id': project_id,
             'total_stories': len(summaries),
-            'stories_with_impacts': len([s for s in summaries if s['total_impacts'] > 0]),
+            'stories_with_impacts': project_summary.get('stories_with_impacts', 0),
+            'total_impacts': project_summary.get('total_impacts', 0),
+            'severity_summary': {
+                'high': project_summary.get('high_severity_count', 0),
+                'medium': project_summary.get('medium_severity_count', 0),
+                'low': project_summary.get('low_severity_count', 0)
+            },
+            'last_impact_on': serialize_datetime(project_summary['last_impact_on']) if project_summary.get('last_impact_on') else None,
             'summaries': [dict(summary) for summary in summaries]
         }), 200
         
@@ -777,19 +824,31 @@ async def trigger_impact_analysis():
         data = request.get_json()
         story_id = data.get('story_id')
         project_id = data.get('project_id')
+        force = bool(data.get('force', False))
         
         if not story_id or not project_id:
             return jsonify({
                 'error': 'Both story_id and project_id are required'
             }), 400
             
-        # Run impact analysis
-        await analyze_test_case_impacts(story_id, project_id)
+        if Config.USE_JOB_QUEUE:
+            from app.services.job_queue import enqueue_job
+            job_id = enqueue_job("analyze_impact", {"force": force}, story_id=story_id, project_id=project_id)
+            return jsonify({
+                'message': 'Impact analysis queued successfully',
+                'story_id': story_id,
+                'project_id': project_id,
+                'job_id': job_id
+            }), 202
+
+        # Run impact analysis; pairs already decided for unchanged suites are skipped unless forced
+        impacts_stored = await analyze_test_case_impacts_async(story_id, project_id, force=force)
         
         return jsonify({
             'message': 'Impact analysis triggered successfully',
             'story_id': story_id,
-            'project_id': project_id
+            'project_id': project_id,
+            'impacts_stored': impacts_stored
         }), 200
         
     except Exception as e:
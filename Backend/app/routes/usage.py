@@ -0,0 +1,88 @@
+# Standard library imports
+from datetime import date, datetime
+from decimal import Decimal
+
+# Third-party imports
+from dateutil import parser
+from flask import Blueprint, jsonify, request
+
+# Local application imports
+from app.models.llm_usage import USAGE_ORDER_COLUMNS, get_daily_usage, get_top_prompts, get_top_stories
+
+usage_bp = Blueprint('usage', __name__)
+
+MAX_LIMIT = 500
+
+def serialize_usage(row):
+    """JSON-friendly view of an aggregated usage row"""
+    return {
+        key: value.isoformat() if isinstance(value, (date, datetime)) else float(value) if isinstance(value, Decimal) else value
+        for key, value in row.items()
+    }
+
+def usage_filters():
+    """from, to and project_id query parameters; raises ValueError for unparseable dates"""
+    from_date = request.args.get('from')
+    to_date = request.args.get('to')
+    return {
+        'from_date': parser.parse(from_date) if from_date else None,
+        'to_date': parser.parse(to_date) if to_date else None,
+        'project_id': request.args.get('project_id') or None
+    }
+
+def ranking_params():
+    """order_by and limit query parameters of the top-N endpoints"""
+    order_by = request.args.get('order_by', 'tokens')
+    if order_by not in USAGE_ORDER_COLUMNS:
+        raise ValueError(f"order_by must be one of: {', '.join(USAGE_ORDER_COLUMNS)}")
+    limit = int(request.args.get('limit', 20))
+    if not 0 < limit <= MAX_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_LIMIT}")
+    return {'order_by': order_by, 'limit': limit}
+
+@usage_bp.route('/daily', methods=['GET'])
+def daily_usage():
+    """LLM calls, tokens and latency per project, day and purpose"""
+    try:
+        filters = usage_filters()
+    except (ValueError, OverflowError) as e:
+        return jsonify({'error': f'Invalid date: {e}'}), 400
+
+    try:
+        rows = get_daily_usage(**filters)
+        return jsonify({'usage': [serialize_usage(row) for row in rows]}), 200
+    except Exception as e:
+        print(f"❌ Error fetching daily LLM usage: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@usage_bp.route('/stories', methods=['GET'])
+def top_stories():
+    """Stories that consumed the most tokens, latency or calls"""
+    try:
+        filters = usage_filters()
+        ranking = ranking_params()
+    except (ValueError, OverflowError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        rows = get_top_stories(**filters, **ranking)
+        return jsonify({'stories': [serialize_usage(row) for row in rows]}), 200
+    except Exception as e:
+        print(f"❌ Error fetching LLM usage by story: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@usage_bp.route('/prompts', methods=['GET'])
+def top_prompts():
+    """Prompts that consumed the most tokens, latency or calls, including retries"""
+    try:
+        filters = usage_filters()
+        ranking = ranking_params()
+    except (ValueError, OverflowError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        rows = get_top_prompts(**filters, **ranking)
+        return jsonify({'prompts': [serialize_usage(row) for row in rows]}), 200
+    except Exception as e:
+        print(f"❌ Error fetching LLM usage by prompt: {e}")
+        return jsonify({'error': str(e)}), 500
@@ -0,0 +1,30 @@
+"""
+Recompute story_impact_counters and project_impact_summary from test_case_impacts.
+
+store_impact_analysis only ever increments the counters. Run this after impacts
+are deactivated, deleted or edited directly in the database; create_dbs.py runs
+the same rebuild on every start.
+"""
+import os
+import sys
+
+# Add the Backend directory to Python path
+current_dir = os.path.dirname(os.path.abspath(__file__))
+backend_dir = os.path.abspath(os.path.join(current_dir, "../.."))
+sys.path.insert(0, backend_dir)
+
+from app.config import Config
+from app.models.create_dbs import rebuild_impact_counters
+
+def main():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                rebuild_impact_counters(cur)
+        print("✅ Impact counters rebuilt from 'test_case_impacts'.")
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,9 @@ import requests
 import pandas as pd
 import lancedb
 from app.config import Config
+from app.utils.rate_limiter import get_bucket
+from app.utils.llm_cache import is_cached
+from app.utils.metrics import track_llm, track_stage, wait_for_quota_async
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 
@@ -76,19 +79,16 @@ class JiraConfig:
         return True
 
 class JiraRateLimiter:
-    """Rate limiter for Jira API calls"""
+    """Rate limiter for Jira API calls, backed by the shared "jira" token bucket"""
     
     def __init__(self, delay: float = 1.0):
         self.delay = delay
-        self.last_request = 0
+        # One call per delay seconds, without bursting, across all processes
+        self.bucket = get_bucket("jira", rate_per_minute=60.0 / max(delay, 0.001), capacity=1.0)
     
     async def wait(self):
         """Wait if necessary to respect rate limits"""
-        now = time.time()
-        time_since_last = now - self.last_request
-        if time_since_last < self.delay:
-            await asyncio.sleep(self.delay - time_since_last)
-        self.last_request = time.time()
+        await self.bucket.acquire_async()
 
 class JiraClient:
     """Enhanced Jira API client with retry logic and rate limiting"""
@@ -525,32 +525,34 @@ class JiraIntegration:
             logger.debug(f"🔍 Content length for {story_id}: {len(content)} characters")
             
             # Generate embedding and summary
-            embedding = Config.EMBEDDING_MODEL.encode(content).tolist()
-            summary = self._generate_summary(content)
+            with track_stage("embed", data.get("project", "")):
+                embedding = Config.EMBEDDING_MODEL.encode(content).tolist()
+            summary = await self._generate_summary(content, data.get("project", ""), story_id)
             
             # Store in LanceDB
-            self.table.add([{
-                "project_id": data.get("project", ""),
-                "vector": embedding,
-                "storyID": story_id,
-                "storyDescription": summary,
-                "test_case_content": "",
-                "filename": f"jira_{story_id}",
-                "original_path": data.get("jira_url", f"jira://{story_id}"),
-                "doc_content_text": content,
-                "embedding_timestamp": datetime.now(),
-                "source": "jira",
-                "jira_metadata": json.dumps({
-                    "status": data.get("status"),
-                    "priority": data.get("priority"),
-                    "assignee": data.get("assignee"),
-                    "labels": data.get("labels"),
-                    "components": data.get("components"),
-                    "created": data.get("created"),
-                    "updated": data.get("updated"),
-                    "project_id": data.get("project", "")
-                })
-            }])
+            with track_stage("lance_add", data.get("project", "")):
+                self.table.add([{
+                    "project_id": data.get("project", ""),
+                    "vector": embedding,
+                    "storyID": story_id,
+                    "storyDescription": summary,
+                    "test_case_content": "",
+                    "filename": f"jira_{story_id}",
+                    "original_path": data.get("jira_url", f"jira://{story_id}"),
+                    "doc_content_text": content,
+                    "embedding_timestamp": datetime.now(),
+                    "source": "jira",
+                    "jira_metadata": json.dumps({
+                        "status": data.get("status"),
+                        "priority": data.get("priority"),
+                        "assignee": data.get("assignee"),
+                        "labels": data.get("labels"),
+                        "components": data.get("components"),
+                        "created": data.get("created"),
+                        "updated": data.get("updated"),
+                        "project_id": data.get("project", "")
+                    })
+                }])
             
             logger.info(f"✅ Processed {story_id} (Project: {data.get('project', 'N/A')})")
             return "success"
@@ -560,7 +562,7 @@ class JiraIntegration:
             logger.debug(f"🔍 Issue data: {issue}")
             return "failed"
     
-    def _generate_summary(self, content: str) -> str:
+    async def _generate_summary(self, content: str, project_id: str = "", story_id: str = None) -> str:
         """Generate summary using LLM with strict length limit"""
         try:
             prompt = (
@@ -569,7 +571,14 @@ class JiraIntegration:
                 "Do not include technical details or implementation specifics.\n\n"
                 f"{content[:2000]}"
             )
-            response = Config.llm.invoke(prompt)
+            cached = is_cached(Config.llm, prompt)
+            if not cached:
+                await wait_for_quota_async(get_bucket("summary"), project_id)
+            with track_llm("summary", project_id, story_id) as call:
+                call["prompt"] = prompt
+                if cached:
+                    call["outcome"] = "cache_hit"
+                response = call["response"] = await Config.llm.ainvoke(prompt)
             summary = response.content.strip()
             
             # Enforce hard limit of 150 characters
@@ -0,0 +1,340 @@
+import os
+import json
+import socket
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import psycopg2
+import psycopg2.extras
+
+from app.config import Config
+from app.utils.metrics import timed_query
+
+JOB_TYPES = ("summarize", "embed", "generate", "analyze_impact")
+# Jobs run by an in-process executor; recorded for status reporting but never claimed by workers
+INPROCESS_JOB_TYPES = ("upload",)
+
+DEFAULT_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+VISIBILITY_TIMEOUT = int(os.getenv("JOB_VISIBILITY_TIMEOUT", "900"))  # seconds a claimed job stays invisible
+RETRY_BACKOFF_BASE = float(os.getenv("JOB_RETRY_BACKOFF_BASE", "30"))  # seconds, doubled per attempt
+RETRY_BACKOFF_MAX = float(os.getenv("JOB_RETRY_BACKOFF_MAX", "1800"))
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help; the job goes straight to the dead-letter state"""
+    pass
+
+
+@contextmanager
+def _connection():
+    """Connection that commits on success, rolls back on error and is always closed"""
+    conn = Config.get_postgres_connection()
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@timed_query("enqueue_job")
+def enqueue_job(
+    job_type: str,
+    payload: Dict[str, Any],
+    story_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    delay_seconds: float = 0,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS
+) -> Optional[str]:
+    """
+    Add a job to the queue and return its job_id.
+
+    At most one queued or running job exists per (job_type, story_id); if one
+    is already pending, its job_id is returned instead of creating a duplicate.
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    run_after = datetime.now() + timedelta(seconds=delay_seconds)
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO jobs (job_type, story_id, project_id, payload, max_attempts, run_after)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (job_type, story_id) WHERE status IN ('queued', 'running')
+                DO NOTHING
+                RETURNING job_id
+            """, (job_type, story_id, project_id, json.dumps(payload), max_attempts, run_after))
+            row = cur.fetchone()
+            if row:
+                return str(row[0])
+
+            cur.execute("""
+                SELECT job_id FROM jobs
+                WHERE job_type = %s AND story_id = %s
+                AND status IN ('queued', 'running')
+            """, (job_type, story_id))
+            row = cur.fetchone()
+            return str(row[0]) if row else None
+
+
+@timed_query("claim_job")
+def claim_job(worker_id: str, job_types: Optional[List[str]] = None, visibility_timeout: int = VISIBILITY_TIMEOUT) -> Optional[Dict[str, Any]]:
+    """
+    Atomically claim the next runnable job.
+
+    Runnable jobs are queued jobs whose run_after has passed and running jobs
+    whose visibility timeout expired (their worker died). An expired job that
+    has used up its attempts is dead-lettered instead, so a job that keeps
+    crashing its worker is not retried forever. FOR UPDATE SKIP LOCKED lets
+    any number of workers poll concurrently without blocking.
+    """
+    job_types = list(job_types or JOB_TYPES)
+    with _connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'dead',
+                    last_error = 'The worker running this job stopped before it finished on its last attempt',
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    finished_on = NOW(),
+                    updated_on = NOW()
+                WHERE job_id IN (
+                    SELECT job_id FROM jobs
+                    WHERE job_type = ANY(%s)
+                    AND status = 'running'
+                    AND locked_until < NOW()
+                    AND attempts >= max_attempts
+                    FOR UPDATE SKIP LOCKED
+                )
+            """, (job_types,))
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'running',
+                    attempts = attempts + 1,
+                    locked_by = %s,
+                    locked_until = NOW() + make_interval(secs => %s),
+                    started_on = COALESCE(started_on, NOW()),
+                    updated_on = NOW()
+                WHERE job_id = (
+                    SELECT job_id FROM jobs
+                    WHERE job_type = ANY(%s)
+                    AND (
+                        (status = 'queued' AND run_after <= NOW())
+                        OR (status = 'running' AND locked_until < NOW() AND attempts < max_attempts)
+                    )
+                    ORDER BY run_after
+                    FOR UPDATE SKIP LOCKED
+                    LIMIT 1
+                )
+                RETURNING *
+            """, (worker_id, visibility_timeout, job_types))
+            job = cur.fetchone()
+            return dict(job) if job else None
+
+
+def extend_job_lease(job_id: str, worker_id: str, visibility_timeout: int = VISIBILITY_TIMEOUT) -> None:
+    """Push back the visibility timeout of a long-running job"""
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET locked_until = NOW() + make_interval(secs => %s), updated_on = NOW()
+                WHERE job_id = %s AND locked_by = %s AND status = 'running'
+            """, (visibility_timeout, job_id, worker_id))
+
+
+def complete_job(job_id: str, worker_id: str, result: Optional[Dict[str, Any]] = None) -> bool:
+    """
+    Record a job's result. Only the worker still holding the job may do so;
+    returns False when its lease expired and another worker reclaimed it.
+    """
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'succeeded',
+                    result = %s,
+                    last_error = NULL,
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    finished_on = NOW(),
+                    updated_on = NOW()
+                WHERE job_id = %s AND status = 'running' AND locked_by = %s
+            """, (json.dumps(result) if result is not None else None, job_id, worker_id))
+            return cur.rowcount == 1
+
+
+def fail_job(job: Dict[str, Any], worker_id: str, error: str, permanent: bool = False) -> Optional[str]:
+    """
+    Record a failed attempt. The job is requeued with exponential backoff
+    until max_attempts is reached, then moved to the 'dead' state.
+    Returns the new status, or None when worker_id no longer holds the job.
+    """
+    dead = permanent or job["attempts"] >= job["max_attempts"]
+    backoff = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * (2 ** max(job["attempts"] - 1, 0)))
+    status = "dead" if dead else "queued"
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = %s,
+                    last_error = %s,
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    run_after = NOW() + make_interval(secs => %s),
+                    finished_on = CASE WHEN %s THEN NOW() ELSE NULL END,
+                    updated_on = NOW()
+                WHERE job_id = %s AND status = 'running' AND locked_by = %s
+            """, (status, error[:4000], 0 if dead else backoff, dead, job["job_id"], worker_id))
+            if cur.rowcount == 0:
+                return None
+    return status
+
+
+def start_inprocess_job(
+    job_type: str,
+    payload: Dict[str, Any],
+    worker_id: str,
+    story_id: Optional[str] = None,
+    project_id: Optional[str] = None,
+    visibility_timeout: int = VISIBILITY_TIMEOUT
+) -> str:
+    """Record a job that this process runs itself, already in the running state"""
+    if job_type not in INPROCESS_JOB_TYPES:
+        raise ValueError(f"Unknown in-process job type: {job_type}")
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                INSERT INTO jobs (
+                    job_type, story_id, project_id, payload, status, attempts, max_attempts,
+                    locked_by, locked_until, started_on
+                ) VALUES (
+                    %s, %s, %s, %s, 'running', 1, 1,
+                    %s, NOW() + make_interval(secs => %s), NOW()
+                )
+                RETURNING job_id
+            """, (job_type, story_id, project_id, json.dumps(payload), worker_id, visibility_timeout))
+            return str(cur.fetchone()[0])
+
+
+@timed_query("expire_inprocess_jobs")
+def expire_inprocess_jobs() -> int:
+    """
+    Mark in-process jobs whose lease expired as failed. Their process died
+    mid-run (progress updates extend the lease while it is alive), and no
+    worker ever reclaims them, so without this the story's pending-job index
+    would reject every later upload. Returns the number of jobs expired.
+    """
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'failed',
+                    last_error = 'The process running this job stopped before it finished',
+                    locked_by = NULL,
+                    locked_until = NULL,
+                    finished_on = NOW(),
+                    updated_on = NOW()
+                WHERE job_type = ANY(%s)
+                AND status = 'running'
+                AND locked_until < NOW()
+            """, (list(INPROCESS_JOB_TYPES),))
+            return cur.rowcount
+
+
+def update_job_progress(job_id: str, progress: Dict[str, Any], visibility_timeout: int = VISIBILITY_TIMEOUT) -> None:
+    """Store a running job's progress; doubles as a heartbeat that extends its lease"""
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET progress = %s,
+                    locked_until = NOW() + make_interval(secs => %s),
+                    updated_on = NOW()
+                WHERE job_id = %s AND status = 'running'
+            """, (json.dumps(progress), visibility_timeout, job_id))
+
+
+def get_job_chain(job_id: str, max_hops: int = len(JOB_TYPES)) -> List[Dict[str, Any]]:
+    """A job followed by the jobs it enqueued (result.next_job_id), in pipeline order"""
+    chain = []
+    next_id = job_id
+    while next_id and len(chain) <= max_hops:
+        job = get_job(next_id)
+        if job is None:
+            break
+        chain.append(job)
+        next_id = (job.get("result") or {}).get("next_job_id") if job["status"] == "succeeded" else None
+    return chain
+
+
+@timed_query("get_pending_story_job")
+def get_pending_story_job(story_id: str, job_types: List[str]) -> Optional[str]:
+    """job_id of the story's queued or running job of any of job_types, or None"""
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT job_id FROM jobs
+                WHERE story_id = %s AND job_type = ANY(%s)
+                AND status IN ('queued', 'running')
+                LIMIT 1
+            """, (story_id, list(job_types)))
+            row = cur.fetchone()
+            return str(row[0]) if row else None
+
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    with _connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("SELECT * FROM jobs WHERE job_id = %s", (job_id,))
+            job = cur.fetchone()
+            return dict(job) if job else None
+
+
+@timed_query("get_latest_story_jobs")
+def get_latest_story_jobs(job_types: List[str]) -> Dict[str, Dict[str, Any]]:
+    """The most recently created job of any of job_types per story, in any state"""
+    with _connection() as conn:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                SELECT DISTINCT ON (story_id) story_id, job_id, job_type, status
+                FROM jobs
+                WHERE job_type = ANY(%s) AND story_id IS NOT NULL
+                ORDER BY story_id, created_on DESC
+            """, (list(job_types),))
+            return {row["story_id"]: dict(row) for row in cur.fetchall()}
+
+
+def retry_dead_jobs(job_type: Optional[str] = None) -> int:
+    """
+    Move dead-lettered jobs back to the queue with a fresh attempt budget.
+    Only the latest dead job per (job_type, story_id) is revived, and none for
+    a story that already has a queued or running job of that type, so the
+    one-pending-job-per-story index holds.
+    """
+    with _connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE jobs
+                SET status = 'queued', attempts = 0, run_after = NOW(), updated_on = NOW()
+                WHERE job_id IN (
+                    SELECT DISTINCT ON (job_type, COALESCE(story_id, job_id::text)) job_id
+                    FROM jobs dead
+                    WHERE status = 'dead'
+                    AND (%s::text IS NULL OR job_type = %s)
+                    AND NOT EXISTS (
+                        SELECT 1 FROM jobs pending
+                        WHERE pending.job_type = dead.job_type
+                        AND pending.story_id = dead.story_id
+                        AND pending.status IN ('queued', 'running')
+                    )
+                    ORDER BY job_type, COALESCE(story_id, job_id::text), updated_on DESC
+                )
+            """, (job_type, job_type))
+            return cur.rowcount
@@ -0,0 +1,304 @@
+import os
+import shutil
+import threading
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+import lancedb
+
+from app.config import Config, EMBEDDING_MODEL
+from app.utils.lance_util import lance_literal
+from app.utils.metrics import track_stage
+from app.services.job_queue import (
+    JOB_TYPES,
+    VISIBILITY_TIMEOUT,
+    PermanentJobError,
+    claim_job,
+    complete_job,
+    default_worker_id,
+    enqueue_job,
+    extend_job_lease,
+    fail_job,
+    get_latest_story_jobs
+)
+from app.services.story_upload import remove_staging_dir
+
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "./data/uploaded_docs")
+SUCCESS_FOLDER = os.getenv("SUCCESS_FOLDER", "./data/success")
+FAILURE_FOLDER = os.getenv("FAILURE_FOLDER", "./data/failure")
+
+POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+
+# Jobs that own a file in the upload folder until the story is embedded
+UPLOAD_JOB_TYPES = ("summarize", "embed", "upload")
+# A story's file has left the upload folder once one of these succeeded
+UPLOAD_FINAL_JOB_TYPES = ("embed", "upload")
+
+
+def _move_file(file_path: Optional[str], project_id: str, base_folder: str) -> Optional[str]:
+    """Move an input file into the project's success/failure folder"""
+    if not file_path or not os.path.exists(file_path):
+        return None
+    target_dir = os.path.join(base_folder, project_id)
+    os.makedirs(target_dir, exist_ok=True)
+    target = os.path.join(target_dir, os.path.basename(file_path))
+    shutil.move(file_path, target)
+    remove_staging_dir(file_path)
+    return target
+
+
+def handle_summarize(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Extract the story text (from the uploaded file or inline content) and summarize it"""
+    from app.datapipeline.embedding_generator import summarize_in_chunks
+    from app.datapipeline.text_extractor import extract_text
+
+    payload = job["payload"]
+    text = payload.get("content")
+    if not text and payload.get("file_path"):
+        with track_stage("extract", job["project_id"]):
+            text = extract_text(payload["file_path"])
+    if not text:
+        _move_file(payload.get("file_path"), job["project_id"], FAILURE_FOLDER)
+        raise PermanentJobError("Could not extract text from the story input")
+
+    description = summarize_in_chunks(text, project_id=job["project_id"], story_id=job["story_id"])
+    embed_job_id = enqueue_job(
+        "embed",
+        {**payload, "content": text, "description": description},
+        story_id=job["story_id"],
+        project_id=job["project_id"]
+    )
+    return {"description": description, "next_job_id": embed_job_id}
+
+
+def _stored_story_text(table, story_id: str) -> Optional[str]:
+    """Document text stored in LanceDB for a storyID, or None when the story is not stored"""
+    rows = table.to_lance().to_table(
+        columns=["doc_content_text"],
+        filter=f"storyID = {lance_literal(story_id)}"
+    ).to_pylist()
+    return (rows[0]["doc_content_text"] or "") if rows else None
+
+
+def handle_embed(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Embed the story and add it to LanceDB, then queue test case generation"""
+    from app.datapipeline.embedding_generator import add_story_to_lance, table
+
+    payload = job["payload"]
+    story_id = job["story_id"]
+    project_id = job["project_id"]
+
+    stored_text = _stored_story_text(table, story_id)
+    if stored_text is not None and stored_text != payload["content"]:
+        # A different story already uses this storyID; like the folder scan, reject the upload
+        _move_file(payload.get("file_path"), project_id, FAILURE_FOLDER)
+        raise PermanentJobError(f"Story {story_id} already exists")
+
+    # Same content: a retry after a crash between add and complete, which must not add the story twice
+    if stored_text is None:
+        with track_stage("embed", project_id):
+            embedding = EMBEDDING_MODEL.encode(payload["content"]).tolist()
+        add_story_to_lance(
+            project_id,
+            story_id,
+            payload.get("description", ""),
+            payload["content"],
+            embedding,
+            payload.get("filename") or f"{story_id}.txt",
+            payload.get("file_path"),
+            payload.get("source", "backend")
+        )
+
+    _move_file(payload.get("file_path"), project_id, SUCCESS_FOLDER)
+    generate_job_id = enqueue_job("generate", {}, story_id=story_id, project_id=project_id)
+    return {"next_job_id": generate_job_id}
+
+
+def handle_generate(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Generate and store test cases for a story, then queue its impact analysis"""
+    from app.LLM.Test_case_generator import generate_test_case_for_story
+    from app.models.postgress_writer import get_test_case_json_by_story_id
+
+    story_id = job["story_id"]
+    if not get_test_case_json_by_story_id(story_id):
+        generate_test_case_for_story(story_id, analyze_impacts=False)
+        if not get_test_case_json_by_story_id(story_id):
+            raise RuntimeError(f"No test cases were stored for story {story_id}")
+
+    project_id = job["project_id"]
+    if not project_id:
+        db = lancedb.connect(Config.LANCE_DB_PATH)
+        rows = db.open_table(Config.TABLE_NAME_LANCE).to_lance().to_table(
+            columns=["project_id"],
+            filter=f"storyID = {lance_literal(story_id)}"
+        ).to_pylist()
+        project_id = rows[0]["project_id"] if rows else None
+
+    impact_job_id = None
+    if project_id:
+        impact_job_id = enqueue_job("analyze_impact", {}, story_id=story_id, project_id=project_id)
+    return {"next_job_id": impact_job_id}
+
+
+def handle_analyze_impact(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Run impact analysis of a story against the rest of its project"""
+    from app.LLM.impact_analyzer import analyze_test_case_impacts
+
+    impacts_stored = analyze_test_case_impacts(
+        job["story_id"],
+        job["project_id"],
+        force=bool(job["payload"].get("force", False))
+    )
+    return {"impacts_stored": impacts_stored}
+
+
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "summarize": handle_summarize,
+    "embed": handle_embed,
+    "generate": handle_generate,
+    "analyze_impact": handle_analyze_impact,
+}
+
+
+def enqueue_story_upload(project_id: str, story_id: str, file_path: Optional[str] = None, content: Optional[str] = None, source: str = "backend") -> Optional[str]:
+    """Queue the full pipeline (summarize -> embed -> generate -> analyze_impact) for one story"""
+    payload = {
+        "file_path": file_path,
+        "filename": os.path.basename(file_path) if file_path else f"{story_id}.txt",
+        "content": content,
+        "source": source
+    }
+    return enqueue_job("summarize", payload, story_id=story_id, project_id=project_id)
+
+
+def enqueue_pending_work() -> Dict[str, int]:
+    """
+    Queue everything the scheduler would otherwise process inline: files
+    waiting in the upload folders and stories without test cases.
+
+    A file stays in the upload folder until its embed job moves it, so a
+    file is skipped while its story's latest upload job is pending, retrying
+    or dead; dead ones are requeued with retry_dead_jobs, not by this scan.
+    Only a file added after the story's pipeline finished is queued again.
+    """
+    from app.models.postgress_writer import get_all_generated_story_ids
+
+    counts = {"summarize": 0, "generate": 0}
+    latest_jobs = get_latest_story_jobs(UPLOAD_JOB_TYPES)
+
+    if os.path.isdir(UPLOAD_FOLDER):
+        for project_id in os.listdir(UPLOAD_FOLDER):
+            project_path = os.path.join(UPLOAD_FOLDER, project_id)
+            if not os.path.isdir(project_path):
+                continue
+            for file in os.listdir(project_path):
+                file_path = os.path.join(project_path, file)
+                story_id = os.path.splitext(file)[0]
+                latest = latest_jobs.get(story_id)
+                owned = latest is not None and not (
+                    latest["status"] == "succeeded" and latest["job_type"] in UPLOAD_FINAL_JOB_TYPES
+                )
+                if os.path.isfile(file_path) and not owned:
+                    if enqueue_story_upload(project_id, story_id, file_path=file_path, source="file"):
+                        counts["summarize"] += 1
+
+    db = lancedb.connect(Config.LANCE_DB_PATH)
+    rows = db.open_table(Config.TABLE_NAME_LANCE).to_lance().to_table(
+        columns=["storyID", "project_id"]
+    ).to_pylist()
+    generated_ids = set(get_all_generated_story_ids())
+    for row in rows:
+        if row["storyID"] not in generated_ids:
+            if enqueue_job("generate", {}, story_id=row["storyID"], project_id=row["project_id"]):
+                counts["generate"] += 1
+
+    print(f"📥 Queued {counts['summarize']} summarize and {counts['generate']} generate jobs")
+    return counts
+
+
+class _LeaseKeeper:
+    """Extends a claimed job's visibility timeout while its handler runs"""
+
+    def __init__(self, job_id: str, worker_id: str, visibility_timeout: int):
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.visibility_timeout = visibility_timeout
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(1.0, self.visibility_timeout / 3)
+        while not self._stop.wait(interval):
+            try:
+                extend_job_lease(self.job_id, self.worker_id, self.visibility_timeout)
+            except Exception as e:
+                print(f"⚠️ Could not extend lease of job {self.job_id}: {e}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+
+def run_job(job: Dict[str, Any], worker_id: str, visibility_timeout: int = VISIBILITY_TIMEOUT) -> str:
+    """
+    Run one claimed job and record its outcome; returns the job's new status,
+    or "lost" when its lease expired and another worker reclaimed it.
+    """
+    handler = JOB_HANDLERS[job["job_type"]]
+    print(f"⚙️ [{worker_id}] Running {job['job_type']} job {job['job_id']} for story {job['story_id']} (attempt {job['attempts']})")
+    try:
+        with _LeaseKeeper(str(job["job_id"]), worker_id, visibility_timeout):
+            result = handler(job)
+        if not complete_job(job["job_id"], worker_id, result):
+            print(f"⚠️ [{worker_id}] {job['job_type']} job {job['job_id']} was reclaimed by another worker; result discarded")
+            return "lost"
+        print(f"✅ [{worker_id}] {job['job_type']} job {job['job_id']} succeeded")
+        return "succeeded"
+    except PermanentJobError as e:
+        status = fail_job(job, worker_id, str(e), permanent=True)
+    except Exception as e:
+        status = fail_job(job, worker_id, f"{e}\n{traceback.format_exc()}")
+    if status is None:
+        print(f"⚠️ [{worker_id}] {job['job_type']} job {job['job_id']} was reclaimed by another worker; failure discarded")
+        return "lost"
+    print(f"❌ [{worker_id}] {job['job_type']} job {job['job_id']} failed, now {status}")
+    return status
+
+
+def run_worker(
+    worker_id: Optional[str] = None,
+    job_types: Optional[List[str]] = None,
+    poll_interval: float = POLL_INTERVAL,
+    stop_event: Optional[threading.Event] = None,
+    max_jobs: Optional[int] = None
+) -> int:
+    """
+    Claim and run jobs until stop_event is set (or max_jobs have run).
+    Any number of workers, in any number of processes or hosts, can run this
+    against the same database. Returns the number of jobs processed.
+    """
+    worker_id = worker_id or default_worker_id()
+    job_types = list(job_types or JOB_TYPES)
+    stop_event = stop_event or threading.Event()
+    processed = 0
+
+    print(f"👷 Worker {worker_id} started for job types: {', '.join(job_types)}")
+    while not stop_event.is_set() and (max_jobs is None or processed < max_jobs):
+        try:
+            job = claim_job(worker_id, job_types)
+        except Exception as e:
+            print(f"❌ [{worker_id}] Could not claim a job: {e}")
+            job = None
+        if job is None:
+            stop_event.wait(poll_interval)
+            continue
+        run_job(job, worker_id)
+        processed += 1
+
+    print(f"👋 Worker {worker_id} stopped after {processed} jobs")
+    return processed
@@ -0,0 +1,170 @@
+import os
+import shutil
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+from app.config import EMBEDDING_MODEL
+from app.utils.metrics import track_stage
+
+UPLOAD_FOLDER = os.getenv("UPLOAD_FOLDER", "./data/uploaded_docs")
+SUCCESS_FOLDER = os.getenv("SUCCESS_FOLDER", "./data/success")
+FAILURE_FOLDER = os.getenv("FAILURE_FOLDER", "./data/failure")
+# API uploads wait here for their job, outside the folder the scheduler scans
+STAGING_FOLDER = os.getenv("UPLOAD_STAGING_FOLDER", "./data/upload_staging")
+
+ALLOWED_EXTENSIONS = {'.pdf', '.docx', '.txt'}
+
+# emit(event, data) receives one pipeline event; see process_story_upload
+EmitFn = Callable[[str, Dict[str, Any]], None]
+
+
+class UploadError(Exception):
+    """An uploaded story that cannot be processed; status_code is the HTTP status to report"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def staged_upload_path(project_id: str, story_id: str, file_ext: str) -> str:
+    """
+    A fresh path for an API upload's file. Each upload gets its own directory,
+    so a duplicate request never overwrites the input of a job still running,
+    while the file keeps its <story_id><ext> name.
+    """
+    upload_dir = os.path.join(STAGING_FOLDER, project_id, uuid.uuid4().hex)
+    os.makedirs(upload_dir)
+    return os.path.join(upload_dir, f"{story_id}{file_ext}")
+
+
+def remove_staging_dir(file_path: str) -> None:
+    """Delete the per-upload staging directory a file was moved out of"""
+    upload_dir = os.path.dirname(os.path.abspath(file_path))
+    if os.path.dirname(os.path.dirname(upload_dir)) == os.path.abspath(STAGING_FOLDER):
+        shutil.rmtree(upload_dir, ignore_errors=True)
+
+
+def discard_staged_upload(file_path: Optional[str]) -> None:
+    """Delete the file of an upload that was rejected before any job took it"""
+    if file_path:
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        remove_staging_dir(file_path)
+
+
+def _move_input(file_path: Optional[str], project_id: str, base_folder: str) -> None:
+    if file_path and os.path.exists(file_path):
+        target_dir = os.path.join(base_folder, project_id)
+        os.makedirs(target_dir, exist_ok=True)
+        shutil.move(file_path, os.path.join(target_dir, os.path.basename(file_path)))
+        remove_staging_dir(file_path)
+
+
+def process_story_upload(
+    project_id: str,
+    story_id: str,
+    file_path: Optional[str] = None,
+    content: Optional[str] = None,
+    source: str = "backend",
+    emit: Optional[EmitFn] = None
+) -> Dict[str, Any]:
+    """
+    Run the upload pipeline for one story: extract, summarize, embed into
+    LanceDB, generate test cases and analyze impacts.
+
+    emit is called as each stage completes with one of the events extracted,
+    summarized, embedded, batch (one per parsed generation batch), generated
+    and impacts. Raises UploadError when the input cannot be processed, or
+    with status 409 when the story is already stored (for example added by the
+    scheduler's folder scan in the meantime).
+    """
+    from app.datapipeline.embedding_generator import add_story_to_lance, story_id_exists, summarize_in_chunks, table
+    from app.LLM.Test_case_generator import generate_test_case_for_story
+    from app.LLM.impact_analyzer import analyze_test_case_impacts
+
+    emit = emit or (lambda event, data: None)
+
+    if story_id_exists(table, story_id):
+        _move_input(file_path, project_id, FAILURE_FOLDER)
+        raise UploadError(f'Story with ID "{story_id}" already exists', 409)
+
+    # Extract text from the file if one was uploaded
+    story_content = content
+    if file_path:
+        from app.datapipeline.text_extractor import extract_text
+        try:
+            with track_stage("extract", project_id):
+                story_content = extract_text(file_path)
+        except Exception as e:
+            raise UploadError(f"Error extracting text from file: {str(e)}", 500)
+        if not story_content:
+            _move_input(file_path, project_id, FAILURE_FOLDER)
+            raise UploadError("Could not extract text from the uploaded file")
+    emit("extracted", {"characters": len(story_content)})
+
+    # Generate AI description from content
+    try:
+        description = summarize_in_chunks(story_content, project_id=project_id, story_id=story_id)
+    except Exception as e:
+        print(f"Error generating AI description: {str(e)}")
+        description = story_content[:147] + "..." if len(story_content) > 150 else story_content
+    emit("summarized", {"description": description})
+
+    # Add to LanceDB
+    try:
+        with track_stage("embed", project_id):
+            embedding = EMBEDDING_MODEL.encode(story_content).tolist()
+        add_story_to_lance(
+            project_id,
+            story_id,
+            description,
+            story_content,
+            embedding,
+            os.path.basename(file_path) if file_path else f"{story_id}.txt",
+            file_path,
+            source
+        )
+    except Exception as e:
+        raise UploadError(f"Error adding story to database: {str(e)}", 500)
+    emit("embedded", {"vector_length": len(embedding)})
+
+    # Generate test cases, reporting each batch as soon as it is parsed
+    def on_batch(batch_index, batch_total, parts, test_cases):
+        emit("batch", {
+            "batch_index": batch_index,
+            "batch_total": batch_total,
+            "categories": {part["type"]: part["count"] for part in parts},
+            "test_cases": test_cases
+        })
+
+    try:
+        test_cases = generate_test_case_for_story(story_id, analyze_impacts=False, on_batch=on_batch)
+    except Exception as e:
+        _move_input(file_path, project_id, FAILURE_FOLDER)
+        raise UploadError(f"Error generating test cases: {str(e)}", 500)
+
+    result = {
+        "story_id": story_id,
+        "project_id": project_id,
+        "description": description,
+        "test_cases_generated": bool(test_cases),
+        "file_processed": file_path is not None,
+        "source": source
+    }
+    if not test_cases:
+        _move_input(file_path, project_id, FAILURE_FOLDER)
+        emit("generated", {"total_test_cases": 0})
+        return result
+
+    _move_input(file_path, project_id, SUCCESS_FOLDER)
+    result["total_test_cases"] = test_cases.get("total_test_cases", len(test_cases.get("test_cases", [])))
+    emit("generated", {"total_test_cases": result["total_test_cases"]})
+
+    # Impact analysis failures do not undo an otherwise successful upload
+    try:
+        result["impacts_stored"] = analyze_test_case_impacts(story_id, project_id)
+    except Exception as e:
+        print(f"❌ Impact analysis failed for {story_id}: {e}")
+        result["impacts_stored"] = None
+    emit("impacts", {"impacts_stored": result["impacts_stored"]})
+    return result
@@ -0,0 +1,82 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from app.services.job_queue import (
+    complete_job,
+    default_worker_id,
+    expire_inprocess_jobs,
+    fail_job,
+    start_inprocess_job,
+    update_job_progress
+)
+from app.services.story_upload import process_story_upload
+
+# Uploads processed at once by this Flask process when no queue workers are used
+UPLOAD_EXECUTOR_WORKERS = int(os.getenv("UPLOAD_EXECUTOR_WORKERS", "2"))
+
+_executor = ThreadPoolExecutor(max_workers=UPLOAD_EXECUTOR_WORKERS, thread_name_prefix="upload")
+
+
+class UploadProgress:
+    """Folds pipeline events into the progress document stored on the job"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.state = {"stage": "queued", "batches_done": 0, "batch_total": None, "test_cases_so_far": 0}
+        self._lock = threading.Lock()
+
+    def emit(self, event: str, data: Dict[str, Any]):
+        with self._lock:
+            if event == "batch":
+                self.state["stage"] = "generating"
+                self.state["batches_done"] += 1
+                self.state["batch_total"] = data["batch_total"]
+                self.state["test_cases_so_far"] += len(data["test_cases"])
+            else:
+                self.state["stage"] = event
+                if event == "summarized":
+                    self.state["description"] = data["description"]
+            snapshot = dict(self.state)
+        try:
+            update_job_progress(self.job_id, snapshot)
+        except Exception as e:
+            print(f"⚠️ Could not update progress of job {self.job_id}: {e}")
+
+
+def _run_upload(job_id: str, worker_id: str, upload: Dict[str, Any]):
+    progress = UploadProgress(job_id)
+    progress.emit("started", {})
+    try:
+        result = process_story_upload(
+            upload["project_id"],
+            upload["story_id"],
+            file_path=upload["file_path"],
+            content=upload["content"],
+            source=upload["source"],
+            emit=progress.emit
+        )
+        complete_job(job_id, worker_id, result)
+    except Exception as e:
+        print(f"❌ Upload job {job_id} failed: {e}")
+        fail_job({"job_id": job_id, "attempts": 1, "max_attempts": 1}, worker_id, str(e), permanent=True)
+
+
+def submit_story_upload(upload: Dict[str, Any]) -> str:
+    """
+    Record an upload job and run the pipeline on this process's executor.
+    Returns the job_id to poll with GET /api/jobs/<job_id>.
+    """
+    # An upload left running by a crashed process must not block this one
+    expire_inprocess_jobs()
+    worker_id = default_worker_id()
+    job_id = start_inprocess_job(
+        "upload",
+        {key: upload[key] for key in ("file_path", "source")},
+        worker_id=worker_id,
+        story_id=upload["story_id"],
+        project_id=upload["project_id"]
+    )
+    _executor.submit(_run_upload, job_id, worker_id, upload)
+    return job_id
@@ -0,0 +1,181 @@
+import re
+import json
+import time
+import math
+import random
+import asyncio
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+# Categories and counts the generation prompt asks for, e.g. "- 6 negative test cases, focusing on: ..."
+_CATEGORY_LINE = re.compile(r"^- (\d+) (\w+) test cases", re.MULTILINE)
+_TEST_CASE_ID = re.compile(r'"id":\s*"([^"]+)"')
+_WORD = re.compile(r"[a-z0-9]+")
+
+_TOPICS = ["login", "search", "checkout", "profile update", "report export", "notification", "file upload", "permissions"]
+_CONDITIONS = ["valid input", "missing fields", "maximum length", "expired session", "concurrent users", "slow network"]
+
+
+class FakeLLMError(RuntimeError):
+    """Injected failure of the fake model (see failure_rate)"""
+    pass
+
+
+class FakeChatModel:
+    """
+    Offline stand-in for the Gemini chat model, for benchmarks and air-gapped
+    load tests.
+
+    Answers generation, impact and summary prompts with synthetic responses
+    that conform to the schemas in app.LLM.structured_output. Latency is
+    drawn from a lognormal distribution around latency_ms; failure_rate
+    raises FakeLLMError and malformed_rate returns non-conforming JSON. With
+    a seed every response depends only on the seed, the prompt and how often
+    that prompt was sent, so runs are reproducible regardless of thread
+    scheduling.
+    """
+
+    supports_response_schema = True
+
+    def __init__(
+        self,
+        seed: Optional[int] = None,
+        latency_ms: float = 0.0,
+        latency_sigma: float = 0.5,
+        failure_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        model: str = "fake"
+    ):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.model = model
+        self._calls: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def _rng(self, prompt: str) -> random.Random:
+        if self.seed is None:
+            return random.Random()
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        with self._lock:
+            attempt = self._calls.get(digest, 0)
+            self._calls[digest] = attempt + 1
+        return random.Random(f"{self.seed}:{digest}:{attempt}")
+
+    def invoke(self, prompt, response_schema: Optional[Dict[str, Any]] = None, **kwargs):
+        from langchain_core.messages import AIMessage
+
+        prompt = prompt if isinstance(prompt, str) else str(prompt)
+        rng = self._rng(prompt)
+
+        if self.latency_ms > 0:
+            time.sleep(rng.lognormvariate(math.log(self.latency_ms), self.latency_sigma) / 1000)
+        if rng.random() < self.failure_rate:
+            raise FakeLLMError("Injected fake LLM failure")
+
+        properties = (response_schema or {}).get("properties", {})
+        if "test_cases" in properties or _CATEGORY_LINE.search(prompt) or "test cases in JSON" in prompt:
+            content = self._test_cases(prompt, rng)
+        elif "has_impact" in properties:
+            content = self._impact_verdict(prompt, rng)
+        else:
+            content = self._summary(prompt, rng)
+
+        if rng.random() < self.malformed_rate:
+            # Cut the response short, as a model hitting its output limit would
+            content = content[:max(1, len(content) * 2 // 3)]
+
+        message = AIMessage(content=content, response_metadata={"finish_reason": "STOP", "model": self.model})
+        message.usage_metadata = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": (len(prompt) + len(content)) // 4
+        }
+        return message
+
+    async def ainvoke(self, prompt, response_schema: Optional[Dict[str, Any]] = None, **kwargs):
+        return await asyncio.to_thread(self.invoke, prompt, response_schema, **kwargs)
+
+    def _test_cases(self, prompt: str, rng: random.Random) -> str:
+        requested = [(int(count), category) for count, category in _CATEGORY_LINE.findall(prompt)] or [(5, "positive")]
+        test_cases = []
+        for count, category in requested:
+            for _ in range(count):
+                topic = rng.choice(_TOPICS)
+                condition = rng.choice(_CONDITIONS)
+                test_cases.append({
+                    "id": f"TC{len(test_cases) + 1}",
+                    "category": category,
+                    "title": f"Verify {topic} with {condition} ({category} #{rng.randint(1000, 9999)})",
+                    "steps": [
+                        f"Step {i + 1}: Perform {topic} action {i + 1} using {condition}"
+                        for i in range(rng.randint(2, 5))
+                    ],
+                    "expected_result": f"The {topic} flow handles {condition} correctly",
+                    "priority": rng.choice(["High", "Medium", "Low"])
+                })
+        return json.dumps({"test_cases": test_cases})
+
+    def _impact_verdict(self, prompt: str, rng: random.Random) -> str:
+        _, _, original = prompt.partition("ORIGINAL TEST CASES:")
+        ids = _TEST_CASE_ID.findall(original)
+        if not ids or rng.random() < 0.6:
+            return json.dumps({"has_impact": False, "impact_type": "NO_IMPACT", "impacted_test_cases": []})
+
+        impacted = []
+        for test_case_id in rng.sample(ids, min(len(ids), rng.randint(1, 3))):
+            impacted.append({
+                "original_test_case_id": test_case_id,
+                "modification_reason": "The new story changes the validated behaviour",
+                "impact_severity": rng.choice(["high", "medium", "low"]),
+                "severity_reason": "The changed behaviour is part of the tested flow",
+                "modified_test_case": {
+                    "id": test_case_id,
+                    "title": f"Updated check for {test_case_id}",
+                    "steps": ["Step 1: Repeat the original flow", "Step 2: Validate the changed behaviour"],
+                    "expected_result": "The changed behaviour is applied",
+                    "priority": rng.choice(["High", "Medium", "Low"])
+                }
+            })
+        return json.dumps({"has_impact": True, "impact_type": "MODIFY", "impacted_test_cases": impacted})
+
+    def _summary(self, prompt: str, rng: random.Random) -> str:
+        words = [word for word in _WORD.findall(prompt.lower()) if len(word) > 3]
+        picked = rng.sample(words, min(len(words), 8)) if words else ["the", "story"]
+        return f"Story about {' '.join(picked)}."
+
+
+class FakeEmbeddingModel:
+    """
+    Offline stand-in for the SentenceTransformer model: hashed bag-of-words
+    vectors of the same dimension, so texts sharing words stay similar and
+    the same text always gets the same vector.
+    """
+
+    def __init__(self, dimension: int = 768):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dimension
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in _WORD.findall((text or "").lower()):
+            bucket = int(hashlib.md5(word.encode("utf-8")).hexdigest()[:8], 16)
+            vector[bucket % self.dimension] += 1.0 if bucket & 1 else -1.0
+        return vector
+
+    def encode(self, sentences, normalize_embeddings: bool = False, **kwargs) -> np.ndarray:
+        single = isinstance(sentences, str)
+        if not single and len(sentences) == 0:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        vectors = np.vstack([self._embed(text) for text in ([sentences] if single else sentences)])
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.where(norms == 0, 1.0, norms)
+        return vectors[0] if single else vectors
@@ -0,0 +1,8 @@
+def lance_literal(value: str) -> str:
+    """Quote a string for use in a LanceDB filter expression"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def lance_in_list(values) -> str:
+    """Render a list of strings as the body of a LanceDB IN (...) filter"""
+    return ", ".join(lance_literal(value) for value in values)
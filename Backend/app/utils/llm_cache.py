@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# off     - call the model every time
+# cache   - serve identical prompts from the store, call and store on a miss
+# record  - always call the model and overwrite the stored response
+# replay  - only serve stored responses; a miss raises LLMCacheMiss
+CACHE_MODES = ("off", "cache", "record", "replay")
+
+# Off by default: generation runs at a non-zero temperature, and a cached
+# answer would make regenerating a story return the identical suite.
+LLM_CACHE_MODE = os.getenv("LLM_CACHE_MODE", "off").lower()
+LLM_CACHE_PATH = os.getenv(
+    "LLM_CACHE_PATH",
+    os.path.join(tempfile.gettempdir(), "test_case_generator_llm_cache.sqlite3")
+)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", "30"))  # 0 keeps entries until evicted by size
+
+
+class LLMCacheMiss(Exception):
+    """Raised in replay mode when a prompt has no recorded response"""
+    pass
+
+
+class LLMResponseCache:
+    """
+    SQLite store of LLM responses shared by every process on the host.
+    Entries expire after ttl_days and the least recently used ones are
+    evicted once the store holds more than max_entries.
+    """
+
+    def __init__(self, path: str = LLM_CACHE_PATH, max_entries: int = LLM_CACHE_MAX_ENTRIES, ttl_days: float = LLM_CACHE_TTL_DAYS):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_days * 86400
+        self._writes = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_used ON responses(last_used)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed"""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds and now - row[1] > self.ttl_seconds:
+                conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+                return None
+            conn.execute(
+                "UPDATE responses SET last_used = ?, hits = hits + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+            return json.loads(row[0])
+
+    def contains(self, cache_key: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT created_at FROM responses WHERE cache_key = ?", (cache_key,)).fetchone()
+        return row is not None and not (self.ttl_seconds and time.time() - row[0] > self.ttl_seconds)
+
+    def put(self, cache_key: str, model: str, response: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("""
+                INSERT INTO responses (cache_key, model, response, created_at, last_used)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT(cache_key) DO UPDATE SET
+                    response = excluded.response,
+                    created_at = excluded.created_at,
+                    last_used = excluded.last_used
+            """, (cache_key, model, json.dumps(response, default=str), now, now))
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % 100 == 0
+        if evict:
+            self.evict()
+
+    def delete(self, cache_key: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM responses WHERE cache_key = ?", (cache_key,))
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used ones above max_entries"""
+        with self._connect() as conn:
+            removed = 0
+            if self.ttl_seconds:
+                removed += conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?",
+                    (time.time() - self.ttl_seconds,)
+                ).rowcount
+            removed += conn.execute("""
+                DELETE FROM responses WHERE cache_key IN (
+                    SELECT cache_key FROM responses
+                    ORDER BY last_used DESC
+                    LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,)).rowcount
+            return removed
+
+
+def _prompt_text(prompt) -> str:
+    """Stable text form of a prompt (a string or a list of chat messages)"""
+    if isinstance(prompt, str):
+        return prompt
+    if isinstance(prompt, (list, tuple)):
+        return json.dumps(
+            [[getattr(m, "type", type(m).__name__), getattr(m, "content", m)] for m in prompt],
+            default=str
+        )
+    return str(prompt)
+
+
+class CachedLLM:
+    """
+    Wraps a LangChain chat model so that identical prompts sent with the same
+    model, temperature and invoke arguments (e.g. response_schema) are answered
+    from the response cache. Anything other than invoke/ainvoke is forwarded
+    to the wrapped model.
+    """
+
+    def __init__(self, llm, model: str, temperature: float, cache: Optional[LLMResponseCache] = None, mode: str = LLM_CACHE_MODE):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode}")
+        self.llm = llm
+        self.model = model
+        self.temperature = temperature
+        self.mode = mode
+        self.cache = cache if cache is not None or mode == "off" else _shared_cache()
+
+    def __getattr__(self, name):
+        return getattr(self.llm, name)
+
+    def cache_key(self, prompt, *args, **kwargs) -> str:
+        key = [self.model, self.temperature, _prompt_text(prompt)]
+        if args or kwargs:
+            # Plain calls keep the keys they had before arguments were hashed
+            key.append(json.dumps([args, kwargs], sort_keys=True, default=str))
+        raw = json.dumps(key)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def is_cached(self, prompt, *args, **kwargs) -> bool:
+        """True when invoke(prompt, *args, **kwargs) will be served without calling the model"""
+        if self.mode in ("off", "record"):
+            return False
+        return self.cache.contains(self.cache_key(prompt, *args, **kwargs))
+
+    def evict(self, prompt, *args, **kwargs) -> None:
+        """Forget a stored response, e.g. one that failed downstream parsing, so a retry calls the model"""
+        if self.mode in ("cache", "record"):
+            self.cache.delete(self.cache_key(prompt, *args, **kwargs))
+
+    def _lookup(self, cache_key):
+        if self.mode in ("off", "record"):
+            return None
+        cached = self.cache.get(cache_key)
+        if cached is None and self.mode == "replay":
+            raise LLMCacheMiss(f"No recorded response for prompt {cache_key[:12]}")
+        return _to_message(cached) if cached is not None else None
+
+    def _store(self, cache_key, response) -> None:
+        if self.mode in ("cache", "record"):
+            self.cache.put(cache_key, self.model, _from_message(response))
+
+    def invoke(self, prompt, *args, **kwargs):
+        cache_key = self.cache_key(prompt, *args, **kwargs)
+        response = self._lookup(cache_key)
+        if response is None:
+            response = self.llm.invoke(prompt, *args, **kwargs)
+            self._store(cache_key, response)
+        return response
+
+    async def ainvoke(self, prompt, *args, **kwargs):
+        cache_key = self.cache_key(prompt, *args, **kwargs)
+        response = self._lookup(cache_key)
+        if response is None:
+            response = await self.llm.ainvoke(prompt, *args, **kwargs)
+            self._store(cache_key, response)
+        return response
+
+
+def _from_message(response) -> Dict[str, Any]:
+    return {
+        "content": response.content,
+        "response_metadata": getattr(response, "response_metadata", None) or {},
+        "usage_metadata": getattr(response, "usage_metadata", None)
+    }
+
+
+def _to_message(cached: Dict[str, Any]):
+    from langchain_core.messages import AIMessage
+
+    message = AIMessage(
+        content=cached["content"],
+        response_metadata={**cached.get("response_metadata", {}), "cache_hit": True}
+    )
+    if cached.get("usage_metadata"):
+        message.usage_metadata = cached["usage_metadata"]
+    return message
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _shared_cache() -> LLMResponseCache:
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMResponseCache()
+        return _cache
+
+
+def is_cached(llm, prompt, *args, **kwargs) -> bool:
+    """is_cached for any model object; plain (unwrapped) models are never cached"""
+    return isinstance(llm, CachedLLM) and llm.is_cached(prompt, *args, **kwargs)
+
+
+def evict_cached(llm, prompt, *args, **kwargs) -> None:
+    """evict for any model object; a no-op for plain models"""
+    if isinstance(llm, CachedLLM):
+        llm.evict(prompt, *args, **kwargs)
@@ -0,0 +1,165 @@
+import os
+import time
+import inspect
+import functools
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Histogram, generate_latest, start_http_server
+
+# Port of the standalone /metrics listener for processes without a Flask app (0 disables it)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Store every LLM call in the llm_usage table (see app.models.llm_usage)
+LLM_USAGE_TRACKING = os.getenv("LLM_USAGE_TRACKING", "true").lower() == "true"
+
+# Seconds, from sub-millisecond Postgres lookups to multi-minute impact analyses
+_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "tcg_stage_duration_seconds",
+    "Duration of pipeline stages (extract, summarize, embed, lance_add, lance_search, json_parse, impact_analysis, excel_build)",
+    ["stage", "project", "outcome"],
+    buckets=_BUCKETS
+)
+LLM_CALL_SECONDS = Histogram(
+    "tcg_llm_call_duration_seconds",
+    "Duration of LLM calls by purpose; cache_hit outcomes were answered from the response cache",
+    ["purpose", "project", "outcome"],
+    buckets=_BUCKETS
+)
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "tcg_rate_limit_wait_seconds",
+    "Time LLM calls waited for a rate limit token, by bucket; kept out of the LLM call durations",
+    ["bucket", "project"],
+    buckets=_BUCKETS
+)
+POSTGRES_QUERY_SECONDS = Histogram(
+    "tcg_postgres_query_duration_seconds",
+    "Duration of named Postgres queries, including the connection",
+    ["query", "project", "outcome"],
+    buckets=_BUCKETS
+)
+
+TEST_CASES_GENERATED = Counter("tcg_test_cases_generated_total", "Test cases stored for generated stories", ["project"])
+DUPLICATES_DROPPED = Counter("tcg_duplicates_dropped_total", "Near-duplicate test cases removed before storing", ["project"])
+IMPACTS_STORED = Counter("tcg_impacts_stored_total", "Test case impacts stored by impact analysis", ["project"])
+
+
+@contextmanager
+def _observe(histogram, name, project):
+    """
+    Time the block into histogram. The yielded dict's "outcome" may be set by
+    the block (e.g. "cache_hit"); it becomes "error" when the block raises.
+    """
+    labels = {"outcome": "success"}
+    started = time.perf_counter()
+    try:
+        yield labels
+    except BaseException:
+        labels["outcome"] = "error"
+        raise
+    finally:
+        histogram.labels(name, project or "", labels["outcome"]).observe(time.perf_counter() - started)
+
+
+def track_stage(stage, project=""):
+    return _observe(STAGE_SECONDS, stage, project)
+
+
+@contextmanager
+def track_llm(purpose, project="", story_id=None, attempt=0, run_id=None):
+    """
+    Time one LLM call and record its usage. The block sets call["prompt"] and
+    call["response"], and call["outcome"] = "cache_hit" when the response
+    cache answers; attempt is the retry number (0 for the first call). Pass
+    run_id for calls made after the story's suite is stored.
+    """
+    call = {"outcome": "success", "prompt": None, "response": None}
+    started = time.perf_counter()
+    try:
+        yield call
+    except BaseException:
+        call["outcome"] = "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        LLM_CALL_SECONDS.labels(purpose, project or "", call["outcome"]).observe(elapsed)
+        if LLM_USAGE_TRACKING:
+            _record_usage(purpose, project, story_id, attempt, call, elapsed, run_id)
+
+
+def _record_usage(purpose, project, story_id, attempt, call, elapsed, run_id=None):
+    from app.config import LLM_MODEL
+    from app.LLM.prompt_packer import estimate_tokens
+    from app.models.llm_usage import record_llm_usage
+
+    cache_hit = call["outcome"] == "cache_hit"
+    usage = getattr(call["response"], "usage_metadata", None) or {}
+    input_tokens = usage.get("input_tokens")
+    output_tokens = usage.get("output_tokens")
+    estimated = input_tokens is None or output_tokens is None
+    if cache_hit or call["response"] is None:
+        # Cached answers and failed calls spend no output tokens
+        input_tokens = output_tokens = 0
+        estimated = False
+    elif estimated:
+        input_tokens = estimate_tokens(str(call["prompt"] or ""))
+        output_tokens = estimate_tokens(str(getattr(call["response"], "content", "") or ""))
+
+    record_llm_usage(
+        purpose,
+        LLM_MODEL,
+        project_id=project,
+        story_id=story_id,
+        run_id=run_id,
+        prompt=call["prompt"],
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        tokens_estimated=estimated,
+        latency_ms=elapsed * 1000,
+        attempt=attempt,
+        cache_hit=cache_hit,
+        outcome=call["outcome"]
+    )
+
+
+def wait_for_quota(bucket, project=""):
+    """Take a rate limit token before an LLM call and record how long that waited"""
+    RATE_LIMIT_WAIT_SECONDS.labels(bucket.name, project or "").observe(bucket.acquire())
+
+
+async def wait_for_quota_async(bucket, project=""):
+    """Async variant of wait_for_quota that yields to the event loop while waiting"""
+    RATE_LIMIT_WAIT_SECONDS.labels(bucket.name, project or "").observe(await bucket.acquire_async())
+
+
+def track_query(query, project=""):
+    return _observe(POSTGRES_QUERY_SECONDS, query, project)
+
+
+def timed_query(query):
+    """
+    Decorator recording each call of a Postgres access function as the named
+    query; the project label comes from the function's project_id argument.
+    """
+    def decorate(fn):
+        signature = inspect.signature(fn)
+
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            project = signature.bind_partial(*args, **kwargs).arguments.get("project_id") or ""
+            with track_query(query, project):
+                return fn(*args, **kwargs)
+        return timed
+    return decorate
+
+
+def metrics_response():
+    """(body, headers) of a Prometheus scrape, for Flask /metrics routes"""
+    return generate_latest(), {"Content-Type": CONTENT_TYPE_LATEST}
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serve /metrics on its own port, for processes such as worker.py that have no Flask app"""
+    if port:
+        start_http_server(port)
+        print(f"📏 Metrics available on :{port}/metrics")
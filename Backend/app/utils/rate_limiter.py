@@ -0,0 +1,188 @@
+import os
+import json
+import math
+import time
+import asyncio
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional, Union
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# Directory holding one state file per bucket; every process on the host that
+# points at the same directory shares the same budgets
+RATE_LIMIT_STATE_DIR = os.getenv(
+    "RATE_LIMIT_STATE_DIR",
+    os.path.join(tempfile.gettempdir(), "test_case_generator_rate_limits")
+)
+
+# Calls per minute of the Gemini account; every LLM purpose draws from this one bucket
+GEMINI_RATE_PER_MINUTE = float(os.getenv("RATE_LIMIT_GEMINI_PER_MINUTE", "50"))
+
+# Per-purpose caps applied on top of the shared gemini bucket. A purpose may use
+# the whole quota while the others are idle; the caps only keep impact analysis
+# and summaries from crowding out generation when everything runs at once.
+LLM_PURPOSE_CAPS = {
+    "generation": float(os.getenv("RATE_LIMIT_GENERATION_PER_MINUTE", str(GEMINI_RATE_PER_MINUTE))),
+    "impact": float(os.getenv("RATE_LIMIT_IMPACT_PER_MINUTE", str(GEMINI_RATE_PER_MINUTE * 0.8))),
+    "summary": float(os.getenv("RATE_LIMIT_SUMMARY_PER_MINUTE", str(GEMINI_RATE_PER_MINUTE * 0.4))),
+}
+
+# Calls per minute for the other named buckets
+DEFAULT_BUCKET_RATES = {
+    "gemini": GEMINI_RATE_PER_MINUTE,
+    "jira": 60.0 / max(float(os.getenv("JIRA_RATE_LIMIT_DELAY", "1.0")), 0.001),
+}
+# Burst sizes that differ from the TokenBucket default; Jira gets one call per delay, without bursting
+DEFAULT_BUCKET_CAPACITIES = {
+    "jira": 1.0,
+}
+
+
+@contextmanager
+def _file_lock(path: str):
+    """Exclusive cross-process lock on a state file, yielding the open file"""
+    if not os.path.exists(path):
+        open(path, "a").close()
+    with open(path, "r+") as f:
+        if os.name == "nt":
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        else:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield f
+        finally:
+            if os.name == "nt":
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class TokenBucket:
+    """
+    Token bucket limiter whose state lives in a locked file so that the Flask
+    app, the scheduler and any worker processes draw from one shared budget.
+
+    Tokens refill continuously at rate_per_minute up to capacity; acquire
+    sleeps exactly as long as needed for the next token instead of polling.
+    """
+
+    def __init__(self, name: str, rate_per_minute: float, capacity: Optional[float] = None, state_dir: str = RATE_LIMIT_STATE_DIR):
+        self.name = name
+        self.rate_per_minute = rate_per_minute
+        self.rate_per_second = rate_per_minute / 60.0
+        # Default burst: ten seconds worth of calls
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 6.0)
+        os.makedirs(state_dir, exist_ok=True)
+        self.state_path = os.path.join(state_dir, f"{name}.json")
+        self._lock = threading.Lock()
+
+    def _take(self, tokens: float) -> float:
+        """Try to take tokens; returns 0 on success, otherwise seconds to wait"""
+        with self._lock, _file_lock(self.state_path) as f:
+            now = time.time()
+            f.seek(0)
+            try:
+                state = json.loads(f.read() or "{}")
+            except ValueError:
+                state = {}
+            available = state.get("tokens", self.capacity)
+            updated = state.get("updated", now)
+            available = min(self.capacity, available + max(0.0, now - updated) * self.rate_per_second)
+
+            if available >= tokens:
+                available -= tokens
+                wait = 0.0
+            else:
+                wait = (tokens - available) / self.rate_per_second
+
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps({"tokens": available, "updated": now}))
+            f.flush()
+            return wait
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until tokens are available; returns the total time waited"""
+        waited = 0.0
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return waited
+            time.sleep(wait)
+            waited += wait
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Async variant of acquire that yields to the event loop while waiting"""
+        waited = 0.0
+        while True:
+            wait = self._take(tokens)
+            if wait <= 0:
+                return waited
+            await asyncio.sleep(wait)
+            waited += wait
+
+
+class CappedBucket:
+    """
+    A purpose's cap bucket in front of the shared bucket: a call takes a
+    token from its cap first, then from the shared quota.
+    """
+
+    def __init__(self, cap: TokenBucket, shared: TokenBucket):
+        self.name = cap.name
+        self.cap = cap
+        self.shared = shared
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        """Block until both buckets have tokens; returns the total time waited"""
+        return self.cap.acquire(tokens) + self.shared.acquire(tokens)
+
+    async def acquire_async(self, tokens: float = 1.0) -> float:
+        """Async variant of acquire that yields to the event loop while waiting"""
+        return await self.cap.acquire_async(tokens) + await self.shared.acquire_async(tokens)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_capped: Dict[str, CappedBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def _bucket(name: str, rate_per_minute: Optional[float] = None, capacity: Optional[float] = None) -> TokenBucket:
+    bucket = _buckets.get(name)
+    if bucket is None:
+        rate = rate_per_minute if rate_per_minute is not None else DEFAULT_BUCKET_RATES.get(name, 50.0)
+        if capacity is None:
+            capacity = DEFAULT_BUCKET_CAPACITIES.get(name)
+        bucket = _buckets[name] = TokenBucket(name, rate, capacity)
+    elif (rate_per_minute is not None and not math.isclose(rate_per_minute, bucket.rate_per_minute)) or (
+        capacity is not None and not math.isclose(capacity, bucket.capacity)
+    ):
+        # Buckets of one name share a state file, so they cannot have different limits
+        raise ValueError(
+            f"Rate limit bucket {name!r} already exists with {bucket.rate_per_minute:g} calls per minute "
+            f"and capacity {bucket.capacity:g}; requested {rate_per_minute} and {capacity}"
+        )
+    return bucket
+
+
+def get_bucket(name: str, rate_per_minute: Optional[float] = None, capacity: Optional[float] = None) -> Union[TokenBucket, CappedBucket]:
+    """
+    Get the process-wide bucket for a name. The LLM purposes (generation,
+    impact, summary) get their cap in front of the shared gemini bucket;
+    other names (jira, ...) get a plain TokenBucket. Asking again for an
+    existing bucket with a different rate or capacity raises ValueError.
+    """
+    with _buckets_lock:
+        if name in LLM_PURPOSE_CAPS and rate_per_minute is None:
+            cap = _bucket(name, LLM_PURPOSE_CAPS[name], capacity)
+            if name not in _capped:
+                _capped[name] = CappedBucket(cap, _bucket("gemini"))
+            return _capped[name]
+        return _bucket(name, rate_per_minute, capacity)
@@ -0,0 +1,398 @@
+"""
+End-to-end throughput benchmark of the scheduler pipeline.
+
+Synthesizes projects of txt/docx/pdf stories, runs the folder pipeline,
+test case generation and impact analysis against a local Postgres database
+and a temporary LanceDB, and writes per-stage throughput and p50/p95
+latencies to a JSON file. The LLM and embedding model are the offline fakes
+(LLM_BACKEND=fake, EMBEDDING_BACKEND=fake) unless --real-llm/--real-embeddings
+is given.
+
+Run from the repository root, e.g.
+
+    python Backend/benchmark.py --projects 2 --stories-per-project 10 50
+    python Backend/benchmark.py --compare Backend/benchmark_results/<earlier>.json
+
+Every value of --stories-per-project is one step; steps grow the same corpus,
+so later steps show how throughput changes with corpus size. The Postgres
+database named by --postgres-db is emptied before the run.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import zipfile
+import argparse
+import tempfile
+import functools
+import threading
+import subprocess
+from collections import defaultdict
+from datetime import datetime, timezone
+from xml.sax.saxutils import escape
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+
+# Add the Backend directory to Python path
+sys.path.insert(0, BACKEND_DIR)
+
+_ROLES = ["customer", "administrator", "support agent", "project manager", "auditor", "guest user"]
+_FEATURES = [
+    "reset a forgotten password", "export monthly reports", "filter orders by status",
+    "upload profile documents", "approve pending invoices", "receive delivery notifications",
+    "manage team permissions", "search the product catalogue", "schedule recurring payments"
+]
+_RULES = [
+    "Inputs longer than 255 characters are rejected",
+    "Only users with the editor role may change the record",
+    "The action is logged in the audit trail",
+    "A confirmation email is sent within one minute",
+    "The page responds within two seconds for 500 concurrent users",
+    "Sessions expire after 15 minutes of inactivity",
+    "Failed attempts are limited to five per hour"
+]
+
+
+def story_text(rng, project, number):
+    """Synthetic user story with acceptance criteria"""
+    role = rng.choice(_ROLES)
+    feature = rng.choice(_FEATURES)
+    rules = rng.sample(_RULES, rng.randint(2, 5))
+    lines = [
+        f"{project} story {number}",
+        f"As a {role}, I want to {feature} so that my work is not blocked.",
+        "",
+        "Acceptance criteria:"
+    ]
+    lines += [f"{i + 1}. {rule}." for i, rule in enumerate(rules)]
+    lines += ["", "Notes: " + " ".join(rng.choice(_FEATURES) for _ in range(rng.randint(3, 12)))]
+    return "\n".join(lines)
+
+
+def write_docx(path, text):
+    """Minimal Word document: one paragraph per line"""
+    paragraphs = "".join(
+        f"<w:p><w:r><w:t xml:space=\"preserve\">{escape(line)}</w:t></w:r></w:p>"
+        for line in text.splitlines()
+    )
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as docx:
+        docx.writestr("[Content_Types].xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            '<Default Extension="xml" ContentType="application/xml"/>'
+            '<Override PartName="/word/document.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+            '</Types>'
+        ))
+        docx.writestr("_rels/.rels", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+            'Target="word/document.xml"/>'
+            '</Relationships>'
+        ))
+        docx.writestr("word/document.xml", (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+            '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            f'<w:body>{paragraphs}</w:body></w:document>'
+        ))
+
+
+def write_pdf(path, text):
+    import fitz
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_textbox(fitz.Rect(50, 50, 545, 792), text, fontsize=10)
+    doc.save(path)
+    doc.close()
+
+
+def synthesize_corpus(upload_folder, projects, start, stop, formats, rng):
+    """Write stories start..stop-1 of every project into upload_folder/<project>/"""
+    written = 0
+    for p in range(projects):
+        project = f"BENCH{p + 1}"
+        folder = os.path.join(upload_folder, project)
+        os.makedirs(folder, exist_ok=True)
+        for number in range(start, stop):
+            story_id = f"{project}-S{number + 1:04d}"
+            text = story_text(rng, project, number + 1)
+            file_format = formats[number % len(formats)]
+            path = os.path.join(folder, f"{story_id}.{file_format}")
+            if file_format == "txt":
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(text)
+            elif file_format == "docx":
+                write_docx(path, text)
+            else:
+                write_pdf(path, text)
+            written += 1
+    return written
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class StageRecorder:
+    """Collects call latencies of the pipeline functions it wraps, per stage"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def wrap(self, stage, fn):
+        @functools.wraps(fn)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.latencies[stage].append(elapsed)
+                    if failed:
+                        self.errors[stage] += 1
+        return timed
+
+    def patch(self, owner, name, stage):
+        setattr(owner, name, self.wrap(stage, getattr(owner, name)))
+
+    def reset(self):
+        with self._lock:
+            self.latencies.clear()
+            self.errors.clear()
+
+    def summary(self):
+        with self._lock:
+            stages = {}
+            for stage, values in self.latencies.items():
+                busy = sum(values)
+                stages[stage] = {
+                    "calls": len(values),
+                    "errors": self.errors[stage],
+                    "busy_seconds": round(busy, 3),
+                    "p50_ms": round(percentile(values, 50) * 1000, 2),
+                    "p95_ms": round(percentile(values, 95) * 1000, 2),
+                    "max_ms": round(max(values) * 1000, 2),
+                    "calls_per_minute": round(len(values) * 60 / busy, 2) if busy else None
+                }
+            return stages
+
+
+class _TimedEncoder:
+    """Embedding model whose encode calls are recorded as the embed stage"""
+
+    def __init__(self, model, recorder):
+        self._model = model
+        self.encode = recorder.wrap("embed", model.encode)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def instrument(recorder):
+    """Wrap the pipeline entry points so every call is timed under its stage name"""
+    from app.datapipeline import embedding_generator
+    from app.LLM import Test_case_generator
+
+    recorder.patch(embedding_generator, "extract_text", "extract")
+    recorder.patch(embedding_generator, "summarize_in_chunks", "summarize")
+    recorder.patch(embedding_generator, "add_story_to_lance", "lance_add")
+    embedding_generator.EMBEDDING_MODEL = _TimedEncoder(embedding_generator.EMBEDDING_MODEL, recorder)
+
+    recorder.patch(Test_case_generator.TestCaseGenerator, "generate_test_cases", "generate")
+    recorder.patch(Test_case_generator, "insert_test_case", "postgres_store")
+    recorder.patch(Test_case_generator, "store_test_case_embeddings", "test_case_embed")
+    recorder.patch(Test_case_generator, "analyze_test_case_impacts", "impact_analysis")
+    recorder.patch(Test_case_generator, "generate_test_case_for_story", "story_total")
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(previous_path, result):
+    """Print phase throughput and stage p95 changes against an earlier result file"""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        previous = json.load(f)
+    print(f"\n📊 Compared with {previous.get('commit')} ({previous_path}):")
+    for old_step, new_step in zip(previous["steps"], result["steps"]):
+        print(f"  Corpus {new_step['corpus_stories']} stories:")
+        for phase, stats in new_step["phases"].items():
+            old = old_step["phases"].get(phase, {}).get("stories_per_minute")
+            new = stats["stories_per_minute"]
+            if old and new:
+                print(f"    {phase:<16} {old:>9.1f} → {new:>9.1f} stories/min ({(new - old) / old * 100:+.1f}%)")
+        for stage, stats in new_step["stages"].items():
+            old = old_step["stages"].get(stage, {}).get("p95_ms")
+            if old:
+                print(f"    {stage:<16} p95 {old:>9.1f} → {stats['p95_ms']:>9.1f} ms ({(stats['p95_ms'] - old) / old * 100:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the story ingestion, generation and impact pipeline")
+    parser.add_argument("--projects", type=int, default=2, help="Number of synthetic projects")
+    parser.add_argument("--stories-per-project", type=int, nargs="+", default=[10],
+                        help="Corpus size per project after each step, e.g. 10 50 100")
+    parser.add_argument("--formats", nargs="+", choices=["txt", "docx", "pdf"], default=["txt", "docx", "pdf"],
+                        help="Story file formats, used in rotation")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the corpus and of PIPELINE_SEED")
+    parser.add_argument("--postgres-db", default="test_case_generator_bench",
+                        help="Postgres database to use; it is created if missing and emptied first")
+    parser.add_argument("--llm-latency-ms", type=float, default=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+                        help="Median latency of the fake LLM")
+    parser.add_argument("--llm-failure-rate", type=float, default=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+                        help="Share of fake LLM calls that fail")
+    parser.add_argument("--real-llm", action="store_true", help="Call the configured Gemini model instead of the fake")
+    parser.add_argument("--real-embeddings", action="store_true", help="Use the SentenceTransformer model")
+    parser.add_argument("--output", help="Result file (default Backend/benchmark_results/<time>_<commit>.json)")
+    parser.add_argument("--compare", help="Earlier result file to compare against")
+    parser.add_argument("--keep-workdir", action="store_true", help="Keep the temporary LanceDB and story folders")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="tcg_benchmark_")
+    upload_folder = os.path.join(workdir, "uploaded_docs")
+
+    # Configuration is read at import time, so it is set before the app is imported
+    os.environ.update({
+        "POSTGRES_DB": args.postgres_db,
+        "LANCE_DB_PATH": os.path.join(workdir, "lance_db"),
+        "UPLOAD_FOLDER": upload_folder,
+        "SUCCESS_FOLDER": os.path.join(workdir, "success"),
+        "FAILURE_FOLDER": os.path.join(workdir, "failure"),
+        "RATE_LIMIT_STATE_DIR": os.path.join(workdir, "rate_limits"),
+        "LLM_CACHE_MODE": "off",
+        "USE_JOB_QUEUE": "false",
+        "PIPELINE_SEED": str(args.seed)
+    })
+    if not args.real_llm:
+        os.environ.update({
+            "LLM_BACKEND": "fake",
+            "FAKE_LLM_LATENCY_MS": str(args.llm_latency_ms),
+            "FAKE_LLM_FAILURE_RATE": str(args.llm_failure_rate),
+            # The fake model has no quota to protect
+            "RATE_LIMIT_GEMINI_PER_MINUTE": "1000000",
+            "RATE_LIMIT_GENERATION_PER_MINUTE": "1000000",
+            "RATE_LIMIT_IMPACT_PER_MINUTE": "1000000",
+            "RATE_LIMIT_SUMMARY_PER_MINUTE": "1000000"
+        })
+    if not args.real_embeddings:
+        os.environ["EMBEDDING_BACKEND"] = "fake"
+
+    # Prompt files are opened relative to the repository root
+    os.chdir(REPO_DIR)
+
+    from app.models.create_dbs import create_postgres_db, create_test_case_LanceDB
+    from app.models.delete_postgres_data import delete_all_postgres_data
+    from app.datapipeline.embedding_generator import generate_embeddings
+    from app.LLM.Test_case_generator import generate_test_cases_for_all_stories
+
+    print(f"🧪 [Benchmark] Work directory: {workdir}")
+    create_postgres_db()
+    delete_all_postgres_data()
+    create_test_case_LanceDB()
+
+    recorder = StageRecorder()
+    instrument(recorder)
+    rng = random.Random(args.seed)
+
+    result = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "config": {
+            "projects": args.projects,
+            "stories_per_project": args.stories_per_project,
+            "formats": args.formats,
+            "seed": args.seed,
+            "llm": "gemini" if args.real_llm else "fake",
+            "embeddings": "sentence-transformers" if args.real_embeddings else "fake",
+            "llm_latency_ms": None if args.real_llm else args.llm_latency_ms,
+            "llm_failure_rate": None if args.real_llm else args.llm_failure_rate
+        },
+        "steps": []
+    }
+
+    try:
+        done = 0
+        for target in sorted(set(args.stories_per_project)):
+            recorder.reset()
+            new_stories = synthesize_corpus(upload_folder, args.projects, done, target, args.formats, rng)
+            done = target
+            print(f"🧪 [Benchmark] Step: {new_stories} new stories, corpus {done * args.projects}")
+
+            started = time.perf_counter()
+            generate_embeddings()
+            ingest_seconds = time.perf_counter() - started
+
+            started = time.perf_counter()
+            generation = generate_test_cases_for_all_stories()
+            generate_seconds = time.perf_counter() - started
+
+            result["steps"].append({
+                "corpus_stories": done * args.projects,
+                "new_stories": new_stories,
+                "phases": {
+                    "ingest": {
+                        "wall_seconds": round(ingest_seconds, 3),
+                        "stories_per_minute": round(new_stories * 60 / ingest_seconds, 2) if ingest_seconds else None
+                    },
+                    "generate_impact": {
+                        "wall_seconds": round(generate_seconds, 3),
+                        "stories_per_minute": round(new_stories * 60 / generate_seconds, 2) if generate_seconds else None,
+                        "summary": generation
+                    },
+                    "end_to_end": {
+                        "wall_seconds": round(ingest_seconds + generate_seconds, 3),
+                        "stories_per_minute": round(new_stories * 60 / (ingest_seconds + generate_seconds), 2)
+                    }
+                },
+                "stages": recorder.summary()
+            })
+    finally:
+        if not args.keep_workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    result["finished_at"] = datetime.now(timezone.utc).isoformat()
+    output = args.output or os.path.join(
+        BACKEND_DIR, "benchmark_results",
+        f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{result['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+    for step in result["steps"]:
+        print(f"\n📈 [Benchmark] Corpus {step['corpus_stories']} stories ({step['new_stories']} new)")
+        for phase, stats in step["phases"].items():
+            print(f"   {phase:<16} {stats['wall_seconds']:>9.2f}s {stats['stories_per_minute']:>9.1f} stories/min")
+        for stage, stats in sorted(step["stages"].items()):
+            print(f"   {stage:<16} {stats['calls']:>5} calls  p50 {stats['p50_ms']:>9.1f} ms  p95 {stats['p95_ms']:>9.1f} ms")
+    print(f"\n💾 [Benchmark] Results written to {output}")
+
+    if args.compare:
+        compare(args.compare, result)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,8 @@ from datetime import datetime, timedelta
 from apscheduler.schedulers.blocking import BlockingScheduler
 from app.datapipeline.embedding_generator import generate_embeddings
 from app.LLM.Test_case_generator import generate_test_cases_for_all_stories
+from app.LLM.structured_output import structured_output_stats
+from app.config import Config
 
 # Import Jira integration
 try:
@@ -102,17 +104,34 @@ def scheduled_job():
                 print("⏳ [Scheduler] Waiting 5 seconds after Jira sync...")
                 time.sleep(5)
         
-        # Step 1: Process project folders and generate embeddings
-        print("📁 [Scheduler] Step 1: Processing project folders and generating embeddings...")
-        generate_embeddings()
-        
-        # Add a delay to ensure LanceDB is properly updated
-        print("⏳ [Scheduler] Waiting 2 seconds for LanceDB to update...")
-        time.sleep(2)
-        
-        # Step 2: Generate test cases for all stories
-        print("🧠 [Scheduler] Step 2: Generating test cases for all stories...")
-        generate_test_cases_for_all_stories()
+        # Fail uploads whose Flask process died mid-run; a jobs table error must not skip the pipeline
+        try:
+            from app.services.job_queue import expire_inprocess_jobs
+            expired = expire_inprocess_jobs()
+            if expired:
+                print(f"🧹 [Scheduler] Marked {expired} stale upload jobs as failed")
+        except Exception as e:
+            print(f"❌ [Scheduler] Error expiring stale upload jobs: {e}")
+
+        if Config.USE_JOB_QUEUE:
+            # Workers (worker.py) drain the queue; the scheduler only enqueues
+            from app.services.pipeline_jobs import enqueue_pending_work
+            print("📥 [Scheduler] Enqueuing pending files and stories...")
+            enqueue_pending_work()
+        else:
+            # Step 1: Process project folders and generate embeddings
+            print("📁 [Scheduler] Step 1: Processing project folders and generating embeddings...")
+            generate_embeddings()
+            
+            # Add a delay to ensure LanceDB is properly updated
+            print("⏳ [Scheduler] Waiting 2 seconds for LanceDB to update...")
+            time.sleep(2)
+            
+            # Step 2: Generate test cases for all stories
+            print("🧠 [Scheduler] Step 2: Generating test cases for all stories...")
+            summary = generate_test_cases_for_all_stories()
+            print(f"📊 [Scheduler] Test case generation: {summary}")
+            print(f"📐 [Scheduler] Structured output retry rates: {structured_output_stats()}")
         
         # Calculate and store next reload time
         next_time = datetime.now() + timedelta(minutes=5)
@@ -8,6 +8,7 @@ from flask_cors import CORS
 from apscheduler.schedulers.background import BackgroundScheduler
 from scheduler import scheduled_job  # Import the job directly
 from apscheduler.triggers.interval import IntervalTrigger
+from app.utils.metrics import metrics_response
 
 app = Flask(__name__)
 
@@ -52,6 +53,11 @@ def run_scheduler_job():
         print(f"[Scheduler] ❌ Error running job: {e}")
         return False
 
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of the pipeline runs in this process"""
+    return metrics_response()
+
 @app.route('/api/scheduler/next-reload', methods=['GET'])
 def get_next_reload():
     """Get the next scheduled reload time"""
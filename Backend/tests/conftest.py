@@ -0,0 +1,47 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_ROOT = os.path.dirname(BACKEND_DIR)
+
+# Offline models and throwaway local state; set before app.config is imported
+_STATE_DIR = tempfile.mkdtemp(prefix="tcg_tests_")
+os.environ.setdefault("LLM_BACKEND", "fake")
+os.environ.setdefault("EMBEDDING_BACKEND", "fake")
+os.environ.setdefault("LLM_CACHE_MODE", "off")
+os.environ.setdefault("LLM_USAGE_TRACKING", "false")
+os.environ.setdefault("LANCE_DB_PATH", os.path.join(_STATE_DIR, "lance_db"))
+os.environ.setdefault("RATE_LIMIT_STATE_DIR", os.path.join(_STATE_DIR, "rate_limits"))
+# Database tests only ever run against a scratch database named explicitly
+if os.getenv("TEST_POSTGRES_DB"):
+    os.environ["POSTGRES_DB"] = os.environ["TEST_POSTGRES_DB"]
+
+sys.path.insert(0, BACKEND_DIR)
+# Prompt templates are opened relative to the repository root
+os.chdir(REPO_ROOT)
+
+
+@pytest.fixture(scope="session")
+def postgres_schema():
+    """Create the schema in the TEST_POSTGRES_DB database, or skip"""
+    if not os.getenv("TEST_POSTGRES_DB"):
+        pytest.skip("Set TEST_POSTGRES_DB to run tests against a scratch Postgres database")
+    from app.models.create_dbs import create_postgres_db
+
+    try:
+        create_postgres_db()
+    except Exception as e:
+        pytest.skip(f"Postgres is not available: {e}")
+
+
+@pytest.fixture
+def postgres(postgres_schema):
+    """An empty test database; every table is truncated after the test"""
+    from app.models.delete_postgres_data import delete_all_postgres_data
+
+    delete_all_postgres_data()
+    yield
+    delete_all_postgres_data()
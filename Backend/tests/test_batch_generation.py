@@ -0,0 +1,59 @@
+import threading
+import time
+
+from app.LLM import Test_case_generator
+from app.LLM.batch_planner import BatchPlan
+
+COUNTS = {"positive": 5, "negative": 3, "boundary": 2, "security": 1, "performance": 1}
+
+
+class SlowBatches:
+    """Stands in for generate_test_cases_batch; later batches finish first"""
+
+    def __init__(self, batch_total):
+        self.batch_total = batch_total
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, story_id, story_description, parts, current_count, plan, batch_index=0):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            time.sleep(0.05 * (self.batch_total - batch_index))
+            return {"test_cases": [
+                {"id": f"{story_id}-TC{current_count + 1}", "title": f"{part['type']} {batch_index}.{n}", "steps": ["Step 1: Run it"], "expected_result": "Works", "priority": "High"}
+                for part in parts
+                for n in range(part["count"])
+            ]}
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def _generate(monkeypatch, max_concurrency):
+    generator = Test_case_generator.TestCaseGenerator()
+    batches = SlowBatches(batch_total=3)
+    monkeypatch.setattr(Test_case_generator, "plan_batch_capacity", lambda: BatchPlan(4, None, None, 0, "test"))
+    monkeypatch.setattr(Test_case_generator, "DUPLICATE_SIMILARITY_THRESHOLD", 0)
+    monkeypatch.setattr(generator, "get_category_counts", lambda complexity, rng=None: dict(COUNTS))
+    monkeypatch.setattr(generator, "generate_test_cases_batch", batches)
+    result = generator.generate_test_cases("US-1", "As a user I want to log in", max_concurrency=max_concurrency, checkpoint=False)
+    return result, batches
+
+
+def test_concurrent_batches_are_numbered_contiguously_in_plan_order(monkeypatch):
+    result, batches = _generate(monkeypatch, max_concurrency=3)
+
+    assert batches.peak == 3
+    assert result["total_test_cases"] == 12
+    assert [tc["id"] for tc in result["test_cases"]] == [f"US-1-TC{n}" for n in range(1, 13)]
+    assert [tc["title"] for tc in result["test_cases"]][3:6] == ["positive 0.3", "positive 1.0", "negative 1.0"]
+
+
+def test_batch_concurrency_is_capped(monkeypatch):
+    result, batches = _generate(monkeypatch, max_concurrency=2)
+
+    assert batches.peak == 2
+    assert result["total_test_cases"] == 12
@@ -0,0 +1,65 @@
+from app.LLM import batch_planner
+from app.LLM.batch_planner import BatchPlan, plan_batch_capacity, record_batch_call
+
+CATEGORIES = [
+    {"type": "positive", "focus": ["Core functionality"], "count": 5},
+    {"type": "negative", "focus": ["Error handling"], "count": 3},
+    {"type": "boundary", "focus": ["Edge cases"], "count": 2}
+]
+
+
+def _stats(monkeypatch, samples, tokens_per_case, parse_failure_rate=0.0, smallest_failed=None):
+    monkeypatch.setattr(batch_planner, "_load_stats", lambda: {
+        "samples": samples,
+        "tokens_per_case": tokens_per_case,
+        "parse_failure_rate": parse_failure_rate,
+        "smallest_failed": smallest_failed
+    })
+
+
+def test_small_categories_share_a_call_and_large_ones_are_spread():
+    batches = BatchPlan(4, None, None, 0, "test").split(CATEGORIES)
+
+    assert [[(part["type"], part["count"]) for part in parts] for parts in batches] == [
+        [("positive", 4)],
+        [("positive", 1), ("negative", 3)],
+        [("boundary", 2)]
+    ]
+    assert BatchPlan(40, None, None, 0, "test").split(CATEGORIES) == [CATEGORIES]
+
+
+def test_capacity_follows_observed_output_tokens(monkeypatch):
+    _stats(monkeypatch, samples=2, tokens_per_case=200.0)
+    assert plan_batch_capacity().capacity == batch_planner.COLD_START_BATCH_SIZE
+
+    _stats(monkeypatch, samples=50, tokens_per_case=200.0)
+    assert plan_batch_capacity().capacity == int(batch_planner.MAX_OUTPUT_TOKENS * batch_planner.OUTPUT_HEADROOM / 200.0)
+
+    _stats(monkeypatch, samples=50, tokens_per_case=1.0)
+    assert plan_batch_capacity().capacity == batch_planner.MAX_BATCH_SIZE
+
+
+def test_parse_failures_keep_capacity_below_the_smallest_failed_batch(monkeypatch):
+    _stats(monkeypatch, samples=50, tokens_per_case=100.0, parse_failure_rate=0.2, smallest_failed=12)
+
+    plan = plan_batch_capacity()
+
+    assert plan.capacity == 9
+    assert "parse failures" in plan.reason
+
+
+def test_recorded_calls_drive_the_next_plan(postgres):
+    plan = plan_batch_capacity()
+    assert plan.reason == "cold start"
+    parts = [{"type": "positive", "focus": [], "count": 10}]
+    for _ in range(batch_planner.MIN_SAMPLES):
+        record_batch_call("US-1", parts, plan, 10, 3000, False, False)
+    # A failed parse says nothing about tokens per test case
+    record_batch_call("US-1", parts, plan, 0, 8192, True, True)
+
+    next_plan = plan_batch_capacity()
+
+    assert next_plan.samples == batch_planner.MIN_SAMPLES + 1
+    assert next_plan.tokens_per_case == 300.0
+    assert next_plan.parse_failure_rate > batch_planner.TARGET_PARSE_FAILURE_RATE
+    assert next_plan.capacity == min(int(batch_planner.MAX_OUTPUT_TOKENS * batch_planner.OUTPUT_HEADROOM / 300.0), int(10 * 0.75))
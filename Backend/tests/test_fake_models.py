@@ -0,0 +1,62 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.utils.fake_models import FakeChatModel, FakeEmbeddingModel, FakeLLMError
+
+PROMPT = """Categories for this batch:
+- 3 positive test cases, focusing on: Core functionality
+- 2 negative test cases, focusing on: Error handling"""
+
+
+def _outcomes(model, prompts):
+    outcomes = []
+    for prompt in prompts:
+        try:
+            outcomes.append(model.invoke(prompt).content)
+        except FakeLLMError:
+            outcomes.append(None)
+    return outcomes
+
+
+def test_seeded_model_replays_the_same_responses():
+    prompts = [PROMPT, PROMPT, "Summarize: as a user I want to export a monthly report"]
+
+    first = _outcomes(FakeChatModel(seed=7), prompts)
+
+    assert _outcomes(FakeChatModel(seed=7), prompts) == first
+    assert _outcomes(FakeChatModel(seed=8), prompts) != first
+    # A repeated prompt is a new attempt, not a copy of the first answer
+    assert first[0] != first[1]
+
+
+def test_generation_prompt_gets_the_requested_categories():
+    test_cases = json.loads(FakeChatModel(seed=1).invoke(PROMPT).content)["test_cases"]
+
+    assert [tc["category"] for tc in test_cases] == ["positive"] * 3 + ["negative"] * 2
+
+
+def test_failure_rate_is_seeded_and_close_to_the_configured_rate():
+    prompts = [f"Summarize story {n}" for n in range(400)]
+
+    failures = _outcomes(FakeChatModel(seed=3, failure_rate=0.25), prompts).count(None)
+
+    assert failures == _outcomes(FakeChatModel(seed=3, failure_rate=0.25), prompts).count(None)
+    assert 60 <= failures <= 140
+    with pytest.raises(FakeLLMError):
+        FakeChatModel(seed=3, failure_rate=1.0).invoke(PROMPT)
+
+
+def test_fake_embeddings_are_stable_and_keep_shared_words_close():
+    model = FakeEmbeddingModel()
+    login, login_again, export = model.encode(
+        ["user logs in with a password", "user logs in with a password", "export the monthly sales report"],
+        normalize_embeddings=True
+    )
+
+    assert login.shape == (768,)
+    assert np.array_equal(login, login_again)
+    assert np.linalg.norm(login) == pytest.approx(1.0)
+    similar = model.encode("user logs in with a token", normalize_embeddings=True)
+    assert float(login @ similar) > float(login @ export)
@@ -0,0 +1,69 @@
+from app.LLM import Test_case_generator
+from app.models.generation_checkpoints import (
+    clear_generation_run,
+    resume_generation_run,
+    save_batch_checkpoint,
+    story_input_hash
+)
+
+BATCHES = [
+    [{"type": "positive", "count": 5}],
+    [{"type": "negative", "count": 3}, {"type": "boundary", "count": 2}]
+]
+BATCH_0 = [{"id": "US-1-TC1", "title": "Login works", "steps": ["Step 1: Log in"], "expected_result": "Home page", "priority": "High"}]
+
+
+def test_new_run_stores_its_plan_and_has_no_completed_batches(postgres):
+    batches, completed = resume_generation_run("US-1", story_input_hash("Login"), BATCHES)
+
+    assert batches == BATCHES
+    assert completed == {}
+
+
+def test_rerun_for_the_same_input_resumes_the_stored_plan_and_batches(postgres):
+    input_hash = story_input_hash("Login")
+    resume_generation_run("US-1", input_hash, BATCHES)
+    save_batch_checkpoint("US-1", 0, BATCHES[0], BATCH_0)
+
+    # A replanned rerun still gets the original plan, so batch indexes line up
+    batches, completed = resume_generation_run("US-1", input_hash, [[{"type": "positive", "count": 9}]])
+
+    assert batches == BATCHES
+    assert completed == {0: BATCH_0}
+
+
+def test_changed_input_discards_the_stale_run(postgres):
+    resume_generation_run("US-1", story_input_hash("Login"), BATCHES)
+    save_batch_checkpoint("US-1", 0, BATCHES[0], BATCH_0)
+
+    new_plan = [[{"type": "positive", "count": 4}]]
+    batches, completed = resume_generation_run("US-1", story_input_hash("Login with SSO"), new_plan)
+
+    assert batches == new_plan
+    assert completed == {}
+
+
+def test_cleared_run_starts_over(postgres):
+    input_hash = story_input_hash("Login")
+    resume_generation_run("US-1", input_hash, BATCHES)
+    save_batch_checkpoint("US-1", 0, BATCHES[0], BATCH_0)
+
+    clear_generation_run("US-1")
+
+    assert resume_generation_run("US-1", input_hash, BATCHES) == (BATCHES, {})
+
+
+def test_failed_insert_keeps_checkpoints_and_skips_later_steps(monkeypatch):
+    calls = []
+    suite = {"test_cases": BATCH_0}
+    monkeypatch.setattr(Test_case_generator.TestCaseGenerator, "generate_test_cases", lambda self, story_id, description: suite)
+    monkeypatch.setattr(Test_case_generator, "insert_test_case", lambda **kwargs: False)
+    monkeypatch.setattr(Test_case_generator, "clear_generation_run", lambda story_id: calls.append("clear"))
+    monkeypatch.setattr(Test_case_generator, "store_test_case_embeddings", lambda *args: calls.append("embeddings"))
+    monkeypatch.setattr(Test_case_generator, "analyze_test_case_impacts", lambda *args: calls.append("impacts"))
+
+    row = {"storyID": "US-1", "project_id": "P1", "storyDescription": "Login", "doc_content_text": "As a user I want to log in"}
+    result = Test_case_generator.generate_test_case_for_story("US-1", row=row)
+
+    assert result is None
+    assert calls == []
@@ -0,0 +1,168 @@
+import re
+import threading
+
+import numpy as np
+import psycopg2.extras
+import pytest
+
+from app.config import Config
+from app.datapipeline.embedding_generator import add_story_to_lance
+from app.LLM import impact_analyzer
+from app.LLM.impact_analyzer import analyze_test_case_impacts, select_candidate_stories
+from app.models.postgress_writer import insert_test_case
+
+DIMENSIONS = 768
+
+
+def _vector(similarity):
+    """A unit vector with the given cosine similarity to the first axis"""
+    vector = np.zeros(DIMENSIONS, dtype=np.float32)
+    vector[0] = similarity
+    vector[1] = np.sqrt(1.0 - similarity ** 2)
+    return vector.tolist()
+
+
+def _add_story(project_id, story_id, similarity):
+    add_story_to_lance(project_id, story_id, story_id, f"Story {story_id}", _vector(similarity), f"{story_id}.txt", None, "file")
+
+
+def _suite(story_id):
+    return {"test_cases": [{"id": f"{story_id}-TC1", "title": "Login works", "steps": ["Step 1: Log in"], "expected_result": "Home page", "priority": "High"}]}
+
+
+def _verdict(existing_story_id):
+    return {
+        "has_impact": True,
+        "impact_type": "MODIFY",
+        "impacted_test_cases": [{
+            "original_test_case_id": f"{existing_story_id}-TC1",
+            "modification_reason": "Login now goes through SSO",
+            "impact_severity": "medium",
+            "severity_reason": "The login flow changes",
+            "modified_test_case": {"id": "", "title": "Login with SSO", "steps": ["Step 1: Log in with SSO"], "expected_result": "Home page", "priority": "High"}
+        }]
+    }
+
+
+def _ledger():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("SELECT existing_story_id FROM impact_analysis_ledger ORDER BY existing_story_id")
+            return [row["existing_story_id"] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+class FakeAnalysis:
+    """Stands in for get_llm_analysis; records the pairs asked and fails the chosen ones"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.pairs = []
+        self.threads = set()
+
+    def __call__(self, prompt, llm_ref, project_id="", story_id=None, attempts=None, run_id=None):
+        existing_story_id = re.search(r"ORIGINAL STORY \((\S+) ", prompt).group(1)
+        self.pairs.append(existing_story_id)
+        self.threads.add(threading.current_thread().name)
+        if existing_story_id in self.failing:
+            raise impact_analyzer.LLMError("model unavailable")
+        return _verdict(existing_story_id)
+
+
+@pytest.fixture(scope="module")
+def pair_stories():
+    from app.models.create_dbs import create_LanceDB
+
+    create_LanceDB()
+    _add_story("P-PAIRS", "PAIR-NEW", 1.0)
+    for n, similarity in enumerate((0.9, 0.8, 0.7), start=1):
+        _add_story("P-PAIRS", f"PAIR-{n}", similarity)
+    return ["PAIR-1", "PAIR-2", "PAIR-3"]
+
+
+@pytest.fixture
+def pairs(postgres, pair_stories):
+    """The new story and three similar stories, all with stored test cases"""
+    for story_id in ["PAIR-NEW"] + pair_stories:
+        assert insert_test_case(story_id, story_id, _suite(story_id), project_id="P-PAIRS")
+    return pair_stories
+
+
+@pytest.fixture(scope="module")
+def candidates():
+    """A new story and neighbours of decreasing similarity, one below MIN_SIMILARITY_SCORE"""
+    from app.models.create_dbs import create_LanceDB
+
+    create_LanceDB()
+    _add_story("P-CAND", "CAND-NEW", 1.0)
+    similarities = {"CAND-1": 0.95, "CAND-2": 0.9, "CAND-3": 0.8, "CAND-4": 0.7, "CAND-5": 0.6, "CAND-LOW": 0.3}
+    for story_id, similarity in similarities.items():
+        _add_story("P-CAND", story_id, similarity)
+    # Closer than every candidate but without test cases, or in another project
+    _add_story("P-CAND", "CAND-UNGENERATED", 0.99)
+    _add_story("P-OTHER", "CAND-OTHER", 0.99)
+    return similarities
+
+
+def test_candidates_are_the_top_k_most_similar_generated_stories(candidates):
+    selected = select_candidate_stories("CAND-NEW", "P-CAND", set(candidates) | {"CAND-OTHER"}, top_k=3)
+
+    assert [story["id"] for story in selected] == ["CAND-1", "CAND-2", "CAND-3"]
+    assert [story["similarity_score"] for story in selected] == pytest.approx([0.95, 0.9, 0.8], abs=1e-4)
+    assert selected[0]["description"] == "CAND-1"
+
+
+def test_candidates_below_the_similarity_cutoff_are_dropped(candidates):
+    selected = select_candidate_stories("CAND-NEW", "P-CAND", set(candidates), top_k=10)
+
+    assert [story["id"] for story in selected] == ["CAND-1", "CAND-2", "CAND-3", "CAND-4", "CAND-5"]
+    assert select_candidate_stories("CAND-NEW", "P-CAND", set(candidates), top_k=10, min_similarity=0.85) == selected[:2]
+
+
+def test_a_failing_pair_does_not_stop_the_other_pairs(pairs, monkeypatch):
+    analysis = FakeAnalysis(failing={"PAIR-2"})
+    monkeypatch.setattr(impact_analyzer, "get_llm_analysis", analysis)
+
+    assert analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=3) == 2
+
+    assert sorted(analysis.pairs) == pairs
+    assert all(name.startswith("impact") for name in analysis.threads)
+    # Only stored verdicts reach the ledger, so the failed pair is retried next time
+    assert _ledger() == ["PAIR-1", "PAIR-3"]
+
+
+def test_all_suites_are_loaded_in_one_query(pairs, monkeypatch):
+    calls = []
+    load = impact_analyzer.get_test_case_jsons_by_story_ids
+
+    def counted(story_ids):
+        calls.append(list(story_ids))
+        return load(story_ids)
+
+    monkeypatch.setattr(impact_analyzer, "get_test_case_jsons_by_story_ids", counted)
+    monkeypatch.setattr(impact_analyzer, "get_llm_analysis", FakeAnalysis())
+
+    assert analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=3) == 3
+    assert calls == [["PAIR-NEW"] + pairs]
+
+
+def test_decided_pairs_are_skipped_unless_forced(pairs, monkeypatch):
+    monkeypatch.setattr(impact_analyzer, "get_llm_analysis", FakeAnalysis())
+    analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=1)
+
+    analysis = FakeAnalysis()
+    monkeypatch.setattr(impact_analyzer, "get_llm_analysis", analysis)
+    assert analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=1) == 0
+    assert analysis.pairs == []
+
+    # A regenerated suite is a new pair version
+    changed = _suite("PAIR-2")
+    changed["test_cases"][0]["expected_result"] = "Dashboard"
+    assert insert_test_case("PAIR-2", "PAIR-2", changed, project_id="P-PAIRS")
+    analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=1)
+    assert analysis.pairs == ["PAIR-2"]
+
+    analyze_test_case_impacts("PAIR-NEW", "P-PAIRS", max_concurrency=1, force=True)
+    assert analysis.pairs == ["PAIR-2"] + pairs
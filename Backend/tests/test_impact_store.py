@@ -0,0 +1,119 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import psycopg2.extras
+
+from app.config import Config
+from app.LLM.impact_analyzer import store_impact_analysis
+from app.models.create_dbs import rebuild_impact_counters
+from app.models.postgress_writer import insert_test_case
+
+SUITE = {"test_cases": [{"id": "US-1-TC1", "title": "Login works", "steps": ["Step 1: Log in"], "expected_result": "Home page", "priority": "High"}]}
+
+
+def _suite(story_id):
+    return {"test_cases": [{**SUITE["test_cases"][0], "id": f"{story_id}-TC1"}]}
+
+
+def _verdict(severity="medium", existing_story_id="US-1"):
+    return {
+        "has_impact": True,
+        "impact_type": "MODIFY",
+        "impacted_test_cases": [{
+            "original_test_case_id": f"{existing_story_id}-TC1",
+            "modification_reason": "Login now goes through SSO",
+            "impact_severity": severity,
+            "severity_reason": "The login flow changes",
+            "modified_test_case": {"id": "", "title": "Login with SSO", "steps": ["Step 1: Log in with SSO"], "expected_result": "Home page", "priority": "High"}
+        }]
+    }
+
+
+def _store(new_story_id, severity="medium", existing_story_id="US-1"):
+    return store_impact_analysis(_verdict(severity, existing_story_id), "P1", new_story_id, existing_story_id, 0.9)
+
+
+def _counters():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT * FROM story_impact_counters ORDER BY story_id")
+            stories = cur.fetchall()
+            cur.execute("SELECT * FROM project_impact_summary ORDER BY project_id")
+            return stories, cur.fetchall()
+    finally:
+        conn.close()
+
+
+def _rebuild():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                rebuild_impact_counters(cur)
+    finally:
+        conn.close()
+
+
+def _impacts():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("""
+                SELECT new_story_id, modified_test_case_id, impact_version
+                FROM test_case_impacts ORDER BY impact_version
+            """)
+            return [tuple(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def test_mod_10_follows_mod_9(postgres):
+    assert insert_test_case("US-1", "Login", SUITE, project_id="P1")
+    for n in range(1, 11):
+        _store(f"US-{n + 1}")
+
+    assert [row[1] for row in _impacts()][-3:] == ["US-1-TC1-mod-8", "US-1-TC1-mod-9", "US-1-TC1-mod-10"]
+
+
+def test_concurrent_analyses_take_distinct_modification_numbers(postgres):
+    assert insert_test_case("US-1", "Login", SUITE, project_id="P1")
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(_store, [f"US-{n}" for n in range(2, 18)]))
+
+    impacts = _impacts()
+    assert [version for _, _, version in impacts] == list(range(1, 17))
+    assert len({modified for _, modified, _ in impacts}) == 16
+
+
+def test_incremental_counters_match_a_rebuild(postgres):
+    for story_id in ("US-1", "US-2", "US-3"):
+        assert insert_test_case(story_id, "Login", _suite(story_id), project_id="P1")
+    _store("US-2", "high")
+    _store("US-3", "low")
+    _store("US-1", "medium", existing_story_id="US-2")
+    _store("US-1", "high", existing_story_id="US-3")
+
+    incremental = _counters()
+    _rebuild()
+
+    assert incremental == _counters()
+    stories, [summary] = incremental
+    assert [(row[1], row[2], row[3]) for row in stories] == [("US-1", 2, 2), ("US-2", 1, 1), ("US-3", 1, 1)]
+    assert summary[1:3] == (4, 3)
+
+
+def test_analyses_of_a_pair_in_both_directions_do_not_deadlock(postgres):
+    for story_id in ("US-1", "US-2"):
+        assert insert_test_case(story_id, "Login", _suite(story_id), project_id="P1")
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        stored = list(pool.map(
+            lambda args: _store(*args),
+            [("US-2", "high", "US-1"), ("US-1", "low", "US-2")] * 10
+        ))
+
+    assert stored == [1] * 20
+    incremental = _counters()
+    _rebuild()
+    assert incremental == _counters()
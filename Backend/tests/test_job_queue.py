@@ -0,0 +1,222 @@
+import os
+import uuid
+
+import pytest
+
+from app.services import pipeline_jobs
+from app.services.job_queue import (
+    PermanentJobError,
+    claim_job,
+    complete_job,
+    enqueue_job,
+    fail_job,
+    get_job,
+    retry_dead_jobs
+)
+
+
+def _story_id():
+    return f"STORY-{uuid.uuid4().hex[:8]}"
+
+
+def test_enqueue_returns_the_pending_job_instead_of_a_duplicate(postgres):
+    story_id = _story_id()
+
+    first = enqueue_job("generate", {}, story_id=story_id, project_id="P1")
+    second = enqueue_job("generate", {}, story_id=story_id, project_id="P1")
+
+    assert first == second
+    assert enqueue_job("embed", {}, story_id=story_id, project_id="P1") != first
+
+
+def test_claim_marks_the_job_running_and_hides_it_from_other_workers(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+
+    job = claim_job("worker-1")
+
+    assert str(job["job_id"]) == job_id
+    assert job["status"] == "running"
+    assert job["attempts"] == 1
+    assert job["locked_by"] == "worker-1"
+    assert claim_job("worker-2") is None
+
+
+def test_expired_lease_is_reclaimed_by_another_worker(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+    claim_job("worker-1", visibility_timeout=0)
+
+    job = claim_job("worker-2")
+
+    assert str(job["job_id"]) == job_id
+    assert job["locked_by"] == "worker-2"
+    assert job["attempts"] == 2
+
+
+def test_failed_job_is_requeued_with_backoff(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+    job = claim_job("worker-1")
+
+    assert fail_job(job, "worker-1", "boom") == "queued"
+
+    stored = get_job(job_id)
+    assert stored["status"] == "queued"
+    assert stored["last_error"] == "boom"
+    assert stored["run_after"] > stored["updated_on"]
+    # Still backing off, so not claimable yet
+    assert claim_job("worker-1") is None
+
+
+def test_job_is_dead_lettered_after_max_attempts_and_can_be_retried(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1", max_attempts=1)
+    job = claim_job("worker-1")
+
+    assert fail_job(job, "worker-1", "boom") == "dead"
+    assert claim_job("worker-1") is None
+
+    assert retry_dead_jobs("generate") == 1
+    job = claim_job("worker-1")
+    assert str(job["job_id"]) == job_id
+    assert job["attempts"] == 1
+
+
+def test_a_worker_whose_lease_expired_cannot_overwrite_the_new_holder(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+    stale = claim_job("worker-1", visibility_timeout=0)
+    claim_job("worker-2")
+
+    assert not complete_job(job_id, "worker-1", {"from": "worker-1"})
+    assert fail_job(stale, "worker-1", "boom") is None
+    assert get_job(job_id)["status"] == "running"
+
+    assert complete_job(job_id, "worker-2", {"from": "worker-2"})
+    assert get_job(job_id)["result"] == {"from": "worker-2"}
+    assert not complete_job(job_id, "worker-2", {"from": "worker-2 again"})
+
+
+def test_expired_job_out_of_attempts_is_dead_lettered_instead_of_reclaimed(postgres):
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1", max_attempts=2)
+    claim_job("worker-1", visibility_timeout=0)
+    claim_job("worker-2", visibility_timeout=0)
+
+    assert claim_job("worker-3") is None
+    stored = get_job(job_id)
+    assert stored["status"] == "dead"
+    assert stored["attempts"] == 2
+    assert stored["locked_by"] is None
+
+
+def test_retry_revives_only_the_latest_dead_job_per_story(postgres):
+    story_id = _story_id()
+    dead = []
+    for _ in range(3):
+        job_id = enqueue_job("generate", {}, story_id=story_id, project_id="P1")
+        fail_job(claim_job("worker-1"), "worker-1", "bad input", permanent=True)
+        dead.append(job_id)
+    blocked_story = _story_id()
+    enqueue_job("generate", {}, story_id=blocked_story, project_id="P1")
+    fail_job(claim_job("worker-1"), "worker-1", "bad input", permanent=True)
+    pending = enqueue_job("generate", {}, story_id=blocked_story, project_id="P1")
+
+    assert retry_dead_jobs("generate") == 1
+
+    assert [get_job(job_id)["status"] for job_id in dead] == ["dead", "dead", "queued"]
+    assert get_job(pending)["status"] == "queued"
+    assert retry_dead_jobs("generate") == 0
+
+
+def test_permanent_failure_skips_the_retries(postgres):
+    enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+    job = claim_job("worker-1")
+
+    assert fail_job(job, "worker-1", "bad input", permanent=True) == "dead"
+
+
+def test_run_job_records_success_and_permanent_errors(postgres, monkeypatch):
+    monkeypatch.setitem(pipeline_jobs.JOB_HANDLERS, "generate", lambda job: {"next_job_id": None})
+    job_id = enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+
+    assert pipeline_jobs.run_job(claim_job("worker-1"), "worker-1") == "succeeded"
+    assert get_job(job_id)["result"] == {"next_job_id": None}
+
+    def reject(job):
+        raise PermanentJobError("cannot help")
+
+    monkeypatch.setitem(pipeline_jobs.JOB_HANDLERS, "generate", reject)
+    enqueue_job("generate", {}, story_id=_story_id(), project_id="P1")
+    assert pipeline_jobs.run_job(claim_job("worker-1"), "worker-1") == "dead"
+
+
+@pytest.fixture
+def story_folders(tmp_path, monkeypatch):
+    """Upload, success and failure folders of the pipeline, with a LanceDB stories table"""
+    from app.models.create_dbs import create_LanceDB
+
+    create_LanceDB()
+    folders = {name: tmp_path / name for name in ("uploads", "success", "failure")}
+    for folder in folders.values():
+        folder.mkdir()
+    monkeypatch.setattr(pipeline_jobs, "UPLOAD_FOLDER", str(folders["uploads"]))
+    monkeypatch.setattr(pipeline_jobs, "SUCCESS_FOLDER", str(folders["success"]))
+    monkeypatch.setattr(pipeline_jobs, "FAILURE_FOLDER", str(folders["failure"]))
+    return folders
+
+
+def _upload(folders, story_id, text):
+    project_dir = folders["uploads"] / "P1"
+    project_dir.mkdir(exist_ok=True)
+    path = project_dir / f"{story_id}.txt"
+    path.write_text(text)
+    return str(path)
+
+
+def test_pending_files_are_queued_once_while_their_pipeline_is_unfinished(postgres, story_folders):
+    story_id = _story_id()
+    _upload(story_folders, story_id, "As a user I want to log in")
+
+    assert pipeline_jobs.enqueue_pending_work()["summarize"] == 1
+    assert pipeline_jobs.enqueue_pending_work()["summarize"] == 0
+
+    # A dead summarize job keeps its file out of later scans
+    job = claim_job("worker-1", ["summarize"])
+    fail_job(job, "worker-1", "boom", permanent=True)
+    assert pipeline_jobs.enqueue_pending_work()["summarize"] == 0
+
+
+def _embed_job(story_id, file_path, text):
+    return {
+        "job_id": str(uuid.uuid4()),
+        "story_id": story_id,
+        "project_id": "P1",
+        "payload": {"file_path": file_path, "filename": os.path.basename(file_path), "content": text, "description": "Login"}
+    }
+
+
+def test_embed_retry_of_the_same_story_succeeds_without_adding_it_twice(postgres, story_folders):
+    from app.datapipeline.embedding_generator import table
+
+    story_id = _story_id()
+    text = "As a user I want to log in"
+    file_path = _upload(story_folders, story_id, text)
+    job = _embed_job(story_id, file_path, text)
+
+    pipeline_jobs.handle_embed(job)
+    pipeline_jobs.handle_embed(job)
+
+    assert table.count_rows(f"storyID = '{story_id}'") == 1
+    assert (story_folders["success"] / "P1" / f"{story_id}.txt").exists()
+
+
+def test_embed_of_a_different_story_with_an_existing_id_goes_to_failure(postgres, story_folders):
+    from app.datapipeline.embedding_generator import table
+
+    story_id = _story_id()
+    first_path = _upload(story_folders, story_id, "As a user I want to log in")
+    pipeline_jobs.handle_embed(_embed_job(story_id, first_path, "As a user I want to log in"))
+
+    second_path = _upload(story_folders, story_id, "As an admin I want to export reports")
+    with pytest.raises(PermanentJobError):
+        pipeline_jobs.handle_embed(_embed_job(story_id, second_path, "As an admin I want to export reports"))
+
+    assert table.count_rows(f"storyID = '{story_id}'") == 1
+    assert (story_folders["failure"] / "P1" / f"{story_id}.txt").exists()
+    assert not os.path.exists(second_path)
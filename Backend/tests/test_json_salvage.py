@@ -0,0 +1,69 @@
+import json
+
+from app.LLM.json_salvage import salvage_json_array, strip_code_fences
+
+
+def _case(n, **fields):
+    return {"id": f"TC{n}", "title": f"Case {n}", "steps": [f"Step 1: Do {n}"], "expected_result": "Works", "priority": "High", **fields}
+
+
+def test_well_formed_response_is_complete():
+    result = salvage_json_array(json.dumps({"test_cases": [_case(1), _case(2)]}), "test_cases")
+
+    assert [item["id"] for item in result.items] == ["TC1", "TC2"]
+    assert result.complete
+    assert result.summary() == {"complete": True, "salvaged": 2, "skipped": 0}
+
+
+def test_fenced_response_is_unwrapped():
+    text = "```json\n" + json.dumps({"test_cases": [_case(1)]}) + "\n```"
+
+    result = salvage_json_array(text, "test_cases")
+
+    assert result.complete
+    assert len(result.items) == 1
+
+
+def test_truncated_response_keeps_every_complete_object():
+    text = json.dumps({"test_cases": [_case(1), _case(2), _case(3)]})
+    cut = text[:text.index('"TC3"') + 10]
+
+    result = salvage_json_array(cut, "test_cases")
+
+    assert [item["id"] for item in result.items] == ["TC1", "TC2"]
+    assert not result.complete
+
+
+def test_malformed_object_is_skipped_and_the_rest_kept():
+    text = '{"test_cases": [' + json.dumps(_case(1)) + ', {"id": "TC2", "title": oops}, ' + json.dumps(_case(3)) + "]}"
+
+    result = salvage_json_array(text, "test_cases")
+
+    assert [item["id"] for item in result.items] == ["TC1", "TC3"]
+    assert result.skipped == 1
+    assert not result.complete
+
+
+def test_braces_and_quotes_inside_strings_do_not_end_an_object():
+    case = _case(1, expected_result='Shows "{ saved }" and [ok]')
+    text = json.dumps({"test_cases": [case]})[:-2]
+
+    result = salvage_json_array(text, "test_cases")
+
+    assert result.items == [case]
+
+
+def test_code_fences_inside_values_are_preserved():
+    case = _case(1, steps=["Step 1: Paste ```print('hi')``` into the editor"])
+    text = "```json\n" + json.dumps({"test_cases": [case]}) + "\n```"
+
+    assert json.loads(strip_code_fences(text)) == {"test_cases": [case]}
+    result = salvage_json_array(text, "test_cases")
+    assert result.complete
+    assert result.items == [case]
+
+
+def test_unfenced_text_is_returned_unchanged():
+    text = json.dumps({"test_cases": [_case(1, steps=["Step 1: Type ``` then Enter"])]})
+
+    assert strip_code_fences(text) == text
@@ -0,0 +1,83 @@
+import pytest
+
+from app.utils.fake_models import FakeChatModel
+from app.utils.llm_cache import CachedLLM, LLMCacheMiss, LLMResponseCache
+
+
+class CountingModel(FakeChatModel):
+    def __init__(self):
+        super().__init__(seed=1)
+        self.invocations = 0
+
+    def invoke(self, prompt, *args, **kwargs):
+        self.invocations += 1
+        return super().invoke(prompt, *args, **kwargs)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LLMResponseCache(path=str(tmp_path / "cache.sqlite3"))
+
+
+def test_off_mode_calls_the_model_every_time(store):
+    model = CountingModel()
+    llm = CachedLLM(model, model="fake", temperature=0.3, cache=store, mode="off")
+
+    llm.invoke("Summarize the login story")
+    llm.invoke("Summarize the login story")
+
+    assert model.invocations == 2
+    assert not llm.is_cached("Summarize the login story")
+
+
+def test_cache_mode_serves_repeated_prompts_from_the_store(store):
+    model = CountingModel()
+    llm = CachedLLM(model, model="fake", temperature=0.3, cache=store, mode="cache")
+
+    first = llm.invoke("Summarize the login story")
+    second = llm.invoke("Summarize the login story")
+
+    assert model.invocations == 1
+    assert second.content == first.content
+    assert second.response_metadata["cache_hit"] is True
+
+
+def test_replay_serves_recorded_responses_and_rejects_new_prompts(store):
+    CachedLLM(CountingModel(), model="fake", temperature=0.3, cache=store, mode="record").invoke("Summarize the login story")
+
+    model = CountingModel()
+    replay = CachedLLM(model, model="fake", temperature=0.3, cache=store, mode="replay")
+
+    assert replay.invoke("Summarize the login story").content
+    assert model.invocations == 0
+    with pytest.raises(LLMCacheMiss):
+        replay.invoke("Summarize the export story")
+
+
+def test_invoke_arguments_are_part_of_the_cache_key(store):
+    model = CountingModel()
+    llm = CachedLLM(model, model="fake", temperature=0.3, cache=store, mode="cache")
+    schema = {"type": "object", "required": ["test_cases"]}
+
+    plain = llm.invoke("Generate test cases")
+    structured = llm.invoke("Generate test cases", response_schema=schema)
+    llm.invoke("Generate test cases", response_schema=schema)
+
+    assert model.invocations == 2
+    assert structured.content != plain.content
+    assert llm.is_cached("Generate test cases", response_schema=schema)
+    assert not llm.is_cached("Generate test cases", response_schema={"type": "array"})
+
+
+def test_structured_output_checks_and_evicts_the_key_it_invokes_with(store):
+    from app.LLM.structured_output import TEST_CASE_BATCH
+
+    llm = CachedLLM(CountingModel(), model="fake", temperature=0.3, cache=store, mode="cache")
+    prompt = f"Generate test cases\n\n{TEST_CASE_BATCH.instructions()}"
+
+    TEST_CASE_BATCH.invoke(llm, prompt)
+
+    assert TEST_CASE_BATCH.is_cached(llm, prompt)
+    assert not llm.is_cached(prompt)
+    TEST_CASE_BATCH.evict_cached(llm, prompt)
+    assert not TEST_CASE_BATCH.is_cached(llm, prompt)
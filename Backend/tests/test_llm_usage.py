@@ -0,0 +1,81 @@
+import json
+import uuid
+
+import psycopg2.extras
+
+from app.config import Config
+from app.LLM import impact_analyzer
+from app.models import postgress_writer
+from app.models.llm_usage import record_llm_usage
+from app.models.postgress_writer import get_run_id_by_story_id, insert_test_case
+from app.utils import metrics
+from app.utils.fake_models import FakeChatModel
+
+SUITE = {"test_cases": [{"id": "US-1-TC1", "title": "Login works", "steps": ["Step 1: Log in"], "expected_result": "Home page", "priority": "High"}]}
+
+
+def _usage_rows():
+    conn = Config.get_postgres_connection()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+            cur.execute("SELECT purpose, story_id, CAST(run_id AS TEXT) AS run_id FROM llm_usage ORDER BY called_on")
+            return [dict(row) for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def _execute(sql):
+    conn = Config.get_postgres_connection()
+    try:
+        with conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+    finally:
+        conn.close()
+
+
+def test_calls_made_before_the_suite_is_stored_are_linked_to_its_run(postgres, monkeypatch):
+    monkeypatch.setattr(postgress_writer, "LLM_USAGE_TRACKING", True)
+    record_llm_usage("generation", "fake", story_id="US-1")
+    record_llm_usage("generation", "fake", story_id="US-2")
+
+    assert insert_test_case("US-1", "Login", SUITE)
+
+    run_id = get_run_id_by_story_id("US-1")
+    assert run_id
+    assert _usage_rows() == [
+        {"purpose": "generation", "story_id": "US-1", "run_id": run_id},
+        {"purpose": "generation", "story_id": "US-2", "run_id": None}
+    ]
+
+
+def test_no_relink_when_usage_tracking_is_off(postgres, monkeypatch):
+    monkeypatch.setattr(postgress_writer, "LLM_USAGE_TRACKING", False)
+    record_llm_usage("generation", "fake", story_id="US-1")
+
+    assert insert_test_case("US-1", "Login", SUITE)
+
+    assert _usage_rows() == [{"purpose": "generation", "story_id": "US-1", "run_id": None}]
+
+
+def test_a_failing_relink_does_not_lose_the_suite(postgres, monkeypatch):
+    monkeypatch.setattr(postgress_writer, "LLM_USAGE_TRACKING", True)
+    _execute("ALTER TABLE llm_usage RENAME TO llm_usage_moved")
+    try:
+        assert insert_test_case("US-1", "Login", SUITE)
+    finally:
+        _execute("ALTER TABLE llm_usage_moved RENAME TO llm_usage")
+
+    assert get_run_id_by_story_id("US-1")
+    assert postgress_writer.get_test_case_json_by_story_id("US-1") == SUITE
+
+
+def test_impact_calls_are_recorded_against_the_explicit_run(postgres, monkeypatch):
+    monkeypatch.setattr(metrics, "LLM_USAGE_TRACKING", True)
+    # No suite is stored for US-1, so only the explicit run_id can fill the column
+    run_id = str(uuid.uuid4())
+    prompt = f"Story US-1\nORIGINAL TEST CASES:\n{json.dumps(SUITE)}"
+
+    impact_analyzer.get_llm_analysis(prompt, FakeChatModel(seed=1), "P1", "US-1", {"count": 0}, run_id)
+
+    assert _usage_rows() == [{"purpose": "impact", "story_id": "US-1", "run_id": run_id}]
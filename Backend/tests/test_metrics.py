@@ -0,0 +1,70 @@
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from app.datapipeline import embedding_generator
+from app.models.postgress_writer import get_run_id_by_story_id, get_test_case_jsons_by_story_ids
+from app.utils.metrics import track_llm
+
+
+class SlowBucket:
+    """A rate limiter that always makes the caller wait"""
+
+    name = "summary"
+
+    def __init__(self, wait):
+        self.wait = wait
+
+    def acquire(self, tokens=1.0):
+        time.sleep(self.wait)
+        return self.wait
+
+
+def _sample(name, labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_rate_limit_wait_is_recorded_apart_from_the_llm_call(monkeypatch):
+    monkeypatch.setattr(embedding_generator, "get_bucket", lambda name: SlowBucket(0.3))
+    llm_labels = {"purpose": "summary", "project": "metrics-test", "outcome": "success"}
+    wait_labels = {"bucket": "summary", "project": "metrics-test"}
+    llm_before = _sample("tcg_llm_call_duration_seconds_sum", llm_labels)
+    wait_before = _sample("tcg_rate_limit_wait_seconds_sum", wait_labels)
+
+    embedding_generator.summarize_in_chunks("As a user I want to log in", project_id="metrics-test")
+
+    assert _sample("tcg_rate_limit_wait_seconds_sum", wait_labels) - wait_before == pytest.approx(0.3)
+    assert _sample("tcg_llm_call_duration_seconds_sum", llm_labels) - llm_before < 0.3
+
+
+def test_llm_call_outcome_labels():
+    labels = {"purpose": "rag", "project": "metrics-test"}
+    before = {
+        outcome: _sample("tcg_llm_call_duration_seconds_count", {**labels, "outcome": outcome})
+        for outcome in ("cache_hit", "error")
+    }
+
+    with track_llm("rag", "metrics-test") as call:
+        call["outcome"] = "cache_hit"
+    with pytest.raises(RuntimeError):
+        with track_llm("rag", "metrics-test"):
+            raise RuntimeError("model unavailable")
+
+    for outcome in ("cache_hit", "error"):
+        assert _sample("tcg_llm_call_duration_seconds_count", {**labels, "outcome": outcome}) == before[outcome] + 1
+
+
+def test_suite_lookups_are_timed_under_their_own_query_names(postgres):
+    def counts():
+        return {
+            query: _sample("tcg_postgres_query_duration_seconds_count", {"query": query, "project": "", "outcome": "success"})
+            for query in ("get_run_id", "get_test_case_jsons")
+        }
+
+    before = counts()
+    get_run_id_by_story_id("US-1")
+    assert counts() == {"get_run_id": before["get_run_id"] + 1, "get_test_case_jsons": before["get_test_case_jsons"]}
+
+    get_test_case_jsons_by_story_ids(["US-1", "US-2"])
+    assert counts() == {"get_run_id": before["get_run_id"] + 1, "get_test_case_jsons": before["get_test_case_jsons"] + 1}
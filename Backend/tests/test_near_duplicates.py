@@ -0,0 +1,64 @@
+import math
+
+import numpy as np
+
+from app.datapipeline import test_case_embeddings
+from app.datapipeline.test_case_embeddings import drop_near_duplicates
+from app.LLM import Test_case_generator
+
+
+def _case(n, title, steps=None):
+    return {"id": f"US-1-TC{n}", "title": title, "steps": steps or [f"Step 1: {title}"], "expected_result": "Works", "priority": "High"}
+
+
+def _unit(angle):
+    """A 2-d unit vector; the cosine similarity of two of them is cos(angle difference)"""
+    return [math.cos(angle), math.sin(angle)]
+
+
+def _with_vectors(monkeypatch, vectors):
+    monkeypatch.setattr(test_case_embeddings, "_encode", lambda test_cases, project_id="": np.asarray(vectors, dtype=np.float64))
+
+
+def test_similarity_above_the_threshold_is_dropped_and_at_it_is_kept(monkeypatch):
+    cases = [_case(1, "a"), _case(2, "b"), _case(3, "c")]
+    # Case 2 sits at similarity 0.95 to case 1, case 3 at exactly 0.90
+    _with_vectors(monkeypatch, [_unit(0), _unit(math.acos(0.95)), _unit(-math.acos(0.90))])
+
+    assert drop_near_duplicates(cases, threshold=0.92) == [cases[0], cases[2]]
+    assert drop_near_duplicates(cases, threshold=0.96) == cases
+    assert drop_near_duplicates(cases, threshold=0.90) == [cases[0], cases[2]]
+
+
+def test_first_of_a_group_survives_and_is_compared_only_against_kept_cases(monkeypatch):
+    cases = [_case(1, "a"), _case(2, "b"), _case(3, "c")]
+    # 1~2 and 2~3 are near duplicates, but 1 and 3 are far enough apart to both stay
+    _with_vectors(monkeypatch, [_unit(0), _unit(0.3), _unit(0.6)])
+
+    assert drop_near_duplicates(cases, threshold=math.cos(0.4)) == [cases[0], cases[2]]
+
+
+def test_identical_texts_are_dropped_with_the_real_embedding_path():
+    cases = [
+        _case(1, "Verify login with valid credentials"),
+        _case(2, "Verify login with valid credentials"),
+        _case(3, "Export the monthly report as a PDF file", ["Step 1: Open reports", "Step 2: Export as PDF"])
+    ]
+
+    assert drop_near_duplicates(cases, threshold=0.92) == [cases[0], cases[2]]
+
+
+def test_generator_renumbers_the_kept_test_cases():
+    cases = [
+        _case(1, "Verify login with valid credentials"),
+        _case(2, "Verify login with valid credentials"),
+        _case(3, "Export the monthly report as a PDF file", ["Step 1: Open reports", "Step 2: Export as PDF"])
+    ]
+
+    dropped = Test_case_generator.TestCaseGenerator(project_id="P1").drop_duplicates("US-1", cases)
+
+    assert dropped == 1
+    assert [(case["id"], case["title"]) for case in cases] == [
+        ("US-1-TC1", "Verify login with valid credentials"),
+        ("US-1-TC2", "Export the monthly report as a PDF file")
+    ]
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.utils.rate_limiter import CappedBucket, TokenBucket, get_bucket
+
+
+def test_bucket_allows_burst_up_to_capacity_then_waits(tmp_path):
+    bucket = TokenBucket("burst", rate_per_minute=60, capacity=3, state_dir=str(tmp_path))
+
+    assert [bucket._take(1) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # One token per second refill: the fourth call waits about a second
+    assert bucket._take(1) == pytest.approx(1.0, abs=0.05)
+
+
+def test_buckets_with_the_same_state_file_share_one_budget(tmp_path):
+    app_bucket = TokenBucket("shared", rate_per_minute=60, capacity=2, state_dir=str(tmp_path))
+    worker_bucket = TokenBucket("shared", rate_per_minute=60, capacity=2, state_dir=str(tmp_path))
+
+    assert app_bucket._take(1) == 0.0
+    assert worker_bucket._take(1) == 0.0
+    assert app_bucket._take(1) > 0
+
+
+def test_acquire_sleeps_until_a_token_refills(tmp_path):
+    bucket = TokenBucket("refill", rate_per_minute=6000, capacity=1, state_dir=str(tmp_path))
+
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.01, abs=0.005)
+    assert asyncio.run(bucket.acquire_async()) == pytest.approx(0.01, abs=0.005)
+
+
+def test_purposes_draw_from_one_shared_quota(tmp_path):
+    shared = TokenBucket("gemini", rate_per_minute=60, capacity=2, state_dir=str(tmp_path))
+    generation = CappedBucket(TokenBucket("generation", 60, capacity=5, state_dir=str(tmp_path)), shared)
+    impact = CappedBucket(TokenBucket("impact", 60, capacity=5, state_dir=str(tmp_path)), shared)
+
+    generation.acquire()
+    impact.acquire()
+
+    # Both purposes still have cap tokens, but the account quota is spent
+    assert generation.cap._take(0) == 0.0
+    assert shared._take(1) > 0
+
+
+def test_idle_purposes_leave_the_whole_quota_to_the_busy_one(tmp_path):
+    shared = TokenBucket("gemini", rate_per_minute=60, capacity=4, state_dir=str(tmp_path))
+    generation = CappedBucket(TokenBucket("generation", 60, capacity=4, state_dir=str(tmp_path)), shared)
+
+    assert [generation.acquire() for _ in range(4)] == [0.0, 0.0, 0.0, 0.0]
+
+
+def test_cap_limits_a_purpose_below_the_shared_quota(tmp_path):
+    shared = TokenBucket("gemini", rate_per_minute=60, capacity=10, state_dir=str(tmp_path))
+    summary = CappedBucket(TokenBucket("summary", 60, capacity=1, state_dir=str(tmp_path)), shared)
+
+    summary.acquire()
+    assert summary.cap._take(1) > 0
+    assert shared._take(1) == 0.0
+
+
+def test_llm_purposes_share_the_gemini_bucket():
+    generation = get_bucket("generation")
+    impact = get_bucket("impact")
+
+    assert isinstance(generation, CappedBucket)
+    assert generation.shared is impact.shared is get_bucket("gemini")
+    assert isinstance(get_bucket("jira"), TokenBucket)
+
+
+def test_a_bucket_cannot_be_asked_for_again_with_other_limits():
+    from app.services.jira_integration_improved import JiraRateLimiter
+
+    jira = get_bucket("jira")
+
+    assert JiraRateLimiter(delay=1.0).bucket is jira
+    assert get_bucket("jira", rate_per_minute=60.0, capacity=1.0) is jira
+    with pytest.raises(ValueError):
+        JiraRateLimiter(delay=0.5)
+    with pytest.raises(ValueError):
+        get_bucket("generation", capacity=99)
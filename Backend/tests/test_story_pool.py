@@ -0,0 +1,54 @@
+import asyncio
+import threading
+import time
+
+from app.LLM import Test_case_generator
+from app.utils.fake_models import FakeChatModel
+
+
+class SlowStories:
+    """Stands in for generate_test_case_for_story with a fake model call per story"""
+
+    def __init__(self, latency_ms):
+        self.latency_ms = latency_ms
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, story_id, row=None):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        try:
+            model = FakeChatModel(seed=1, latency_ms=self.latency_ms[story_id], latency_sigma=0.01)
+            return model.invoke(f"Generate test cases for {story_id}")
+        finally:
+            with self._lock:
+                self.running -= 1
+
+
+def _run(monkeypatch, latency_ms, concurrency, timeout):
+    stories = SlowStories(latency_ms)
+    monkeypatch.setattr(Test_case_generator, "generate_test_case_for_story", stories)
+    rows = [{"storyID": story_id} for story_id in latency_ms]
+    started = time.perf_counter()
+    summary = asyncio.run(Test_case_generator._generate_stories_in_pool(rows, concurrency, timeout))
+    return summary, stories, time.perf_counter() - started
+
+
+def test_pool_never_runs_more_stories_than_its_size(monkeypatch):
+    summary, stories, _ = _run(monkeypatch, {f"US-{n}": 50 for n in range(8)}, concurrency=3, timeout=5)
+
+    assert summary["succeeded"] == 8
+    assert stories.peak == 3
+
+
+def test_timed_out_story_keeps_its_slot_and_does_not_hold_up_the_run(monkeypatch):
+    latency_ms = {"US-SLOW": 1500, "US-1": 50, "US-2": 50, "US-3": 50}
+
+    summary, stories, elapsed = _run(monkeypatch, latency_ms, concurrency=2, timeout=0.3)
+
+    assert (summary["succeeded"], summary["timed_out"]) == (3, 1)
+    # The abandoned story still occupies one of the two threads
+    assert stories.peak == 2
+    assert elapsed < 1.0
@@ -0,0 +1,58 @@
+import asyncio
+
+import lance
+import pytest
+
+from app.datapipeline.embedding_generator import add_story_to_lance
+from app.LLM import Test_case_generator
+from app.LLM.Test_case_generator import STORY_COLUMNS, get_story_row
+
+
+@pytest.fixture(scope="module")
+def stories():
+    from app.models.create_dbs import create_LanceDB
+
+    create_LanceDB()
+    add_story_to_lance("P-SCAN", "SCAN-1", "Login", "As a user I want to log in", [0.1] * 768, "SCAN-1.txt", None, "file")
+    add_story_to_lance("P-SCAN", "SCAN-2", "Logout", "As a user I want to log out", [0.1] * 768, "SCAN-2.txt", None, "file")
+    return ["SCAN-1", "SCAN-2"]
+
+
+def _scanned_columns(monkeypatch):
+    columns = []
+    to_table = lance.LanceDataset.to_table
+
+    def recorded(self, *args, **kwargs):
+        columns.append(kwargs.get("columns"))
+        return to_table(self, *args, **kwargs)
+
+    monkeypatch.setattr(lance.LanceDataset, "to_table", recorded)
+    return columns
+
+
+def test_batch_run_reads_only_the_story_columns_in_one_scan(stories, monkeypatch):
+    pending = []
+
+    async def pool(records, max_concurrent_stories, story_timeout):
+        pending.extend(records)
+        return {}
+
+    monkeypatch.setattr(Test_case_generator, "get_all_generated_story_ids", lambda: ["SCAN-2"])
+    monkeypatch.setattr(Test_case_generator, "_generate_stories_in_pool", pool)
+    columns = _scanned_columns(monkeypatch)
+
+    asyncio.run(Test_case_generator._generate_test_cases_for_all_stories())
+
+    assert columns == [STORY_COLUMNS + ["vector"]]
+    assert all(list(row) == STORY_COLUMNS for row in pending)
+    scanned = {row["storyID"]: row for row in pending}
+    assert "SCAN-2" not in scanned
+    assert scanned["SCAN-1"] == {"storyID": "SCAN-1", "project_id": "P-SCAN", "storyDescription": "Login", "doc_content_text": "As a user I want to log in"}
+
+
+def test_single_story_lookup_is_filtered_and_projected(stories, monkeypatch):
+    columns = _scanned_columns(monkeypatch)
+
+    assert get_story_row("SCAN-2")["doc_content_text"] == "As a user I want to log out"
+    assert get_story_row("SCAN-MISSING") is None
+    assert columns == [STORY_COLUMNS, STORY_COLUMNS]
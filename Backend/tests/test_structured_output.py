@@ -0,0 +1,101 @@
+import json
+
+import pytest
+
+from app.LLM.structured_output import IMPACT_VERDICT, TEST_CASE_BATCH, SchemaViolation, StructuredOutput, compile_schema
+from app.utils.fake_models import FakeChatModel
+
+MODIFIED = {"id": "US-1-TC1", "title": "Login with SSO", "steps": ["Step 1: Log in"], "expected_result": "Home page", "priority": "High"}
+VERDICT = {
+    "has_impact": True,
+    "impact_type": "MODIFY",
+    "impacted_test_cases": [{
+        "original_test_case_id": "US-1-TC1",
+        "modification_reason": "Login now goes through SSO",
+        "impact_severity": "high",
+        "severity_reason": "The main login flow changes",
+        "modified_test_case": MODIFIED
+    }]
+}
+
+
+def test_conforming_response_is_parsed():
+    assert IMPACT_VERDICT.parse(json.dumps(VERDICT)) == VERDICT
+
+
+def test_non_conforming_response_is_rejected_by_the_compiled_validator():
+    verdict = json.loads(json.dumps(VERDICT))
+    impact = verdict["impacted_test_cases"][0]
+    impact["impact_severity"] = "critical"
+    del impact["severity_reason"]
+    impact["modified_test_case"]["steps"] = []
+
+    with pytest.raises(SchemaViolation) as raised:
+        IMPACT_VERDICT.parse(json.dumps(verdict))
+
+    assert sorted(raised.value.errors) == [
+        "$.impacted_test_cases[].impact_severity must be one of ['high', 'medium', 'low']",
+        "$.impacted_test_cases[].modified_test_case.steps needs at least 1 items",
+        "$.impacted_test_cases[].severity_reason is required"
+    ]
+
+
+def test_wrong_types_and_booleans_are_rejected():
+    validate = compile_schema({"type": "object", "properties": {"count": {"type": "integer"}, "flag": {"type": "boolean"}}})
+
+    assert validate({"count": 3, "flag": False}) == []
+    assert validate({"count": True, "flag": "yes"}) == ["$.count must be integer", "$.flag must be boolean"]
+    assert validate([]) == ["$ must be object"]
+
+
+def test_text_that_is_not_json_is_a_violation():
+    with pytest.raises(SchemaViolation):
+        TEST_CASE_BATCH.parse("Sorry, I cannot help with that")
+
+
+def test_invalid_responses_count_towards_the_retry_rate():
+    output = StructuredOutput("counted", {"type": "object", "required": ["ok"]})
+
+    output.parse('{"ok": 1}')
+    with pytest.raises(SchemaViolation):
+        output.parse('{"nope": 1}')
+
+    assert output.stats() == {"attempts": 2, "invalid": 1, "retry_rate": 0.5}
+
+
+class PromptOnlyModel:
+    """A client without native response schema support"""
+
+    def __init__(self, content):
+        self.content = content
+        self.calls = []
+
+    def invoke(self, prompt, **kwargs):
+        self.calls.append((prompt, kwargs))
+        return type("Message", (), {"content": self.content})()
+
+
+def test_clients_without_native_schemas_get_the_schema_in_the_prompt_only():
+    model = PromptOnlyModel("```json\n" + json.dumps(VERDICT) + "\n```")
+    prompt = f"Compare the stories.\n\n{IMPACT_VERDICT.instructions()}"
+
+    response = IMPACT_VERDICT.invoke(model, prompt)
+
+    [(sent_prompt, kwargs)] = model.calls
+    assert kwargs == {}
+    assert '"impact_severity"' in sent_prompt and '"severity_reason"' in sent_prompt
+    assert IMPACT_VERDICT.parse(response.content) == VERDICT
+
+
+def test_native_schema_clients_emit_severity():
+    original = json.dumps({"test_cases": [MODIFIED]})
+    model = FakeChatModel(seed=7)
+
+    verdicts = [
+        IMPACT_VERDICT.parse(IMPACT_VERDICT.invoke(model, f"Story {i}\nORIGINAL TEST CASES:\n{original}").content)
+        for i in range(20)
+    ]
+    impacts = [impact for verdict in verdicts for impact in verdict["impacted_test_cases"]]
+
+    assert impacts
+    assert all(impact["impact_severity"] in ("high", "medium", "low") and impact["severity_reason"] for impact in impacts)
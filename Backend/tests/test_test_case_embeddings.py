@@ -0,0 +1,46 @@
+import numpy as np
+
+from app.datapipeline import test_case_embeddings
+from app.datapipeline.test_case_embeddings import get_test_case_vectors, store_test_case_embeddings
+
+
+def _case(n, title):
+    return {"id": f"US-1-TC{n}", "title": title, "steps": [f"Step 1: {title}"], "expected_result": "Works", "priority": "High"}
+
+
+def _counting_encoder(monkeypatch):
+    calls = []
+    encode = test_case_embeddings._encode
+
+    def counted(test_cases, project_id=""):
+        calls.append([tc["id"] for tc in test_cases])
+        return encode(test_cases, project_id)
+
+    monkeypatch.setattr(test_case_embeddings, "_encode", counted)
+    return calls
+
+
+def test_unchanged_suite_reuses_the_stored_vectors(monkeypatch):
+    suite = [_case(1, "Log in"), _case(2, "Log out")]
+    stored = store_test_case_embeddings("US-EMB-1", "P1", suite)
+    calls = _counting_encoder(monkeypatch)
+
+    vectors = get_test_case_vectors("US-EMB-1", suite, "P1")
+
+    assert calls == []
+    assert all(np.array_equal(vectors[tc["id"]], stored[tc["id"]]) for tc in suite)
+
+
+def test_regenerated_suite_with_the_same_ids_is_embedded_again(monkeypatch):
+    store_test_case_embeddings("US-EMB-2", "P1", [_case(1, "Log in"), _case(2, "Log out")])
+    regenerated = [_case(1, "Export a report"), _case(2, "Log out")]
+    expected = test_case_embeddings._encode(regenerated)
+    calls = _counting_encoder(monkeypatch)
+
+    vectors = get_test_case_vectors("US-EMB-2", regenerated, "P1")
+
+    assert calls == [["US-1-TC1", "US-1-TC2"]]
+    assert np.allclose(vectors["US-1-TC1"], expected[0])
+    # The refreshed rows are served from the table next time
+    get_test_case_vectors("US-EMB-2", regenerated, "P1")
+    assert len(calls) == 1
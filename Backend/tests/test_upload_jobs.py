@@ -0,0 +1,179 @@
+import io
+import json
+
+import psycopg2.errors
+import pytest
+
+from app.datapipeline.embedding_generator import add_story_to_lance
+from app.services import story_upload, upload_executor
+from app.services.job_queue import expire_inprocess_jobs, get_job, start_inprocess_job
+from app.services.story_upload import UploadError, process_story_upload
+
+
+def test_expired_upload_is_failed_and_no_longer_blocks_the_story(postgres):
+    stale = start_inprocess_job("upload", {}, "dead-process", story_id="US-1", project_id="P1", visibility_timeout=0)
+    live = start_inprocess_job("upload", {}, "live-process", story_id="US-2", project_id="P1")
+
+    assert expire_inprocess_jobs() == 1
+
+    assert get_job(stale)["status"] == "failed"
+    assert get_job(live)["status"] == "running"
+    # The pending-job index accepts a new upload of the story
+    assert start_inprocess_job("upload", {}, "live-process", story_id="US-1", project_id="P1")
+
+
+def test_running_upload_blocks_a_second_upload_of_the_story(postgres):
+    start_inprocess_job("upload", {}, "live-process", story_id="US-1", project_id="P1")
+
+    with pytest.raises(psycopg2.errors.UniqueViolation):
+        start_inprocess_job("upload", {}, "live-process", story_id="US-1", project_id="P1")
+
+
+class _NoStories:
+    def get_story(self, story_id):
+        return None
+
+
+@pytest.fixture
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(story_upload, "STAGING_FOLDER", str(tmp_path / "staging"))
+    return tmp_path / "staging"
+
+
+@pytest.fixture
+def client(postgres, staging, monkeypatch):
+    from app import create_app
+    from app.routes import stories
+
+    monkeypatch.setattr(stories, "get_db_service", lambda: _NoStories())
+    monkeypatch.setattr(stories.Config, "USE_JOB_QUEUE", False)
+    return create_app().test_client()
+
+
+def _upload(client):
+    return client.post("/api/stories/upload", data={"project_id": "P1", "story_id": "US-1", "content": "As a user I want to log in"})
+
+
+def _upload_file(client, text):
+    return client.post("/api/stories/upload", data={
+        "project_id": "P1",
+        "story_id": "US-1",
+        "file": (io.BytesIO(text.encode()), "story.txt")
+    }, content_type="multipart/form-data")
+
+
+def _staged_files(staging):
+    return sorted(path.read_text() for path in staging.rglob("*.txt"))
+
+
+def test_upload_of_a_story_already_being_processed_is_a_conflict(client, monkeypatch):
+    def pending(upload):
+        raise psycopg2.errors.UniqueViolation("duplicate key value violates unique constraint")
+
+    monkeypatch.setattr(upload_executor, "submit_story_upload", pending)
+
+    assert _upload(client).status_code == 409
+
+
+def test_other_integrity_errors_are_not_reported_as_conflicts(client, monkeypatch):
+    def broken(upload):
+        raise psycopg2.errors.NotNullViolation("null value in column")
+
+    monkeypatch.setattr(upload_executor, "submit_story_upload", broken)
+
+    assert _upload(client).status_code == 500
+
+
+def test_duplicate_of_a_running_upload_is_rejected_before_its_file_is_saved(client, staging, monkeypatch):
+    monkeypatch.setattr(upload_executor, "_executor", type("Idle", (), {"submit": lambda self, *args: None})())
+
+    assert _upload_file(client, "First version").status_code == 202
+    assert _upload_file(client, "Second version").status_code == 409
+
+    assert _staged_files(staging) == ["First version"]
+
+
+def test_a_rejected_upload_removes_only_its_own_staged_file(client, staging, monkeypatch):
+    def pending(upload):
+        raise psycopg2.errors.UniqueViolation("duplicate key value violates unique constraint")
+
+    in_flight = staging / "P1" / "in-flight" / "US-1.txt"
+    in_flight.parent.mkdir(parents=True)
+    in_flight.write_text("First version")
+    monkeypatch.setattr(upload_executor, "submit_story_upload", pending)
+
+    assert _upload_file(client, "Second version").status_code == 409
+
+    assert _staged_files(staging) == ["First version"]
+    assert sorted(path.name for path in (staging / "P1").iterdir()) == ["in-flight"]
+
+
+def test_pipeline_skips_a_story_that_is_already_stored(staging, tmp_path, monkeypatch):
+    from app.models.create_dbs import create_LanceDB
+
+    create_LanceDB()
+    story_id = "US-STORED"
+    add_story_to_lance("P1", story_id, "Login", "As a user I want to log in", [0.0] * 768, f"{story_id}.txt", None, "file")
+    monkeypatch.setattr(story_upload, "FAILURE_FOLDER", str(tmp_path / "failure"))
+    file_path = story_upload.staged_upload_path("P1", story_id, ".txt")
+    with open(file_path, "w") as f:
+        f.write("As a user I want to log in")
+
+    with pytest.raises(UploadError) as raised:
+        process_story_upload("P1", story_id, file_path=file_path)
+
+    assert raised.value.status_code == 409
+    assert (tmp_path / "failure" / "P1" / f"{story_id}.txt").exists()
+    assert list((staging / "P1").iterdir()) == []
+
+
+def _events(response):
+    """(event, data) pairs of a server-sent event stream"""
+    events = []
+    for chunk in response.get_data(as_text=True).split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in chunk.splitlines() if not line.startswith(":"))
+        if lines:
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def _stream(client):
+    return client.post("/api/stories/upload/stream", data={"project_id": "P1", "story_id": "US-1", "content": "As a user I want to log in"})
+
+
+def test_upload_stream_reports_progress_in_pipeline_order(client, monkeypatch):
+    from app.routes import stories
+
+    def pipeline(project_id, story_id, file_path=None, content=None, source="backend", emit=None):
+        emit("extracted", {"characters": len(content)})
+        emit("batch", {"batch": 1, "test_cases": [{"id": f"{story_id}-TC1"}]})
+        emit("generated", {"total_test_cases": 1})
+        return {"story_id": story_id, "total_test_cases": 1}
+
+    monkeypatch.setattr(stories, "process_story_upload", pipeline)
+    response = _stream(client)
+
+    assert response.mimetype == "text/event-stream"
+    assert _events(response) == [
+        ("saved", {"story_id": "US-1", "project_id": "P1"}),
+        ("extracted", {"characters": 26}),
+        ("batch", {"batch": 1, "test_cases": [{"id": "US-1-TC1"}]}),
+        ("generated", {"total_test_cases": 1}),
+        ("done", {"story_id": "US-1", "total_test_cases": 1})
+    ]
+
+
+def test_upload_stream_ends_with_an_error_event(client, monkeypatch):
+    from app.routes import stories
+
+    def pipeline(project_id, story_id, file_path=None, content=None, source="backend", emit=None):
+        emit("extracted", {"characters": len(content)})
+        raise UploadError("Summary generation failed", 502)
+
+    monkeypatch.setattr(stories, "process_story_upload", pipeline)
+
+    assert _events(_stream(client)) == [
+        ("saved", {"story_id": "US-1", "project_id": "P1"}),
+        ("extracted", {"characters": 26}),
+        ("error", {"error": "Summary generation failed", "status": 502})
+    ]
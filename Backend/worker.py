@@ -0,0 +1,53 @@
+import os
+import sys
+import signal
+import argparse
+import threading
+
+# Add the Backend directory to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.job_queue import JOB_TYPES, default_worker_id
+from app.services.pipeline_jobs import run_worker
+from app.utils.metrics import start_metrics_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Drain the test case generation job queue")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("WORKER_CONCURRENCY", "2")),
+                        help="Number of worker threads in this process")
+    parser.add_argument("--job-types", nargs="+", choices=JOB_TYPES, default=list(JOB_TYPES),
+                        help="Only claim these job types")
+    args = parser.parse_args()
+
+    stop_event = threading.Event()
+
+    def shutdown(signum, frame):
+        print("🛑 [Worker] Shutting down after current jobs finish...")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    start_metrics_server()
+    print(f"🚀 [Worker] Starting {args.concurrency} worker threads...")
+    threads = [
+        threading.Thread(
+            target=run_worker,
+            kwargs={
+                "worker_id": f"{default_worker_id()}:{i}",
+                "job_types": args.job_types,
+                "stop_event": stop_event
+            }
+        )
+        for i in range(args.concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    while any(thread.is_alive() for thread in threads):
+        for thread in threads:
+            thread.join(timeout=1)
+
+
+if __name__ == "__main__":
+    main()